@@ -147,11 +147,14 @@ MIDDLEWARE = [
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "custom_usermodel.middleware.CachedUserAuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "axes.middleware.AxesMiddleware",
     "main.middleware.IpRestrictionMiddleware",
+    "main.middleware.RequestDeadlineMiddleware",
+    "main.middleware.UserLookupMemoMiddleware",
+    "main.middleware.WizardStateMiddleware",
     "authbroker_client.middleware.ProtectAllViewsMiddleware",
     "django_audit_log_middleware.AuditLogMiddleware",
 ]
@@ -162,21 +165,67 @@ AUTHENTICATION_BACKENDS = [
     "axes.backends.AxesBackend",
 ]
 
+# how long the logged in user is cached for, with their permissions, in seconds.
+# it is forgotten when it or its permissions change, but only by the cache of the
+# process that changed it, unless CACHES is shared
+USER_CACHE_TIMEOUT = 60
+
 AXES_LOGIN_FAILURE_LIMIT = 5
 
 MESSAGE_STORAGE = "django.contrib.messages.storage.session.SessionStorage"
 
 # we need to store dates in the session, which the default json serializer
 # doesn't support
-SESSION_SERIALIZER = "django.contrib.sessions.serializers.PickleSerializer"
+SESSION_SERIALIZER = "main.serializers.JSONSerializer"
+
+# the booking and PRA flows keep their state in a signed cookie of at most this
+# many characters, or in the session if it doesn't fit (see main.wizard)
+WIZARD_STATE_MAX_COOKIE_SIZE = 3500
 
 AUTHBROKER_ANONYMOUS_PATHS = [
     "/pingdom/ping.xml",
     "/activity-stream/bookings",
     "/activity-stream/pras",
+    "/activity-stream/booking-changes",
+    "/activity-stream/pra-changes",
+    "/activity-stream/bookings-export",
+    "/activity-stream/pras-export",
 ]
 
 GOVUK_NOTIFY_API_KEY = env("GOVUK_NOTIFY_API_KEY")
+# the Notify client is shared by all threads of a process and keeps up to
+# NOTIFY_POOL_SIZE connections alive. timeouts are in seconds
+NOTIFY_POOL_SIZE = 10
+NOTIFY_CONNECT_TIMEOUT = env.float("NOTIFY_CONNECT_TIMEOUT", default=5)
+NOTIFY_READ_TIMEOUT = env.float("NOTIFY_READ_TIMEOUT", default=10)
+
+# circuit breakers around outbound calls: a breaker opens after failure_threshold
+# consecutive failures, and lets one probe call through after reset_timeout seconds
+CIRCUIT_BREAKERS = {
+    "notify": {"failure_threshold": 5, "reset_timeout": 30},
+    "staff_sso": {"failure_threshold": 5, "reset_timeout": 30},
+}
+# total time budget for outbound calls made while handling a request, in seconds.
+# this needs to be well below gunicorn's --timeout
+REQUEST_DEADLINE = env.float("REQUEST_DEADLINE", default=15)
+STAFF_SSO_PROFILE_TIMEOUT = env.float("STAFF_SSO_PROFILE_TIMEOUT", default=5)
+# number of connections to staff-sso each process keeps alive
+STAFF_SSO_POOL_SIZE = 10
+# how long staff-sso profiles are cached per access token, in seconds
+STAFF_SSO_PROFILE_CACHE_TIMEOUT = 3 * 60
+
+# notification outbox worker (manage.py send_notifications)
+NOTIFY_OUTBOX_CONCURRENCY = env.int("NOTIFY_OUTBOX_CONCURRENCY", default=4)
+NOTIFY_OUTBOX_BATCH_SIZE = 50
+# how long to wait between polls when there is nothing to send, in seconds
+NOTIFY_OUTBOX_POLL_INTERVAL = 5
+# how long a claimed batch is reserved for one worker, in seconds
+NOTIFY_OUTBOX_LEASE = 300
+# failed sends are retried with exponential backoff, starting at
+# NOTIFY_OUTBOX_RETRY_DELAY seconds and capped at NOTIFY_OUTBOX_MAX_RETRY_DELAY
+NOTIFY_OUTBOX_MAX_ATTEMPTS = 10
+NOTIFY_OUTBOX_RETRY_DELAY = 30
+NOTIFY_OUTBOX_MAX_RETRY_DELAY = 3600
 
 # IP filtering
 IP_RESTRICT = env.bool("IP_RESTRICT", default=True)
@@ -186,12 +235,48 @@ ALLOWED_IP_RANGES = env.list("ALLOWED_IP_RANGES", default=[])
 IP_SAFELIST_XFF_INDEX = env.int("IP_SAFELIST_XFF_INDEX", default=-3)
 
 ACTIVITY_STREAM_ITEMS_PER_PAGE = 50
+# how long complete activity stream pages are cached for, in seconds
+ACTIVITY_STREAM_PAGE_CACHE_TIMEOUT = 60 * 60
+# how many rows the bulk exports fetch from the database at a time
+ACTIVITY_STREAM_EXPORT_CHUNK_SIZE = 2000
 ACTIVITY_STREAM_HAWK_CREDENTIALS = {
     "id": env("ACTIVITY_STREAM_HAWK_ID"),
     "key": env("ACTIVITY_STREAM_HAWK_SECRET"),
     "algorithm": "sha256",
 }
 
+# how many rows the admin's CSV exports fetch from the database at a time
+CSV_EXPORT_CHUNK_SIZE = 2000
+
+# queued exports are written to the database by run_export_jobs, so that every
+# instance can serve them, in chunks of this many bytes
+EXPORT_FILE_CHUNK_SIZE = 1024 * 1024
+# how often run_export_jobs checks for queued exports, in seconds
+EXPORT_JOB_POLL_INTERVAL = 5
+# how long a running export can go without progress before another worker
+# restarts it, in seconds
+EXPORT_JOB_TIMEOUT = 10 * 60
+# how long finished exports are kept for, in days
+EXPORT_JOB_KEEP_DAYS = 7
+
+# maximum number of days that can be booked at once with a repeating booking
+BOOKING_MAX_DATES = 30
+# maximum number of people that can be booked for at once with a team booking
+BOOKING_MAX_TEAM_SIZE = 30
+
+# desk availability calendar: how many days to show by default and at most
+AVAILABILITY_DEFAULT_DAYS = 14
+AVAILABILITY_MAX_DAYS = 60
+# how long computed availability is cached for, in seconds
+AVAILABILITY_CACHE_TIMEOUT = 30
+# how long requests wait for someone else computing the same availability before
+# doing it themselves, in seconds
+AVAILABILITY_LOCK_TIMEOUT = 5
+
+# how often each process checks that its copy of the buildings, floors and DIT
+# groups is up to date, in seconds
+REFERENCE_DATA_CHECK_INTERVAL = 5
+
 # whether to allow the "staff member" and "SCS" fields in the PRA form be the same
 PRA_ALLOW_STAFF_MEMBER_TO_BE_SCS = False
 
@@ -11,6 +11,10 @@ AUTHENTICATION_BACKENDS += [
     "custom_usermodel.backends.CustomAuthbrokerBackend",
 ]
 
+# the database is rolled back after each test, but the copy of the reference data
+# isn't, so always check it
+REFERENCE_DATA_CHECK_INTERVAL = 0
+
 STATICFILES_DIRS = (os.path.join(BASE_DIR, "node_modules/govuk-frontend"),)
 
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class UsersConfig(AppConfig):
     name = "custom_usermodel"
+
+    def ready(self):
+        from . import signals  # noqa: F401
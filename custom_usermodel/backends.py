@@ -1,22 +1,114 @@
+import hashlib
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
 
 from authbroker_client.backends import AuthbrokerBackend
-from authbroker_client.utils import get_client, has_valid_token, get_profile
+from authbroker_client.utils import PROFILE_URL, get_client, has_valid_token
+
+from main.circuit_breaker import CircuitOpenError, DeadlineExceeded, get_breaker, get_timeout
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+_adapter = None
+_adapter_lock = threading.Lock()
+
+
+def get_adapter() -> HTTPAdapter:
+    """Get the process-wide connection pool for staff-sso, so that logins don't each
+    do a new TLS handshake."""
+
+    global _adapter
+
+    if _adapter is None:
+        with _adapter_lock:
+            if _adapter is None:
+                _adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=settings.STAFF_SSO_POOL_SIZE
+                )
+
+    return _adapter
+
+
+def _is_failure(e: Exception) -> bool:
+    # 4xx are about the token, not staff-sso being unhealthy
+    return not (isinstance(e, requests.HTTPError) and e.response.status_code < 500)
+
 
 class CustomAuthbrokerBackend(AuthbrokerBackend):
     def authenticate(self, request, **kwargs):
         client = get_client(request)
         if has_valid_token(client):
-            profile = get_profile(client)
+            try:
+                profile = self.get_profile(client)
+            except (CircuitOpenError, DeadlineExceeded) as e:
+                logger.warning("Not fetching staff-sso profile: %s", e)
+                return None
+            except Exception:
+                logger.exception("Fetching staff-sso profile failed")
+                return None
+
             return self.get_or_create_user(profile)
         return None
 
     @staticmethod
-    def get_or_create_user(profile):
+    def get_profile(client):
+        """Same as authbroker_client.utils.get_profile, but with a timeout and behind
+        a circuit breaker, so a slow staff-sso can't tie up all our workers.
+
+        Profiles are cached per access token for STAFF_SSO_PROFILE_CACHE_TIMEOUT
+        seconds, as users often authenticate several times in a row (e.g. in
+        several tabs).
+        """
+
+        key = f"staff-sso-profile:{hashlib.sha256(client.access_token.encode()).hexdigest()}"
+
+        profile = cache.get(key)
+
+        if profile is not None:
+            return profile
+
+        client.mount("https://", get_adapter())
+        client.mount("http://", get_adapter())
+
+        def fetch():
+            response = client.get(
+                PROFILE_URL, timeout=get_timeout(settings.STAFF_SSO_PROFILE_TIMEOUT)
+            )
+            response.raise_for_status()
+
+            return response.json()
+
+        start = time.monotonic()
+
+        try:
+            profile = get_breaker("staff_sso").call(fetch, is_failure=_is_failure)
+        finally:
+            latency = time.monotonic() - start
+
+            logger.info(
+                "staff-sso profile request took %.3fs",
+                latency,
+                extra={"staff_sso_profile_latency": latency},
+            )
+
+        cache.set(key, profile, timeout=settings.STAFF_SSO_PROFILE_CACHE_TIMEOUT)
+
+        return profile
+
+    @staticmethod
+    def get_or_create_user(profile, retry=True):
         # example values:
         #
         # {'email': 'jane.doe@digital.trade.gov.uk',  /PS-IGNORE
@@ -26,59 +118,80 @@ class CustomAuthbrokerBackend(AuthbrokerBackend):
         # these are guaranteed to always be present
         assert profile["email_user_id"]
         assert profile["email"]
-        query = (
-            Q(username=profile["email_user_id"])
-            | Q(email=profile["email"])
-            | Q(contact_email=profile["email"])
-        )
 
         # ...whereas this is not
-        if profile["contact_email"]:
-            query |= Q(contact_email=profile["contact_email"])
-
-        users = User.objects.filter(query)
+        emails = {profile["email"].lower(), (profile["contact_email"] or "").lower()} - {""}
+
+        # one query per index (username, lower(email), lower(contact_email)), so each
+        # can use it, instead of an OR across all of them
+        users = list(
+            User.objects.filter(username=profile["email_user_id"]).union(
+                User.objects.alias(email_lower=Lower("email")).filter(email_lower__in=emails),
+                User.objects.alias(contact_email_lower=Lower("contact_email")).filter(
+                    contact_email_lower__in=emails
+                ),
+            )
+        )
 
         # Duplicate user records might be present, as a user data set was added manually,
         # so check for matching users who have never logged in and delete them from the system
-        if users.count() > 1:
-            for user in users:
-                if user.last_login is None:
-                    user.delete()
+        if len(users) > 1:
+            User.objects.filter(pk__in=[u.pk for u in users if u.last_login is None]).delete()
 
-        # Regenerate queryset as previous result is cached
-        users = User.objects.filter(query)
+            users = [u for u in users if u.last_login is not None]
 
-        # We should only ever have zero or one user/s at this point
-        assert users.count() <= 1
+        # There can still be more than one, e.g. if their emails only differ in case or
+        # one's contact_email is another's email. Take the one with their user id
+        # (username is unique), then one with their primary email, then the oldest.
+        email = profile["email"].lower()
 
-        user = users.first()
+        users.sort(
+            key=lambda u: (
+                u.username != profile["email_user_id"],
+                (u.email or "").lower() != email,
+                u.pk,
+            )
+        )
 
-        if user:
+        fields = {
             # this is now the preferred option for the user id
-            user.username = profile["email_user_id"]
-
+            "username": profile["email_user_id"],
             # these might change over time, so update them every time
-            user.email = profile["email"]
-            user.contact_email = profile["contact_email"]
-            user.first_name = profile["first_name"]
-            user.last_name = profile["last_name"]
-        else:
-            user = User(
-                username=profile["email_user_id"],
-                email=profile["email"],
-                contact_email=profile["contact_email"],
-                first_name=profile["first_name"],
-                last_name=profile["last_name"],
-            )
+            "email": profile["email"],
+            "contact_email": profile["contact_email"],
+            "first_name": profile["first_name"],
+            "last_name": profile["last_name"],
+        }
+
+        if users:
+            user = users[0]
+
+            changed = [name for name, value in fields.items() if getattr(user, name) != value]
 
-            user.set_unusable_password()
+            if changed:
+                for name in changed:
+                    setattr(user, name, fields[name])
+
+                user.save(update_fields=changed)
+
+            return user
+
+        user = User(**fields)
+        user.set_unusable_password()
+
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:
+            # they're logging in on another request too, and that one created them first
+            if retry:
+                return CustomAuthbrokerBackend.get_or_create_user(profile, retry=False)
 
-        user.save()
+            raise
 
         return user
 
     def get_user(self, user_id):
-        User = get_user_model()
         try:
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
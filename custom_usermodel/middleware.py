@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from .models import user_cache_key
+
+
+def get_cached_user(request):
+    """The logged in user of request, from the cache if we can.
+
+    Users are cached with their permissions (which ModelBackend keeps on the user
+    object), and with the session auth hash they were checked against, so a
+    cached user is only used for sessions with that same hash. See .signals for
+    when cached users are forgotten.
+    """
+
+    user_id = request.session.get(auth.SESSION_KEY)
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+
+    if user_id is None or session_hash is None:
+        return auth.get_user(request)
+
+    key = user_cache_key(user_id)
+
+    cached = cache.get(key)
+
+    if cached is not None and cached[0] == session_hash:
+        return cached[1]
+
+    # checks the session auth hash, and logs them out if it doesn't match
+    user = auth.get_user(request)
+
+    if user.is_authenticated:
+        ModelBackend().get_all_permissions(user)
+
+        cache.set(key, (session_hash, user), timeout=settings.USER_CACHE_TIMEOUT)
+
+    return user
+
+
+class CachedUserAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware, but with the user from get_cached_user(), so that
+    most requests don't look up the user or their permissions at all."""
+
+    def process_request(self, request):
+        super().process_request(request)
+
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.16 on 2026-10-18 07:25
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("custom_usermodel", "0003_user_username"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                django.db.models.functions.text.Lower("email"), name="user_email_lower_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                django.db.models.functions.text.Lower("contact_email"),
+                name="user_contact_email_lower_idx",
+            ),
+        ),
+    ]
@@ -1,12 +1,44 @@
+import threading
+from contextlib import contextmanager
 from typing import Optional
 
 from django.db import models
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Lower
 from django.utils.translation import ugettext_lazy as _
 
 from .abstractModel import AbstractUser
 
+_memo = threading.local()
+
+
+@contextmanager
+def memoize_get_by_email():
+    """Make User.get_by_email() remember the users it finds until the end of the
+    block. Misses aren't remembered, as callers often create the user next."""
+
+    _memo.users = {}
+
+    try:
+        yield
+    finally:
+        _memo.users = None
+
+
+def user_cache_key(pk) -> str:
+    """Key of the cached user (see middleware.CachedUserAuthenticationMiddleware)."""
+
+    return f"user:{pk}"
+
 
 class User(AbstractUser):
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # for get_by_email
+            models.Index(Lower("email"), name="user_email_lower_idx"),
+            models.Index(Lower("contact_email"), name="user_contact_email_lower_idx"),
+        ]
+
     username = models.CharField(
         _("username"),
         max_length=150,
@@ -47,12 +79,25 @@ class User(AbstractUser):
     def get_by_email(email: str) -> Optional["User"]:
         """Get existing user by email address, or None if not found.
 
-        Looks up by contact_email first, then email.
+        Looks up by contact_email first, then email, ignoring case.
         """
         email = email.lower()
 
-        return (
-            User.objects.filter(contact_email=email).first()
-            or User.objects.filter(email=email).first()
-            or None
+        users = getattr(_memo, "users", None)
+
+        if users is not None and email in users:
+            return users[email]
+
+        user = (
+            User.objects.alias(
+                contact_email_lower=Lower("contact_email"), email_lower=Lower("email")
+            )
+            .filter(Q(contact_email_lower=email) | Q(email_lower=email))
+            .order_by(Case(When(contact_email_lower=email, then=Value(0)), default=Value(1)), "pk")
+            .first()
         )
+
+        if users is not None and user is not None:
+            users[email] = user
+
+        return user
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import User, user_cache_key
+
+
+def _forget_users(pks) -> None:
+    cache.delete_many([user_cache_key(pk) for pk in pks])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, **kwargs):
+    _forget_users([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def forget_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith("post_"):
+            _forget_users([instance.pk])
+    elif action in ("post_add", "post_remove"):
+        _forget_users(pk_set)
+    elif action == "pre_clear":
+        _forget_users(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def forget_group_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if not reverse:
+        groups = [instance]
+    elif action == "pre_clear":
+        groups = instance.group_set.all()
+    else:
+        groups = Group.objects.filter(pk__in=pk_set)
+
+    _forget_users(User.objects.filter(groups__in=groups).values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+def forget_group(sender, instance, **kwargs):
+    _forget_users(instance.user_set.values_list("pk", flat=True))
@@ -1,5 +1,6 @@
-import pytest
+from unittest import mock
 
+from django.core.cache import cache
 from django.test import TestCase
 from datetime import datetime, timezone
 from custom_usermodel.backends import CustomAuthbrokerBackend
@@ -103,6 +104,73 @@ def test_match_contact_email(transactional_db):
     assert user2.last_name == "Doe"
 
 
+def test_unchanged_profile_is_not_written(db, django_assert_num_queries):
+    profile = {
+        "email_user_id": "jane.doe-df798b95@id.trade.gov.uk",
+        "email": "jane.doe@digital.trade.gov.uk",
+        "contact_email": "jane.doe@example.com",
+        "first_name": "Jane",
+        "last_name": "Doe",
+    }
+
+    user1 = CustomAuthbrokerBackend.get_or_create_user(profile)
+
+    with django_assert_num_queries(1):
+        assert CustomAuthbrokerBackend.get_or_create_user(profile) == user1
+
+    # only what changed is written, and the user's bookings and PRAs in the
+    # activity stream are looked up (see main.signals)
+    with django_assert_num_queries(5):
+        user2 = CustomAuthbrokerBackend.get_or_create_user({**profile, "last_name": "Smith"})
+
+    assert user2 == user1
+    assert User.objects.get(pk=user1.pk).last_name == "Smith"
+
+
+def test_match_email_ignores_case(db):
+    user1 = User.objects.create(email="Jane.Doe@digital.trade.gov.uk")
+
+    user2 = CustomAuthbrokerBackend.get_or_create_user(
+        {
+            "email_user_id": "jane.doe-df798b95@id.trade.gov.uk",
+            "email": "jane.doe@digital.trade.gov.uk",
+            "contact_email": "",
+            "first_name": "Jane",
+            "last_name": "Doe",
+        }
+    )
+
+    assert user1 == user2
+
+
+def test_several_matching_users_picks_primary_email(db):
+    profile = {
+        "email_user_id": "jane.doe-df798b95@id.trade.gov.uk",
+        "email": "jane.doe@digital.trade.gov.uk",
+        "contact_email": "",
+        "first_name": "Jane",
+        "last_name": "Doe",
+    }
+
+    # someone else's contact email is her email
+    User.objects.create(
+        email="john.smith@digital.trade.gov.uk",
+        contact_email="jane.doe@digital.trade.gov.uk",
+        last_login="2021-01-01 00:00:00Z",
+    )
+    user1 = User.objects.create(
+        email="Jane.Doe@digital.trade.gov.uk", last_login="2021-01-01 00:00:00Z"
+    )
+    User.objects.create(email="JANE.DOE@digital.trade.gov.uk", last_login="2021-01-01 00:00:00Z")
+
+    assert CustomAuthbrokerBackend.get_or_create_user(profile) == user1
+
+    # and from then on the one with her user id
+    user2 = User.objects.get(username=profile["email_user_id"])
+    assert user2 == user1
+    assert CustomAuthbrokerBackend.get_or_create_user(profile) == user2
+
+
 class TestUserRecords(TestCase):
     def setUp(self):
         self.test_user = create_test_user()
@@ -157,39 +225,87 @@ def test_duplicate_user_gets_deleted(transactional_db):
     assert user_model_query.first().last_login == datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc)
 
 
-def test_assert_raised_by_more_than_one_user(transactional_db):
-    with pytest.raises(AssertionError):
-        complete_user_record = User.objects.create(  # noqa: F841
-            username="john.doe-df798b95@id.trade.gov.uk",
-            last_login="2021-01-01 00:00:00",
-            email="john.doe@digital.gsi.trade.gov.uk",
-            contact_email="john.doe@digital.trade.gov.uk",
-            first_name="John",
-            last_name="Doe",
-        )
-
-        partial_user_record_1 = User.objects.create(  # noqa: F841
-            username="john.doe-df798b952@id.trade.gov.uk",
-            last_login=None,
-            email="john.doe2@digital.gsi.trade.gov.uk",
-            contact_email="john.doe@digital.trade.gov.uk",
-            first_name="John",
-            last_name="Doe",
-        )
-
-        partial_user_record_2 = User.objects.create(  # noqa: F841
-            username="john.doe-df798b953@id.trade.gov.uk",
-            last_login="2021-01-01 00:00:00",
-            email="john.doe3@digital.gsi.trade.gov.uk",
-            contact_email="john.doe@digital.trade.gov.uk",
-            first_name="John",
-            last_name="Doe",
-        )
-
-        CustomAuthbrokerBackend.get_or_create_user(
-            {
-                "email_user_id": "john.doe-df798b95@id.trade.gov.uk",
-                "email": "john.doe@digital.gsi.trade.gov.uk",
-                "contact_email": "john.doe@digital.trade.gov.uk",
-            }
-        )
+def test_more_than_one_user_picks_user_id(transactional_db):
+    complete_user_record = User.objects.create(
+        username="john.doe-df798b95@id.trade.gov.uk",
+        last_login="2021-01-01 00:00:00Z",
+        email="john.doe@digital.gsi.trade.gov.uk",
+        contact_email="john.doe@digital.trade.gov.uk",
+        first_name="John",
+        last_name="Doe",
+    )
+
+    partial_user_record_1 = User.objects.create(
+        username="john.doe-df798b952@id.trade.gov.uk",
+        last_login=None,
+        email="john.doe2@digital.gsi.trade.gov.uk",
+        contact_email="john.doe@digital.trade.gov.uk",
+        first_name="John",
+        last_name="Doe",
+    )
+
+    partial_user_record_2 = User.objects.create(
+        username="john.doe-df798b953@id.trade.gov.uk",
+        last_login="2021-01-01 00:00:00Z",
+        email="john.doe3@digital.gsi.trade.gov.uk",
+        contact_email="john.doe@digital.trade.gov.uk",
+        first_name="John",
+        last_name="Doe",
+    )
+
+    user = CustomAuthbrokerBackend.get_or_create_user(
+        {
+            "email_user_id": "john.doe-df798b95@id.trade.gov.uk",
+            "email": "john.doe@digital.gsi.trade.gov.uk",
+            "contact_email": "john.doe@digital.trade.gov.uk",
+            "first_name": "John",
+            "last_name": "Doe",
+        }
+    )
+
+    assert user == complete_user_record
+
+    # the one that never logged in is deleted, the other one is left alone
+    assert not User.objects.filter(pk=partial_user_record_1.pk).exists()
+    assert User.objects.filter(pk=partial_user_record_2.pk).exists()
+
+
+def test_authenticate_with_circuit_open(rf, settings):
+    settings.CIRCUIT_BREAKERS = {"staff_sso": {"failure_threshold": 1, "reset_timeout": 60}}
+
+    client = mock.Mock(authorized=True, access_token="token")
+    client.get.side_effect = ConnectionError
+
+    with mock.patch("custom_usermodel.backends.get_client", return_value=client), mock.patch.dict(
+        "main.circuit_breaker._breakers", clear=True
+    ):
+        backend = CustomAuthbrokerBackend()
+
+        assert backend.authenticate(rf.get("/")) is None
+        assert backend.authenticate(rf.get("/")) is None
+
+    # the second call didn't go to staff-sso at all
+    assert client.get.call_count == 1
+
+
+def test_profile_is_cached():
+    cache.clear()
+
+    client = mock.Mock(access_token="token")
+    client.get.return_value.json.return_value = {"email": "jane.doe@digital.trade.gov.uk"}
+
+    with mock.patch.dict("main.circuit_breaker._breakers", clear=True):
+        for _ in range(2):
+            profile = CustomAuthbrokerBackend.get_profile(client)
+
+            assert profile == {"email": "jane.doe@digital.trade.gov.uk"}
+
+    client.get.assert_called_once()
+
+    # but not across access tokens
+    other_client = mock.Mock(access_token="other-token")
+    other_client.get.return_value.json.return_value = {}
+
+    CustomAuthbrokerBackend.get_profile(other_client)
+
+    other_client.get.assert_called_once()
@@ -0,0 +1,82 @@
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+
+from custom_usermodel.middleware import get_cached_user
+from custom_usermodel.models import User
+
+
+class TestGetCachedUser(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.user = User.objects.create(email="jane.doe@digital.trade.gov.uk", is_staff=True)
+        self.client.force_login(self.user)
+
+    def make_request(self):
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+
+        # the session itself is loaded on every request anyway
+        request.session.get(SESSION_KEY)
+
+        return request
+
+    def get_user(self):
+        request = self.make_request()
+
+        return request, get_cached_user(request)
+
+    def test_cached(self):
+        self.assertEqual(self.get_user()[1], self.user)
+
+        request = self.make_request()
+
+        with self.assertNumQueries(0):
+            user = get_cached_user(request)
+
+            self.assertEqual(user, self.user)
+            # with their permissions
+            self.assertFalse(user.has_perm("main.change_booking"))
+
+    def test_forgotten_when_saved(self):
+        self.get_user()
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertFalse(self.get_user()[1].is_active)
+
+    def test_forgotten_when_permissions_change(self):
+        self.get_user()
+
+        group = Group.objects.create(name="bookings")
+        self.user.groups.add(group)
+        self.assertFalse(self.get_user()[1].has_perm("main.change_booking"))
+
+        group.permissions.add(Permission.objects.get(codename="change_booking"))
+        self.assertTrue(self.get_user()[1].has_perm("main.change_booking"))
+
+        self.user.groups.clear()
+        self.assertFalse(self.get_user()[1].has_perm("main.change_booking"))
+
+    def test_other_session_hash_not_cached(self):
+        self.get_user()
+
+        # e.g. a session from before the password was changed
+        session = self.client.session
+        session[HASH_SESSION_KEY] = "something else"
+        session.save()
+
+        request, user = self.get_user()
+
+        self.assertFalse(user.is_authenticated)
+        self.assertIsNone(request.session.get(SESSION_KEY))
+
+    def test_deleted(self):
+        self.get_user()
+
+        self.user.delete()
+
+        self.assertFalse(self.get_user()[1].is_authenticated)
@@ -1,4 +1,4 @@
-from custom_usermodel.models import User
+from custom_usermodel.models import User, memoize_get_by_email
 
 
 def test_get_contact_email():
@@ -34,3 +34,30 @@ def test_get_by_email_none(db):
     User.objects.create(email="hello2@example.com", contact_email="blaa2@example.com")
 
     assert User.get_by_email("blaa3@example.com") is None
+
+
+def test_get_by_email_prefers_contact_email(db):
+    User.objects.create(email="hello1@example.com", contact_email="blaa1@example.com")
+    user2 = User.objects.create(email="hello2@example.com", contact_email="hello1@example.com")
+
+    assert User.get_by_email("hello1@example.com") == user2
+
+
+def test_get_by_email_ignores_case(db):
+    user1 = User.objects.create(email="Hello1@Example.com", contact_email="Blaa1@Example.com")
+
+    assert User.get_by_email("HELLO1@example.com") == user1
+    assert User.get_by_email("blaa1@EXAMPLE.com") == user1
+
+
+def test_get_by_email_memo(db, django_assert_num_queries):
+    user1 = User.objects.create(email="hello1@example.com", contact_email="blaa1@example.com")
+
+    with memoize_get_by_email():
+        with django_assert_num_queries(3):
+            assert User.get_by_email("hello1@example.com") == user1
+            assert User.get_by_email("Hello1@example.com") == user1
+
+            # misses aren't remembered
+            assert User.get_by_email("hello2@example.com") is None
+            assert User.get_by_email("hello2@example.com") is None
@@ -0,0 +1,377 @@
+import datetime
+import hashlib
+import hmac
+import json
+from typing import Callable, Iterator
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Max, Q, QuerySet, Sum
+from django.db.models.expressions import RawSQL
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import parse_etags
+from mohawk import Receiver
+from mohawk.exc import CredentialsLookupError, MacMismatch, MissingAuthorization
+
+from custom_usermodel.models import User
+
+from .models import Booking, Building, ChangeLog, Floor, PRA
+
+
+def is_authenticated(request) -> bool:
+    """Check the request's Hawk signature against ACTIVITY_STREAM_HAWK_CREDENTIALS."""
+
+    def lookup_credentials(passed_id):
+        return (
+            settings.ACTIVITY_STREAM_HAWK_CREDENTIALS
+            if hmac.compare_digest(passed_id, settings.ACTIVITY_STREAM_HAWK_CREDENTIALS["id"])
+            else None
+        )
+
+    try:
+        Receiver(
+            lookup_credentials,
+            request.headers.get("Authorization"),
+            request.build_absolute_uri(),
+            request.method,
+            content=request.body,
+            content_type=request.headers.get("Content-Type"),
+        )
+    except (MissingAuthorization, CredentialsLookupError, MacMismatch):
+        return False
+
+    return True
+
+
+# pg_advisory_xact_lock key that serialises assign_feed_sequences
+FEED_SEQUENCE_LOCK = 7_240_001
+
+
+def assign_feed_sequences() -> None:
+    """Number the bookings, PRAs and ChangeLog rows that don't have a feed_sequence
+    yet, from the main_feed_sequence database sequence.
+
+    Only committed rows can be seen, and the numbering is done by one
+    transaction at a time, so a row that commits later always gets a larger
+    number than every row that a consumer could already have been given. That
+    lets the feeds serve rows right up to the head without missing any from
+    transactions that were still in flight, without writers having to wait for
+    each other. Rows locked by a transaction that is changing them are skipped
+    and numbered next time.
+
+    Call it before reading a feed. Usually there's nothing to number, which
+    takes one query to find out.
+    """
+
+    tables = [model._meta.db_table for model in (Booking, PRA, ChangeLog)]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            " UNION ALL ".join(
+                f"(SELECT '{table}' FROM {table} WHERE feed_sequence IS NULL LIMIT 1)"
+                for table in tables
+            )
+        )
+        tables = [table for (table,) in cursor.fetchall()]
+
+    if not tables:
+        return
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [FEED_SEQUENCE_LOCK])
+
+        for table in tables:
+            cursor.execute(
+                f"""
+                UPDATE {table} SET feed_sequence = numbered.feed_sequence
+                FROM (
+                    SELECT id, nextval('main_feed_sequence') AS feed_sequence
+                    FROM (
+                        SELECT id FROM {table}
+                        WHERE feed_sequence IS NULL
+                        ORDER BY id
+                        FOR UPDATE SKIP LOCKED
+                    ) AS pending
+                ) AS numbered
+                WHERE {table}.id = numbered.id
+                """
+            )
+
+
+def get_cursor(request, queryset, timestamp_field: str) -> int:
+    """Return the feed_sequence to continue after from the request's cursor.
+
+    Cursors used to be "<timestamp>_<id>". Those are still accepted, and turned
+    into the feed_sequence of the last row they covered, so that consumers don't
+    have to start again from scratch.
+    """
+
+    cursor = request.GET.get("cursor", "0")
+
+    if "_" not in cursor:
+        return int(cursor)
+
+    after_ts_str, after_id_str = cursor.split("_")
+    after_ts = datetime.datetime.fromtimestamp(float(after_ts_str), tz=datetime.timezone.utc)
+
+    return (
+        queryset.filter(
+            Q(**{f"{timestamp_field}__lt": after_ts})
+            | Q(**{timestamp_field: after_ts, "id__lte": int(after_id_str)})
+        ).aggregate(feed_sequence=Max("feed_sequence"))["feed_sequence"]
+        or 0
+    )
+
+
+def get_version(objects: QuerySet) -> int:
+    """The version of a feed page about objects (Bookings or PRAs): the sum of
+    their activity_object_version.
+
+    Every time an object is stored, its version goes up to a number bigger than
+    any handed out before (see store_objects), so the sum goes up whenever any of
+    them changes, whatever order the changes commit in.
+    """
+
+    return objects.aggregate(version=Sum("activity_object_version"))["version"] or 0
+
+
+def page_version(objs: list) -> int:
+    """get_version() of objs that are loaded already."""
+
+    return sum({(type(obj), obj.pk): obj.activity_object_version for obj in objs}.values())
+
+
+def page_response(
+    request, after: int, build_page: Callable, get_page_version: Callable
+) -> HttpResponse:
+    """Respond with the page of a feed that starts after feed_sequence after, with
+    an ETag, or a 304 if the consumer already has it.
+
+    build_page() returns (body, last, version): body is the page as JSON, last is
+    the feed_sequence of the last item if the page is complete (so no more items
+    can be added to it) or else None, and version is the page_version() of the
+    objects on it.
+
+    Complete pages are cached, but their objects can still be changed (bookings
+    get cancelled, PRAs approved, users renamed), so a cached page is only used
+    while get_page_version(last) still matches its version. That is one small
+    query instead of fetching and serialising the whole page again.
+    """
+
+    key = f"activity-stream:{request.build_absolute_uri(request.path)}:{after}"
+
+    cached = cache.get(key)
+
+    if cached is not None and get_page_version(cached["last"]) == cached["version"]:
+        body, etag = cached["body"], cached["etag"]
+    else:
+        body, last, version = build_page()
+
+        etag = f'"{hashlib.sha256(body).hexdigest()}"'
+
+        if last is not None:
+            cache.set(
+                key,
+                {"last": last, "version": version, "body": body, "etag": etag},
+                timeout=settings.ACTIVITY_STREAM_PAGE_CACHE_TIMEOUT,
+            )
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+
+    response["ETag"] = etag
+
+    return response
+
+
+def to_json(value) -> str:
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+def make_item(fields: dict, obj) -> str:
+    """JSON for a feed item with fields, and the activity object of a Booking or PRA
+    under "object"."""
+
+    object_json = obj.activity_object_json
+
+    if object_json is None:
+        # not stored yet (see store_objects), and not filled in either (see
+        # fill_missing_objects)
+        object_json = to_json(booking_object(obj) if isinstance(obj, Booking) else pra_object(obj))
+
+    return f'{to_json(fields)[:-1]}, "object": {object_json}}}'
+
+
+def make_page_json(items: list, next_url: str = None) -> bytes:
+    """make_page() as JSON, for items that are JSON already (see make_item)."""
+
+    return (
+        to_json(make_page([], next_url))
+        .replace('"orderedItems": []', f'"orderedItems": [{", ".join(items)}]', 1)
+        .encode()
+    )
+
+
+def _load_objects(objs: list) -> Iterator[tuple]:
+    """(model, rows) for the Bookings and PRAs in objs: loaded again, with
+    everything that goes in their activity objects, and activity_object_json set
+    (but not saved)."""
+
+    for model, related, make_object in (
+        (Booking, ("user", "building", "floor"), booking_object),
+        (PRA, ("staff_member", "line_manager", "scs"), pra_object),
+    ):
+        pks = [obj.pk for obj in objs if isinstance(obj, model)]
+
+        if not pks:
+            continue
+
+        rows = list(model.objects.select_related(*related).filter(pk__in=pks))
+
+        for row in rows:
+            row.activity_object_json = to_json(make_object(row))
+
+        yield model, rows
+
+
+def store_objects(objs: list) -> None:
+    """Serialise and store the activity objects of objs (Bookings and PRAs) as they
+    are in the database now.
+
+    They are stored whenever a booking or PRA, or a user, building or floor in it,
+    is saved (see main.signals), so that the feeds only have to copy them into
+    pages. Use the store_activity_objects command to store them for older rows, or
+    after changing what goes in them.
+    """
+
+    for model, rows in _load_objects(objs):
+        for row in rows:
+            row.activity_object_version = RawSQL("nextval('main_activity_object_version')", ())
+
+        model.objects.bulk_update(
+            rows, ["activity_object_json", "activity_object_version"], batch_size=1000
+        )
+
+
+def fill_missing_objects(objs: list) -> None:
+    """Set activity_object_json of the objs (Bookings and PRAs) that don't have one
+    stored yet, with a query per model, so that the feeds don't have to load the
+    users, buildings and floors of every row just in case."""
+
+    missing = [obj for obj in objs if obj.activity_object_json is None]
+
+    stored = {
+        (model, row.pk): row.activity_object_json
+        for model, rows in _load_objects(missing)
+        for row in rows
+    }
+
+    for obj in missing:
+        obj.activity_object_json = stored.get((type(obj), obj.pk))
+
+
+def store_queryset_objects(queryset: QuerySet, batch_size: int = 1000) -> int:
+    """store_objects() for every row in queryset, batch_size rows at a time.
+
+    Returns the number of rows.
+    """
+
+    pks = list(queryset.order_by("pk").values_list("pk", flat=True))
+
+    for start in range(0, len(pks), batch_size):
+        end = start + batch_size
+
+        store_objects([queryset.model(pk=pk) for pk in pks[start:end]])
+
+    return len(pks)
+
+
+# the fields of users, buildings and floors that are in the activity objects, and
+# the foreign keys of the bookings and PRAs they are in
+RELATED_OBJECTS = {
+    User: (
+        ["email", "first_name", "last_name"],
+        {Booking: ["user"], PRA: ["staff_member", "line_manager", "scs"]},
+    ),
+    Building: (["name"], {Booking: ["building"]}),
+    Floor: (["name"], {Booking: ["floor"]}),
+}
+
+
+def store_related_objects(obj) -> None:
+    """Store the activity objects of the bookings and PRAs that obj (a User,
+    Building or Floor) is in again, e.g. after it was renamed."""
+
+    _, foreign_keys = RELATED_OBJECTS[obj._meta.concrete_model]
+
+    for model, fields in foreign_keys.items():
+        in_row = Q()
+
+        for field in fields:
+            in_row |= Q(**{field: obj})
+
+        store_queryset_objects(model.objects.filter(in_row))
+
+
+def make_page(items: list, next_url: str = None) -> dict:
+    return {
+        "@context": [
+            "https://www.w3.org/ns/activitystreams",
+            {"dit": "https://www.trade.gov.uk/ns/activitystreams/v1"},
+        ],
+        "type": "Collection",
+        "orderedItems": items,
+        **({"next": next_url} if next_url else {}),
+    }
+
+
+def booking_object(booking: Booking) -> dict:
+    return {
+        "id": f"dit:ReturnToOffice:Booking:{booking.id}",
+        "type": "dit:ReturnToOffice:Booking",
+        "dit:ReturnToOffice:Booking:bookingId": booking.id,
+        "dit:ReturnToOffice:Booking:userId": booking.user_id,
+        "dit:ReturnToOffice:Booking:userEmail": booking.user.email,
+        "dit:ReturnToOffice:Booking:userFullName": booking.user.get_short_name(),
+        "dit:ReturnToOffice:Booking:onBehalfOfName": booking.on_behalf_of_name,
+        "dit:ReturnToOffice:Booking:onBehalfOfEmail": booking.on_behalf_of_dit_email,
+        "dit:ReturnToOffice:Booking:bookingDate": booking.booking_date,
+        "dit:ReturnToOffice:Booking:building": booking.building.name,
+        "dit:ReturnToOffice:Booking:floor": booking.floor.name,
+        "dit:ReturnToOffice:Booking:directorate": booking.directorate,
+        "dit:ReturnToOffice:Booking:group": booking.group,
+        "dit:ReturnToOffice:Booking:businessUnit": booking.business_unit,
+        "dit:ReturnToOffice:Booking:created": booking.booked_timestamp,
+        "dit:ReturnToOffice:Booking:cancelled": booking.canceled_timestamp,
+    }
+
+
+def pra_object(pra: PRA) -> dict:
+    return {
+        "id": f"dit:ReturnToOffice:PRA:{pra.id}",
+        "type": "dit:ReturnToOffice:PRA",
+        "dit:ReturnToOffice:PRA:praId": pra.id,
+        "dit:ReturnToOffice:PRA:staffMemberId": pra.staff_member_id,
+        "dit:ReturnToOffice:PRA:staffMemberEmail": pra.staff_member.email,
+        "dit:ReturnToOffice:PRA:staffMemberFullName": pra.staff_member.get_short_name(),
+        "dit:ReturnToOffice:PRA:lineManagerId": pra.line_manager_id,
+        "dit:ReturnToOffice:PRA:lineManagerEmail": pra.line_manager.email,
+        "dit:ReturnToOffice:PRA:lineManagerFullName": pra.line_manager.get_short_name(),
+        "dit:ReturnToOffice:PRA:scsId": pra.scs_id,
+        "dit:ReturnToOffice:PRA:scsEmail": pra.scs.email,
+        "dit:ReturnToOffice:PRA:scsFullName": pra.scs.get_short_name(),
+        "dit:ReturnToOffice:PRA:authorizedReason": pra.authorized_reason,
+        "dit:ReturnToOffice:PRA:group": pra.group,
+        "dit:ReturnToOffice:PRA:businessUnit": pra.business_unit,
+        "dit:ReturnToOffice:PRA:riskCategory": pra.risk_category_desc(),
+        "dit:ReturnToOffice:PRA:mitigationOutcome": pra.mitigation_outcome_desc(),
+        "dit:ReturnToOffice:PRA:mitigationMeasures": pra.mitigation_measures,
+        "dit:ReturnToOffice:PRA:created": pra.created_timestamp,
+        "dit:ReturnToOffice:PRA:approvedStaffMember": pra.approved_staff_member,
+        "dit:ReturnToOffice:PRA:approvedSCS": pra.approved_scs,
+        "dit:ReturnToOffice:PRA:migrated": pra.migrated,
+    }
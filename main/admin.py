@@ -1,105 +1,102 @@
-import csv
 import datetime
-import io
 
 from django.contrib import admin
 from django.contrib.admin.filters import DateFieldListFilter
-from django.http import HttpResponse
-
-from .models import DitGroup, Building, Floor, Booking, PRA
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from . import exports
+from .models import (
+    BusinessUnit,
+    DitGroup,
+    Building,
+    ExportJob,
+    Floor,
+    Booking,
+    NotificationOutbox,
+    PRA,
+)
 
 
 def download_bookings_csv(modeladmin, request, queryset):
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(
-        [
-            "booking_date",
-            "building",
-            "floor",
-            "user",
-            "directorate",
-            "group",
-            "business_unit",
-            "on_behalf_of_name",
-            "on_behalf_of_dit_email",
-        ]
-    )
+    return exports.csv_response(exports.booking_rows(queryset), "bookings.csv")
 
-    for b in queryset:
-        writer.writerow(
-            [
-                b.booking_date,
-                b.building,
-                b.floor,
-                b.user,
-                b.directorate,
-                b.group,
-                b.business_unit,
-                b.on_behalf_of_name,
-                b.on_behalf_of_dit_email,
-            ]
-        )
 
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = "attachment;filename=bookings.csv"
-    response.write(output.getvalue())
+download_bookings_csv.short_description = "Export as CSV"
+
 
-    return response
+def download_bookings_csv_gz(modeladmin, request, queryset):
+    return exports.csv_response(exports.booking_rows(queryset), "bookings.csv", gzipped=True)
 
 
-download_bookings_csv.short_description = "Export as CSV"
+download_bookings_csv_gz.short_description = "Export as gzipped CSV"
 
 
 def download_pra_csv(modeladmin, request, queryset):
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(
-        [
-            "ID",
-            "Staff member",
-            "Line manager",
-            "SCS",
-            "Authorized reason",
-            "Group",
-            "Business unit",
-            "Risk category",
-            "Mitigation outcome",
-            "Mitigation measures",
-            "Creation time",
-            "Approved staff member",
-            "Approved SCS",
-        ]
+    return exports.csv_response(exports.pra_rows(queryset), "pra-export.csv")
+
+
+download_pra_csv.short_description = "Export as CSV"
+download_pra_csv.allowed_permissions = ("view",)
+
+
+def download_pra_csv_gz(modeladmin, request, queryset):
+    return exports.csv_response(exports.pra_rows(queryset), "pra-export.csv", gzipped=True)
+
+
+download_pra_csv_gz.short_description = "Export as gzipped CSV"
+download_pra_csv_gz.allowed_permissions = ("view",)
+
+
+def _queue_export(modeladmin, request, queryset, kind, gzipped):
+    if request.POST.get("select_across") == "1":
+        # "select all", which can be too many rows to store the pks of
+        changelist_params = {key: request.GET.getlist(key) for key in request.GET}
+    else:
+        changelist_params = None
+
+    job = exports.queue_export_job(kind, queryset, gzipped, request.user, changelist_params)
+
+    modeladmin.message_user(
+        request,
+        format_html(
+            'Queued <a href="{}">{}</a>, it can be downloaded once it\'s done',
+            reverse("admin:main_exportjob_changelist"),
+            job,
+        ),
     )
 
-    for pra in queryset:
-        writer.writerow(
-            [
-                pra.pk,
-                pra.staff_member.email,
-                pra.line_manager.email,
-                pra.scs.email,
-                pra.authorized_reason,
-                pra.group,
-                pra.business_unit,
-                pra.risk_category,
-                pra.mitigation_outcome,
-                pra.mitigation_measures,
-                pra.created_timestamp.isoformat(),
-                pra.approved_staff_member,
-                pra.approved_scs,
-            ]
-        )
 
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = "attachment;filename=pra-export.csv"
-    response.write(output.getvalue())
+def queue_bookings_export(modeladmin, request, queryset):
+    _queue_export(modeladmin, request, queryset, ExportJob.KIND_BOOKINGS, gzipped=False)
 
-    return response
 
+queue_bookings_export.short_description = "Queue CSV export"
+
+
+def queue_bookings_export_gz(modeladmin, request, queryset):
+    _queue_export(modeladmin, request, queryset, ExportJob.KIND_BOOKINGS, gzipped=True)
+
+
+queue_bookings_export_gz.short_description = "Queue gzipped CSV export"
+
+
+def queue_pra_export(modeladmin, request, queryset):
+    _queue_export(modeladmin, request, queryset, ExportJob.KIND_PRAS, gzipped=False)
+
+
+queue_pra_export.short_description = "Queue CSV export"
+queue_pra_export.allowed_permissions = ("view",)
 
-download_pra_csv.short_description = "Export as CSV"
-download_pra_csv.allowed_permissions = ("view",)
+
+def queue_pra_export_gz(modeladmin, request, queryset):
+    _queue_export(modeladmin, request, queryset, ExportJob.KIND_PRAS, gzipped=True)
+
+
+queue_pra_export_gz.short_description = "Queue gzipped CSV export"
+queue_pra_export_gz.allowed_permissions = ("view",)
 
 
 class MyDateTimeFilter(DateFieldListFilter):
@@ -119,8 +116,14 @@ class MyDateTimeFilter(DateFieldListFilter):
         )
 
 
+class BusinessUnitInline(admin.TabularInline):
+    model = BusinessUnit
+    extra = 1
+
+
 class DitGroupAdmin(admin.ModelAdmin):
     ordering = ["name"]
+    inlines = [BusinessUnitInline]
 
 
 class BuildingAdmin(admin.ModelAdmin):
@@ -154,7 +157,12 @@ class BookingAdmin(admin.ModelAdmin):
     ]
     ordering = ["booking_date", "building"]
 
-    actions = [download_bookings_csv]
+    actions = [
+        download_bookings_csv,
+        download_bookings_csv_gz,
+        queue_bookings_export,
+        queue_bookings_export_gz,
+    ]
 
 
 class PRAAdmin(admin.ModelAdmin):
@@ -164,7 +172,89 @@ class PRAAdmin(admin.ModelAdmin):
 
     ordering = ["staff_member"]
 
-    actions = [download_pra_csv]
+    actions = [download_pra_csv, download_pra_csv_gz, queue_pra_export, queue_pra_export_gz]
+
+
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "email_address",
+        "status",
+        "nr_of_attempts",
+        "created_timestamp",
+        "next_attempt_timestamp",
+        "sent_timestamp",
+    )
+
+    list_filter = ["status"]
+    search_fields = ["email_address"]
+    ordering = ["-created_timestamp"]
+
+
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "kind",
+        "gzipped",
+        "status",
+        "progress",
+        "requested_by",
+        "created_timestamp",
+        "finished_timestamp",
+        "download_link",
+    )
+
+    list_filter = ["status", "kind"]
+    ordering = ["-created_timestamp"]
+
+    fields = [
+        "kind",
+        "gzipped",
+        "status",
+        "nr_of_rows",
+        "nr_of_rows_done",
+        "last_error",
+        "requested_by",
+        "created_timestamp",
+        "finished_timestamp",
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:pk>/download/",
+                self.admin_site.admin_view(self.download),
+                name="main_exportjob_download",
+            ),
+        ] + super().get_urls()
+
+    def download(self, request, pk):
+        job = get_object_or_404(ExportJob, pk=pk, status=ExportJob.STATUS_DONE)
+        opts = exports.EXPORTS[job.kind][0]._meta
+
+        if not (
+            self.has_view_permission(request, job)
+            and request.user.has_perm(f"{opts.app_label}.view_{opts.model_name}")
+        ):
+            raise PermissionDenied
+
+        return exports.export_file_response(job)
+
+    def download_link(self, job):
+        if job.status != ExportJob.STATUS_DONE:
+            return "-"
+
+        return format_html(
+            '<a href="{}">Download</a>', reverse("admin:main_exportjob_download", args=[job.pk])
+        )
+
+    download_link.short_description = "File"
 
 
 admin.site.register(DitGroup, DitGroupAdmin)
@@ -172,3 +262,5 @@ admin.site.register(Building, BuildingAdmin)
 admin.site.register(Floor, FloorAdmin)
 admin.site.register(Booking, BookingAdmin)
 admin.site.register(PRA, PRAAdmin)
+admin.site.register(NotificationOutbox, NotificationOutboxAdmin)
+admin.site.register(ExportJob, ExportJobAdmin)
@@ -0,0 +1,102 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Booking, Building, Floor
+
+
+def get_availability(building: Building, start_date: datetime.date, nr_of_days: int) -> dict:
+    """Get the number of free desks per floor of a building for each day in
+    [start_date, start_date + nr_of_days).
+
+    Results are cached per (building, date range) for
+    settings.AVAILABILITY_CACHE_TIMEOUT seconds. Only one caller computes a
+    missing entry; concurrent callers wait for it instead of all hitting the
+    database at once.
+    """
+
+    key = f"availability:{building.pk}:{start_date.isoformat()}:{nr_of_days}"
+
+    availability = cache.get(key)
+
+    if availability is not None:
+        return availability
+
+    lock_key = f"{key}:lock"
+
+    if cache.add(lock_key, True, timeout=settings.AVAILABILITY_LOCK_TIMEOUT):
+        try:
+            availability = _compute_availability(building, start_date, nr_of_days)
+            cache.set(key, availability, timeout=settings.AVAILABILITY_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+
+        return availability
+
+    # someone else is computing it, wait for them
+    deadline = time.monotonic() + settings.AVAILABILITY_LOCK_TIMEOUT
+
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+
+        availability = cache.get(key)
+
+        if availability is not None:
+            return availability
+
+    # they're taking too long (or died), do it ourselves
+    return _compute_availability(building, start_date, nr_of_days)
+
+
+def _compute_availability(building: Building, start_date: datetime.date, nr_of_days: int) -> dict:
+    end_date = start_date + datetime.timedelta(days=nr_of_days - 1)
+
+    floors = list(Floor.objects.filter(building=building).order_by("name"))
+
+    # key = (floor id, date), value = number of active bookings
+    nr_of_bookings = {
+        (row["floor_id"], row["booking_date"]): row["nr_of_bookings"]
+        for row in Booking.objects.filter(
+            building=building,
+            is_active=True,
+            booking_date__gte=start_date,
+            booking_date__lte=end_date,
+        )
+        .values("floor_id", "booking_date")
+        .annotate(nr_of_bookings=Count("id"))
+        .order_by()
+    }
+
+    days = []
+    first_free_date = None
+
+    for i in range(nr_of_days):
+        day = start_date + datetime.timedelta(days=i)
+
+        day_floors = [
+            {
+                "id": f.pk,
+                "name": f.name,
+                "nr_of_desks": f.nr_of_desks,
+                "free_desks": max(f.nr_of_desks - nr_of_bookings.get((f.pk, day), 0), 0),
+            }
+            for f in floors
+        ]
+
+        free_desks = sum(f["free_desks"] for f in day_floors)
+
+        if free_desks and first_free_date is None:
+            first_free_date = day
+
+        days.append({"date": day, "free_desks": free_desks, "floors": day_floors})
+
+    return {
+        "building": {"id": building.pk, "name": building.name},
+        "start_date": start_date,
+        "end_date": end_date,
+        "first_free_date": first_free_date,
+        "days": days,
+    }
@@ -0,0 +1,128 @@
+import datetime
+
+from django.db import transaction
+
+from .activity_stream import store_objects
+from .models import Booking, ChangeLog, Floor, FloorDayOccupancy
+
+
+def get_recurring_dates(start_date: datetime.date, weekdays: list, until: datetime.date) -> list:
+    """Get start_date plus every date up to and including until that falls on one of
+    the given weekdays (0 = Monday, 6 = Sunday)."""
+
+    dates = [start_date]
+
+    if weekdays and until:
+        day = start_date + datetime.timedelta(days=1)
+
+        while day <= until:
+            if day.weekday() in weekdays:
+                dates.append(day)
+
+            day += datetime.timedelta(days=1)
+
+    return dates
+
+
+def create_bookings(bookings: list, all_or_nothing: bool = False) -> tuple:
+    """Create a batch of unsaved Booking objects in a single transaction.
+
+    The floors are locked for every day involved and capacity is checked for the
+    whole batch in one pass. Bookings that can't be made (floor full, duplicate
+    booking) are skipped and the rest are created, unless all_or_nothing is True,
+    in which case nothing is created if anything fails.
+
+    Returns a tuple (created bookings, list of (failed booking, reason)).
+    """
+
+    created = []
+    failed = []
+
+    with transaction.atomic():
+        occupancies = FloorDayOccupancy.lock_many([(b.floor_id, b.booking_date) for b in bookings])
+
+        existing = set(
+            Booking.objects.filter(
+                is_active=True,
+                user_id__in={b.user_id for b in bookings},
+                floor_id__in={b.floor_id for b in bookings},
+                booking_date__in={b.booking_date for b in bookings},
+            ).values_list(
+                "user_id", "floor_id", "booking_date", "on_behalf_of_name", "on_behalf_of_dit_email"
+            )
+        )
+
+        for booking in bookings:
+            occupancy = occupancies[(booking.floor_id, booking.booking_date)]
+
+            duplicate_key = (
+                booking.user_id,
+                booking.floor_id,
+                booking.booking_date,
+                booking.on_behalf_of_name,
+                booking.on_behalf_of_dit_email,
+            )
+
+            if occupancy.nr_of_bookings >= booking.floor.nr_of_desks:
+                failed.append((booking, "Floor is completely booked"))
+            elif duplicate_key in existing:
+                failed.append((booking, "Cannot add duplicate booking"))
+            else:
+                occupancy.nr_of_bookings += 1
+                existing.add(duplicate_key)
+                created.append(booking)
+
+        if all_or_nothing and failed:
+            return [], failed
+
+        if created:
+            Booking.objects.bulk_create(created)
+            ChangeLog.record_many(created, ChangeLog.ACTION_CREATED)
+
+            # bulk_create doesn't send post_save (see main.signals)
+            store_objects(created)
+
+            FloorDayOccupancy.objects.bulk_update(
+                {occupancies[(b.floor_id, b.booking_date)] for b in created}, ["nr_of_bookings"]
+            )
+
+    return created, failed
+
+
+def create_team_bookings(bookings: list, split_across_floors: bool = False) -> tuple:
+    """Create bookings for several people on the same floor and date, in a single
+    transaction. Either everyone gets a desk or nobody does.
+
+    If split_across_floors is True, people who don't fit on the selected floor are
+    given desks on the other floors of the building instead (in floor name order).
+
+    Returns a tuple (created bookings, list of (failed booking, reason)).
+    """
+
+    if not split_across_floors:
+        return create_bookings(bookings, all_or_nothing=True)
+
+    building_id = bookings[0].building_id
+    floor_id = bookings[0].floor_id
+    booking_date = bookings[0].booking_date
+
+    # selected floor first, then the rest
+    floors = sorted(
+        Floor.objects.filter(building_id=building_id).order_by("name"),
+        key=lambda f: f.pk != floor_id,
+    )
+
+    with transaction.atomic():
+        occupancies = FloorDayOccupancy.lock_many([(f.pk, booking_date) for f in floors])
+
+        unassigned = list(bookings)
+
+        for floor in floors:
+            free_desks = floor.nr_of_desks - occupancies[(floor.pk, booking_date)].nr_of_bookings
+
+            while unassigned and free_desks > 0:
+                unassigned.pop(0).floor = floor
+                free_desks -= 1
+
+        # anyone left over stays on the selected floor and fails the capacity check
+        return create_bookings(bookings, all_or_nothing=True)
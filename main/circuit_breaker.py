@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """The dependency has been failing and calls to it are not being made."""
+
+
+class DeadlineExceeded(Exception):
+    """The current request has used up its time budget for outbound calls."""
+
+
+class CircuitBreaker:
+    """Stops calling a dependency that keeps failing, so that requests fail fast
+    instead of each of them waiting for a timeout.
+
+    After failure_threshold consecutive failures the breaker opens and calls raise
+    CircuitOpenError straight away. Once reset_timeout seconds have passed it goes
+    half-open and lets a single probe call through: if that succeeds the breaker
+    closes again, otherwise it stays open for another reset_timeout.
+
+    State is per process, so each gunicorn worker finds out on its own. Opening
+    and closing are logged (with the breaker's name in circuit_breaker), which is
+    where outages of the dependencies show up; they aren't a reason to fail this
+    app's own health check.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._nr_of_failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._get_state()
+
+    def _get_state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+
+        return self.OPEN
+
+    def call(self, func: Callable, is_failure: Optional[Callable] = None):
+        """Return func(), unless the breaker is open.
+
+        is_failure(exception) can be used to say which exceptions mean the
+        dependency is unhealthy (by default all of them). Others are re-raised
+        without counting against it.
+        """
+
+        with self._lock:
+            state = self._get_state()
+
+            if state == self.OPEN or (state == self.HALF_OPEN and self._probing):
+                raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+
+            if state == self.HALF_OPEN:
+                self._probing = True
+
+        try:
+            result = func()
+        except DeadlineExceeded:
+            # we ran out of time before calling it, that says nothing about the dependency
+            with self._lock:
+                self._probing = False
+
+            raise
+        except Exception as e:
+            if is_failure is None or is_failure(e):
+                self._record_failure()
+            else:
+                self._record_success()
+
+            raise
+
+        self._record_success()
+
+        return result
+
+    def _record_success(self) -> None:
+        with self._lock:
+            closed = self._opened_at is not None
+
+            self._nr_of_failures = 0
+            self._opened_at = None
+            self._probing = False
+
+        if closed:
+            logger.info(
+                "Circuit breaker '%s' closed", self.name, extra={"circuit_breaker": self.name}
+            )
+
+    def _record_failure(self) -> None:
+        with self._lock:
+            opened = False
+            self._nr_of_failures += 1
+
+            if self._probing or self._nr_of_failures >= self.failure_threshold:
+                opened = self._opened_at is None
+                self._opened_at = time.monotonic()
+
+            self._probing = False
+
+        if opened:
+            logger.warning(
+                "Circuit breaker '%s' opened after %s failures",
+                self.name,
+                self._nr_of_failures,
+                extra={"circuit_breaker": self.name},
+            )
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Get the breaker for one of the dependencies in settings.CIRCUIT_BREAKERS."""
+
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, **settings.CIRCUIT_BREAKERS[name])
+
+        return _breakers[name]
+
+
+def get_all_breakers() -> list:
+    return [get_breaker(name) for name in settings.CIRCUIT_BREAKERS]
+
+
+_deadline = threading.local()
+
+
+def set_deadline(seconds: Optional[float]) -> None:
+    """Set (or with None, clear) the time budget for outbound calls on this thread."""
+
+    _deadline.at = None if seconds is None else time.monotonic() + seconds
+
+
+def get_timeout(timeout: float) -> float:
+    """Get the timeout to use for an outbound call: timeout, or less if the current
+    request doesn't have that much time left.
+
+    Raises DeadlineExceeded if the request has no time left at all.
+    """
+
+    at = getattr(_deadline, "at", None)
+
+    if at is None:
+        return timeout
+
+    remaining = at - time.monotonic()
+
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+
+    return min(timeout, remaining)
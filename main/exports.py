@@ -0,0 +1,327 @@
+import csv
+import datetime
+import io
+import logging
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory
+from django.utils import timezone
+from django.utils.text import compress_sequence
+
+from .models import PRA, Booking, ExportFileChunk, ExportJob
+
+logger = logging.getLogger(__name__)
+
+BOOKING_HEADER = [
+    "booking_date",
+    "building",
+    "floor",
+    "user",
+    "directorate",
+    "group",
+    "business_unit",
+    "on_behalf_of_name",
+    "on_behalf_of_dit_email",
+]
+
+PRA_HEADER = [
+    "ID",
+    "Staff member",
+    "Line manager",
+    "SCS",
+    "Authorized reason",
+    "Group",
+    "Business unit",
+    "Risk category",
+    "Mitigation outcome",
+    "Mitigation measures",
+    "Creation time",
+    "Approved staff member",
+    "Approved SCS",
+]
+
+
+def booking_rows(queryset) -> Iterator[list]:
+    """The header and a row per booking in queryset."""
+
+    yield BOOKING_HEADER
+
+    for b in queryset.select_related("building", "floor", "user").iterator(
+        chunk_size=settings.CSV_EXPORT_CHUNK_SIZE
+    ):
+        yield [
+            b.booking_date,
+            b.building,
+            b.floor,
+            b.user,
+            b.directorate,
+            b.group,
+            b.business_unit,
+            b.on_behalf_of_name,
+            b.on_behalf_of_dit_email,
+        ]
+
+
+def pra_rows(queryset) -> Iterator[list]:
+    """The header and a row per PRA in queryset."""
+
+    yield PRA_HEADER
+
+    for pra in queryset.select_related("staff_member", "line_manager", "scs").iterator(
+        chunk_size=settings.CSV_EXPORT_CHUNK_SIZE
+    ):
+        yield [
+            pra.pk,
+            pra.staff_member.email,
+            pra.line_manager.email,
+            pra.scs.email,
+            pra.authorized_reason,
+            pra.group,
+            pra.business_unit,
+            pra.risk_category,
+            pra.mitigation_outcome,
+            pra.mitigation_measures,
+            pra.created_timestamp.isoformat(),
+            pra.approved_staff_member,
+            pra.approved_scs,
+        ]
+
+
+# the model, rows and file name of each ExportJob kind
+EXPORTS = {
+    ExportJob.KIND_BOOKINGS: (Booking, booking_rows, "bookings.csv"),
+    ExportJob.KIND_PRAS: (PRA, pra_rows, "pra-export.csv"),
+}
+
+
+def csv_chunks(rows: Iterable[list], rows_per_chunk: int = 500) -> Iterator[bytes]:
+    """rows as UTF-8 encoded CSV, rows_per_chunk rows at a time."""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+
+        if i % rows_per_chunk == 0:
+            yield buffer.getvalue().encode()
+
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def csv_response(rows: Iterable[list], filename: str, gzipped: bool = False):
+    """Download rows as filename (.gz if gzipped) without having all of it in memory.
+
+    The rows are only fetched while the response is sent, a chunk of
+    CSV_EXPORT_CHUNK_SIZE at a time (querysets iterated with .iterator() use a
+    server-side cursor on Postgres).
+    """
+
+    chunks = csv_chunks(rows)
+
+    if gzipped:
+        response = StreamingHttpResponse(compress_sequence(chunks), content_type="application/gzip")
+        filename += ".gz"
+    else:
+        response = StreamingHttpResponse(chunks, content_type="text/csv")
+
+    response["Content-Disposition"] = f"attachment;filename={filename}"
+
+    return response
+
+
+def queue_export_job(
+    kind: str, queryset, gzipped: bool, user, changelist_params: dict = None
+) -> ExportJob:
+    """Queue an export of queryset to be written by the run_export_jobs command.
+
+    Only which rows to export is stored: the pks of queryset, or if
+    changelist_params (the query string of the admin changelist, as a dict of
+    lists) are given, whatever the changelist shows with them.
+    """
+
+    if changelist_params is None:
+        selection = {"pks": list(queryset.order_by("pk").values_list("pk", flat=True))}
+    else:
+        selection = {"changelist_params": changelist_params}
+
+    return ExportJob.objects.create(
+        kind=kind,
+        gzipped=gzipped,
+        selection=selection,
+        nr_of_rows=queryset.count(),
+        requested_by=user,
+    )
+
+
+def export_queryset(job: ExportJob):
+    """The rows to export for job, as described by its selection."""
+
+    model = EXPORTS[job.kind][0]
+
+    if "pks" in job.selection:
+        return model.objects.filter(pk__in=job.selection["pks"]).order_by("pk")
+
+    # the changelist's filters and search, as they are for the user that queued it
+    request = RequestFactory().get("/", job.selection["changelist_params"])
+    request.user = job.requested_by or AnonymousUser()
+
+    modeladmin = admin.site._registry[model]
+
+    return modeladmin.get_changelist_instance(request).get_queryset(request)
+
+
+def export_file_name(job: ExportJob) -> str:
+    filename = f"{job.pk}-{EXPORTS[job.kind][2]}"
+
+    return filename + ".gz" if job.gzipped else filename
+
+
+def export_file_response(job: ExportJob):
+    """Download the file written for job, a chunk at a time."""
+
+    content_type = "application/gzip" if job.gzipped else "text/csv"
+
+    response = StreamingHttpResponse(_read_chunks(job), content_type=content_type)
+    response["Content-Disposition"] = f"attachment;filename={export_file_name(job)}"
+
+    return response
+
+
+def run_pending_export_job() -> Optional[ExportJob]:
+    """Write the file of the oldest pending export job, to ExportFileChunk rows.
+
+    Safe to run in several processes at once: jobs are claimed with SKIP LOCKED.
+    A running job that made no progress for EXPORT_JOB_TIMEOUT seconds is
+    assumed to belong to a worker that died, and is started again.
+
+    Returns the job, or None if there was nothing to do.
+    """
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        job = (
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ExportJob.STATUS_PENDING)
+                | Q(
+                    status=ExportJob.STATUS_RUNNING,
+                    updated_timestamp__lt=now
+                    - datetime.timedelta(seconds=settings.EXPORT_JOB_TIMEOUT),
+                )
+            )
+            .order_by("created_timestamp")
+            .first()
+        )
+
+        if job is None:
+            return None
+
+        job.status = ExportJob.STATUS_RUNNING
+        job.nr_of_rows_done = 0
+        job.updated_timestamp = now
+        job.save(update_fields=["status", "nr_of_rows_done", "updated_timestamp"])
+
+        # written by a worker that died
+        job.chunks.all().delete()
+
+    make_rows = EXPORTS[job.kind][1]
+
+    try:
+        chunks = csv_chunks(_track_progress(job, make_rows(export_queryset(job))))
+
+        if job.gzipped:
+            chunks = compress_sequence(chunks)
+
+        _write_chunks(job, chunks)
+    except Exception as e:
+        logger.exception("Export job %s failed", job.pk)
+
+        job.chunks.all().delete()
+
+        job.status = ExportJob.STATUS_FAILED
+        job.last_error = repr(e)
+    else:
+        job.status = ExportJob.STATUS_DONE
+        job.nr_of_rows = job.nr_of_rows_done
+
+    job.updated_timestamp = job.finished_timestamp = timezone.now()
+    job.save(
+        update_fields=[
+            "status",
+            "nr_of_rows",
+            "nr_of_rows_done",
+            "last_error",
+            "updated_timestamp",
+            "finished_timestamp",
+        ]
+    )
+
+    return job
+
+
+def delete_expired_export_jobs() -> int:
+    """Delete the jobs that finished more than EXPORT_JOB_KEEP_DAYS days ago, and
+    with them their files.
+
+    Returns how many were deleted.
+    """
+
+    _, deleted = ExportJob.objects.filter(
+        finished_timestamp__lt=timezone.now()
+        - datetime.timedelta(days=settings.EXPORT_JOB_KEEP_DAYS)
+    ).delete()
+
+    return deleted.get(ExportJob._meta.label, 0)
+
+
+def _track_progress(job: ExportJob, rows: Iterator[list]) -> Iterator[list]:
+    # the header
+    yield next(rows)
+
+    for row in rows:
+        yield row
+
+        job.nr_of_rows_done += 1
+
+        if job.nr_of_rows_done % settings.CSV_EXPORT_CHUNK_SIZE == 0:
+            ExportJob.objects.filter(pk=job.pk).update(
+                nr_of_rows_done=job.nr_of_rows_done, updated_timestamp=timezone.now()
+            )
+
+
+def _write_chunks(job: ExportJob, chunks: Iterable[bytes]) -> None:
+    # cut into rows of EXPORT_FILE_CHUNK_SIZE bytes, rather than a row per few
+    # hundred CSV rows
+    size = settings.EXPORT_FILE_CHUNK_SIZE
+    buffer = bytearray()
+    index = 0
+
+    for chunk in chunks:
+        buffer += chunk
+
+        while len(buffer) >= size:
+            ExportFileChunk.objects.create(job=job, index=index, data=bytes(buffer[:size]))
+
+            del buffer[:size]
+            index += 1
+
+    if buffer:
+        ExportFileChunk.objects.create(job=job, index=index, data=bytes(buffer))
+
+
+def _read_chunks(job: ExportJob) -> Iterator[bytes]:
+    # a query per chunk, so that only one of them is in memory at a time
+    for pk in job.chunks.order_by("index").values_list("pk", flat=True):
+        yield bytes(ExportFileChunk.objects.values_list("data", flat=True).get(pk=pk))
@@ -1,18 +1,27 @@
 import datetime
 
 from django import forms
+from django.conf import settings
 from django.utils.safestring import mark_safe
 from django.core.validators import validate_email
 
-from .models import Booking, Floor, Building, DitGroup, PRA
-from .widgets import GovUKCheckboxInput, GovUKRadioSelect, GovUKTextInput
+from . import reference_data
+from .bookings import get_recurring_dates
+from .models import FloorDayOccupancy, Building, PRA
+from .widgets import (
+    GovUKCheckboxInput,
+    GovUKCheckboxSelectMultiple,
+    GovUKRadioSelect,
+    GovUKTextArea,
+    GovUKTextInput,
+)
 
 
 class BookingFormWhoFor(forms.Form):
     for_myself = forms.ChoiceField(
         label="Who are you booking for?",
         widget=GovUKRadioSelect(),
-        choices=[("1", "Myself"), ("0", "Someone else")],
+        choices=[("1", "Myself"), ("0", "Someone else"), ("2", "A team of colleagues")],
     )
 
     def __init__(self, request, *args, **kwargs):
@@ -37,6 +46,13 @@ class BookingFormInitial(forms.Form):
         help_text="Or if booking on behalf of DIT staff, please enter their email address",
     )
 
+    team_dit_emails = forms.CharField(
+        required=False,
+        widget=GovUKTextArea(),
+        label="Team members",
+        help_text="Please enter the DIT email address of each person to book a desk for, one per line",
+    )
+
     confirm_presentation = forms.BooleanField(
         required=False,
         label=mark_safe(
@@ -48,30 +64,55 @@ class BookingFormInitial(forms.Form):
     )
 
     booking_date = forms.DateField(widget=forms.DateInput(attrs={"type": "date"}))
+
+    repeat_weekdays = forms.MultipleChoiceField(
+        required=False,
+        label="Repeat every week on",
+        help_text="To book the same desk on several days, select the days of the week to repeat the booking on",
+        choices=[
+            ("0", "Monday"),
+            ("1", "Tuesday"),
+            ("2", "Wednesday"),
+            ("3", "Thursday"),
+            ("4", "Friday"),
+        ],
+        widget=GovUKCheckboxSelectMultiple(),
+    )
+
+    repeat_until = forms.DateField(
+        required=False, label="Repeat until", widget=forms.DateInput(attrs={"type": "date"})
+    )
+
     building = forms.ChoiceField(label="Building", widget=GovUKRadioSelect())
     dit_group = forms.ChoiceField(label="DIT group", widget=GovUKRadioSelect())
 
-    def __init__(self, for_myself, *args, **kwargs):
+    def __init__(self, for_myself, *args, for_team=False, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.for_myself = for_myself
+        self.for_team = for_team
 
         self.fields["building"].widget.form_instance = self
         self.fields["dit_group"].widget.form_instance = self
         self.fields["on_behalf_of_name"].widget.form_instance = self
         self.fields["on_behalf_of_dit_email"].widget.form_instance = self
+        self.fields["team_dit_emails"].widget.form_instance = self
         self.fields["confirm_presentation"].widget.form_instance = self
+        self.fields["repeat_weekdays"].widget.form_instance = self
+
+        for field in ["booking_date", "repeat_until"]:
+            self.fields[field].widget.attrs.update(
+                {
+                    "min": str(datetime.date.today()),
+                    "class": "govuk-input",
+                    "style": "width: 250px",
+                }
+            )
 
-        self.fields["booking_date"].widget.attrs.update(
-            {"min": str(datetime.date.today()), "class": "govuk-input", "style": "width: 250px"}
-        )
-
-        self.fields["building"].choices = [
-            (b.pk, str(b)) for b in Building.objects.all().order_by("name")
-        ]
+        self.fields["building"].choices = [(b.pk, str(b)) for b in reference_data.get().buildings]
 
         self.fields["dit_group"].choices = [
-            (dg.pk, str(dg)) for dg in DitGroup.objects.all().order_by("name")
+            (dg.pk, str(dg)) for dg in reference_data.get().dit_groups
         ]
 
     def clean_booking_date(self):
@@ -82,8 +123,84 @@ class BookingFormInitial(forms.Form):
 
         return booking_date
 
+    def clean_team_dit_emails(self):
+        """Return a list of unique, lower-cased email addresses."""
+
+        emails = []
+
+        for line in self.cleaned_data["team_dit_emails"].splitlines():
+            email = line.strip().lower()
+
+            if not email or email in emails:
+                continue
+
+            try:
+                validate_email(email)
+            except forms.ValidationError:
+                raise forms.ValidationError(f"'{email}' is not a valid email address")
+
+            emails.append(email)
+
+        return emails
+
+    def get_booking_dates(self) -> list:
+        """Get all the dates to book, taking the repeat fields into account."""
+
+        return get_recurring_dates(
+            self.cleaned_data["booking_date"],
+            [int(x) for x in self.cleaned_data.get("repeat_weekdays") or []],
+            self.cleaned_data.get("repeat_until"),
+        )
+
     def clean(self):
-        if self.for_myself:
+        booking_date = self.cleaned_data.get("booking_date")
+        repeat_weekdays = self.cleaned_data.get("repeat_weekdays")
+        repeat_until = self.cleaned_data.get("repeat_until")
+
+        if repeat_weekdays and not repeat_until:
+            self.add_error(
+                "repeat_until",
+                forms.ValidationError("Please enter when to repeat the booking until"),
+            )
+        elif booking_date and repeat_until:
+            if repeat_until < booking_date:
+                self.add_error(
+                    "repeat_until",
+                    forms.ValidationError("This must not be before the booking date"),
+                )
+            elif len(self.get_booking_dates()) > settings.BOOKING_MAX_DATES:
+                self.add_error(
+                    "repeat_until",
+                    forms.ValidationError(
+                        f"You can book at most {settings.BOOKING_MAX_DATES} days at once"
+                    ),
+                )
+
+        if self.for_team:
+            team_dit_emails = self.cleaned_data.get("team_dit_emails")
+
+            if repeat_weekdays:
+                self.add_error(
+                    "repeat_weekdays",
+                    forms.ValidationError("Team bookings can not be repeated"),
+                )
+
+            if team_dit_emails is None:
+                # already failed validation
+                pass
+            elif not team_dit_emails:
+                self.add_error(
+                    "team_dit_emails",
+                    forms.ValidationError("Please enter at least one email address"),
+                )
+            elif len(team_dit_emails) > settings.BOOKING_MAX_TEAM_SIZE:
+                self.add_error(
+                    "team_dit_emails",
+                    forms.ValidationError(
+                        f"You can book for at most {settings.BOOKING_MAX_TEAM_SIZE} people at once"
+                    ),
+                )
+        elif self.for_myself:
             if not self.cleaned_data.get("confirm_presentation"):
                 self.add_error(
                     "confirm_presentation", forms.ValidationError("This field is required.")
@@ -116,7 +233,7 @@ class BookingFormBusinessUnit(forms.Form):
         self.fields["business_unit"].widget.form_instance = self
 
         self.fields["business_unit"].choices = [
-            (x, x) for x in DitGroup.objects.get(pk=dit_group).get_business_units()
+            (x, x) for x in reference_data.get().get_dit_group(dit_group).get_business_units()
         ]
 
 
@@ -141,30 +258,51 @@ class BookingFormFinal(forms.Form):
         widget=GovUKCheckboxInput(),
     )
 
+    split_across_floors = forms.BooleanField(
+        required=False,
+        label="If there are not enough free desks on the selected floor, book the rest on other floors of the building",
+        widget=GovUKCheckboxInput(),
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.fields["floor"].widget.form_instance = self
         self.fields["confirmation"].widget.form_instance = self
+        self.fields["split_across_floors"].widget.form_instance = self
 
-    def populate_floors(self, booking_date: datetime.date, building: Building) -> None:
-        # key = floor id, value = Floor
-        floors = {f.pk: f for f in Floor.objects.filter(building=building).order_by("name")}
+    def populate_floors(self, booking_dates: list, building: Building) -> None:
+        floors = reference_data.get().get_floors(building)
 
-        for f in floors.values():
-            f.nr_of_bookings = 0
+        # key = (floor id, date), value = number of active bookings
+        nr_of_bookings = FloorDayOccupancy.get_for_building(building, booking_dates)
 
-        all_bookings = Booking.objects.filter(
-            booking_date=booking_date, building=building, is_active=True
-        )
+        choices = []
 
-        for b in all_bookings:
-            floors[b.floor.pk].nr_of_bookings += 1
+        for f in floors:
+            # when booking several days, show what's free on the busiest one
+            free_desks = min(
+                f.nr_of_desks - nr_of_bookings.get((f.pk, booking_date), 0)
+                for booking_date in booking_dates
+            )
 
-        self.fields["floor"].choices = [
-            (
-                f.pk,
-                f"{f.name}: {f.nr_of_desks - f.nr_of_bookings} free desks out of the {f.nr_of_desks} total desks",
+            choices.append(
+                (
+                    f.pk,
+                    f"{f.name}: {free_desks} free desks out of the {f.nr_of_desks} total desks"
+                    + (" on the busiest selected day" if len(booking_dates) > 1 else ""),
+                )
             )
-            for f in floors.values()
-        ]
+
+        self.fields["floor"].choices = choices
+
+
+class AvailabilityForm(forms.Form):
+    building = forms.ChoiceField(label="Building", widget=GovUKRadioSelect())
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.fields["building"].widget.form_instance = self
+
+        self.fields["building"].choices = [(b.pk, str(b)) for b in reference_data.get().buildings]
@@ -8,7 +8,8 @@ from django.urls import reverse
 
 from custom_usermodel.models import User
 
-from .models import PRA, DitGroup
+from . import reference_data
+from .models import PRA
 
 from .widgets import GovUKTextInput, GovUKRadioSelect, GovUKTextArea
 
@@ -35,7 +36,7 @@ class PRAFormInitial(forms.Form):
         self.fields["dit_group"].widget.form_instance = self
 
         self.fields["dit_group"].choices = [
-            (dg.pk, str(dg)) for dg in DitGroup.objects.all().order_by("name")
+            (dg.pk, str(dg)) for dg in reference_data.get().dit_groups
         ]
 
     def clean_staff_member_email(self):
@@ -80,7 +81,7 @@ class PRAFormBusinessUnit(forms.Form):
         self.fields["business_unit"].widget.form_instance = self
 
         self.fields["business_unit"].choices = [
-            (x, x) for x in DitGroup.objects.get(pk=dit_group).get_business_units()
+            (x, x) for x in reference_data.get().get_dit_group(dit_group).get_business_units()
         ]
 
 
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from main.models import FloorDayOccupancy
+
+
+class Command(BaseCommand):
+    help = "Recount the per-floor, per-day occupancy counters from the Booking table"
+
+    def handle(self, *args, **options):
+        nr_of_rows = FloorDayOccupancy.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f"Corrected {nr_of_rows} floor occupancy rows"))
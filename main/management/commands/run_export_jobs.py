@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.exports import delete_expired_export_jobs, run_pending_export_job
+
+
+class Command(BaseCommand):
+    help = "Write the CSV exports queued from the admin"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Write the exports that are currently queued and exit, instead of running forever",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            delete_expired_export_jobs()
+
+            job = run_pending_export_job()
+
+            if options["once"]:
+                if job is None:
+                    break
+            elif job is None:
+                time.sleep(settings.EXPORT_JOB_POLL_INTERVAL)
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.notifications import send_pending_notifications
+
+
+class Command(BaseCommand):
+    help = "Send queued GOV.UK Notify emails from the notification outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.NOTIFY_OUTBOX_CONCURRENCY,
+            help="Number of emails to send in parallel",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.NOTIFY_OUTBOX_BATCH_SIZE,
+            help="Number of emails to claim from the outbox at a time",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send what is currently due and exit, instead of running forever",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            nr_sent = send_pending_notifications(options["concurrency"], options["batch_size"])
+
+            if options["once"]:
+                if nr_sent == 0:
+                    break
+            elif nr_sent == 0:
+                time.sleep(settings.NOTIFY_OUTBOX_POLL_INTERVAL)
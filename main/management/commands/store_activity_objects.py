@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from main.activity_stream import store_queryset_objects
+from main.models import PRA, Booking
+
+
+class Command(BaseCommand):
+    help = "Store the activity stream objects of all bookings and PRAs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows to store at a time",
+        )
+        parser.add_argument(
+            "--missing",
+            action="store_true",
+            help="Only store them for rows that don't have one yet",
+        )
+
+    def handle(self, *args, **options):
+        for model in (Booking, PRA):
+            qs = model.objects.all()
+
+            if options["missing"]:
+                qs = qs.filter(activity_object_json__isnull=True)
+
+            nr_of_rows = store_queryset_objects(qs, options["batch_size"])
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Stored {nr_of_rows} {model._meta.verbose_name_plural} activity objects"
+                )
+            )
@@ -1,27 +1,95 @@
 import logging
+from bisect import bisect_right
 from ipaddress import ip_address, ip_network
 
 from django.conf import settings
 from django.http import HttpResponse
-from django.urls import resolve, reverse
+from django.urls import URLResolver, get_resolver, resolve, reverse
 from django.urls.exceptions import Resolver404
+from django.urls.resolvers import RoutePattern
+
+from custom_usermodel.models import memoize_get_by_email
+
+from .circuit_breaker import set_deadline
+from .wizard import WizardState
 
 logger = logging.getLogger(__name__)
 
 
-def _is_valid_ip(client_ip):
-    if not client_ip:
-        return False
+class _IpAllowList:
+    """settings.ALLOWED_IPS and ALLOWED_IP_RANGES, compiled for quick lookups.
+
+    The ranges are merged into sorted, non-overlapping [start, end] intervals of
+    integer addresses (one table per IP version) that are searched with bisect.
+    """
+
+    def __init__(self, ips: list, ranges: list):
+        self.ips = frozenset(ips)
+        self.intervals = {}
+
+        for version in (4, 6):
+            networks = sorted(
+                (int(n.network_address), int(n.broadcast_address))
+                for n in map(ip_network, ranges)
+                if n.version == version
+            )
+
+            starts, ends = [], []
+
+            for start, end in networks:
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
 
-    if client_ip in settings.ALLOWED_IPS:
-        return True
+            self.intervals[version] = (starts, ends)
 
-    ip_addr = ip_address(client_ip)
-    for cidr in settings.ALLOWED_IP_RANGES:
-        if ip_addr in ip_network(cidr):
+    def __contains__(self, client_ip) -> bool:
+        if not client_ip:
+            return False
+
+        if client_ip in self.ips:
             return True
 
-    return False
+        ip_addr = ip_address(client_ip)
+        starts, ends = self.intervals[ip_addr.version]
+
+        i = bisect_right(starts, int(ip_addr)) - 1
+
+        return i >= 0 and int(ip_addr) <= ends[i]
+
+
+def _get_app_prefixes(app_names: set, resolver=None, prefix="/", namespaces=()) -> tuple:
+    """Get the URL prefixes of the apps in app_names.
+
+    Returns None if that can't be worked out without resolving each path, e.g.
+    because the URLconf uses regular expressions or path converters on the way.
+    """
+
+    prefixes = []
+
+    for pattern in (resolver or get_resolver()).url_patterns:
+        if not isinstance(pattern, URLResolver):
+            continue
+
+        if not isinstance(pattern.pattern, RoutePattern) or pattern.pattern.converters:
+            return None
+
+        pattern_prefix = prefix + str(pattern.pattern)
+        pattern_namespaces = namespaces + ((pattern.app_name,) if pattern.app_name else ())
+
+        if ":".join(pattern_namespaces) in app_names:
+            prefixes.append(pattern_prefix)
+        else:
+            sub_prefixes = _get_app_prefixes(app_names, pattern, pattern_prefix, pattern_namespaces)
+
+            if sub_prefixes is None:
+                return None
+
+            prefixes += sub_prefixes
+
+    return tuple(prefixes)
 
 
 def _get_client_ip(request):
@@ -39,26 +107,78 @@ def _get_client_ip(request):
 
 
 def IpRestrictionMiddleware(get_response):
-    def middleware(request):
+    # settings don't change at runtime, so work out everything we can up front
+    allowed = _IpAllowList(settings.ALLOWED_IPS, settings.ALLOWED_IP_RANGES)
+
+    restricted_paths = frozenset(
+        reverse(path) for path in getattr(settings, "IP_RESTRICT_PATH_NAMES", [])
+    )
+
+    restricted_apps = set(settings.IP_RESTRICT_APPS)
+    restricted_app_prefixes = _get_app_prefixes(restricted_apps)
+
+    def is_restricted_app(path):
+        if restricted_app_prefixes is not None:
+            return path.startswith(restricted_app_prefixes)
 
         try:
-            app_name = resolve(request.path).app_name
+            return resolve(path).app_name in restricted_apps
         except Resolver404:
-            app_name = None
-
-        restricted_paths = [
-            reverse(path) for path in getattr(settings, "IP_RESTRICT_PATH_NAMES", [])
-        ]
+            return False
 
+    def middleware(request):
         if (
             settings.IP_RESTRICT
-            and app_name in settings.IP_RESTRICT_APPS
+            and is_restricted_app(request.path)
             or request.path in restricted_paths
         ):
             client_ip = _get_client_ip(request)
-            if not _is_valid_ip(client_ip):
+            if client_ip not in allowed:
                 return HttpResponse("Unauthorized", status=401)
 
         return get_response(request)
 
     return middleware
+
+
+def RequestDeadlineMiddleware(get_response):
+    """Give outbound calls (Notify, staff-sso) made while handling a request a total
+    time budget of settings.REQUEST_DEADLINE seconds."""
+
+    def middleware(request):
+        set_deadline(settings.REQUEST_DEADLINE)
+
+        try:
+            return get_response(request)
+        finally:
+            set_deadline(None)
+
+    return middleware
+
+
+def UserLookupMemoMiddleware(get_response):
+    """Let the User.get_by_email() lookups made while handling a request share their
+    results (the PRA views look up the same people several times)."""
+
+    def middleware(request):
+        with memoize_get_by_email():
+            return get_response(request)
+
+    return middleware
+
+
+def WizardStateMiddleware(get_response):
+    """Give requests a request.wizard with the state of the booking and PRA flows
+    (see .wizard.WizardState), and save it if it was changed."""
+
+    def middleware(request):
+        request.wizard = WizardState(request)
+
+        response = get_response(request)
+
+        if request.wizard.modified:
+            request.wizard.save(response)
+
+        return response
+
+    return middleware
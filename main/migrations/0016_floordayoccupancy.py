@@ -0,0 +1,63 @@
+# Generated by Django 3.2.16 on 2026-10-18 07:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_occupancy(apps, schema_editor):
+    Booking = apps.get_model("main", "Booking")
+    FloorDayOccupancy = apps.get_model("main", "FloorDayOccupancy")
+
+    counts = (
+        Booking.objects.filter(is_active=True)
+        .values("floor_id", "booking_date")
+        .annotate(nr_of_bookings=models.Count("id"))
+        .order_by()
+    )
+
+    FloorDayOccupancy.objects.bulk_create(
+        [
+            FloorDayOccupancy(
+                floor_id=c["floor_id"],
+                booking_date=c["booking_date"],
+                nr_of_bookings=c["nr_of_bookings"],
+            )
+            for c in counts
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0015_pra_verbose"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FloorDayOccupancy",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("booking_date", models.DateField()),
+                ("nr_of_bookings", models.PositiveIntegerField(default=0)),
+                (
+                    "floor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="main.floor",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("floor", "booking_date")},
+            },
+        ),
+        migrations.RunPython(populate_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.16 on 2026-10-18 07:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0016_floordayoccupancy"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationOutbox",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("pending", "Pending"), ("sent", "Sent"), ("failed", "Failed")],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("email_address", models.CharField(max_length=254)),
+                ("template_id", models.CharField(max_length=80)),
+                ("personalisation", models.JSONField(default=dict)),
+                ("nr_of_attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("created_timestamp", models.DateTimeField(auto_now_add=True)),
+                ("next_attempt_timestamp", models.DateTimeField(default=django.utils.timezone.now)),
+                ("sent_timestamp", models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="notificationoutbox",
+            index=models.Index(
+                condition=models.Q(("status", "pending")),
+                fields=["next_attempt_timestamp"],
+                name="main_outbox_pending_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.16 on 2026-10-18 07:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0017_notificationoutbox"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(fields=["booked_timestamp", "id"], name="main_booking_feed_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pra",
+            index=models.Index(fields=["created_timestamp", "id"], name="main_pra_feed_idx"),
+        ),
+    ]
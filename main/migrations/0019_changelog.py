@@ -0,0 +1,61 @@
+# Generated by Django 3.2.16 on 2026-10-18 07:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0018_activity_stream_feed_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLog",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("created", "Created"),
+                            ("cancelled", "Cancelled"),
+                            ("staff_member_approval", "Staff member approval"),
+                            ("scs_approval", "SCS approval"),
+                            ("updated", "Updated"),
+                        ],
+                        max_length=30,
+                    ),
+                ),
+                ("timestamp", models.DateTimeField(auto_now_add=True)),
+                (
+                    "booking",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="main.booking",
+                    ),
+                ),
+                (
+                    "pra",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="main.pra",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(fields=["timestamp", "id"], name="main_changelog_feed_idx"),
+        ),
+    ]
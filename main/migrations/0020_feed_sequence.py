@@ -0,0 +1,79 @@
+# Generated by Django 3.2.16 on 2026-10-18 07:18
+
+from django.db import migrations, models
+
+
+def populate_feed_sequence(apps, schema_editor):
+    """Number existing rows in the order the activity stream feeds used to page
+    through them, so old (timestamp, id) cursors can be translated."""
+
+    FeedSequence = apps.get_model("main", "FeedSequence")
+
+    value = 0
+
+    for model_name, timestamp_field in [
+        ("Booking", "booked_timestamp"),
+        ("PRA", "created_timestamp"),
+        ("ChangeLog", "timestamp"),
+    ]:
+        Model = apps.get_model("main", model_name)
+
+        rows = list(Model.objects.order_by(timestamp_field, "id").only("id"))
+
+        for row in rows:
+            value += 1
+            row.feed_sequence = value
+
+        Model.objects.bulk_update(rows, ["feed_sequence"], batch_size=1000)
+
+    FeedSequence.objects.create(pk=1, value=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0019_changelog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedSequence",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("value", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name="booking",
+            name="main_booking_feed_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="changelog",
+            name="main_changelog_feed_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="pra",
+            name="main_pra_feed_idx",
+        ),
+        migrations.AddField(
+            model_name="booking",
+            name="feed_sequence",
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name="changelog",
+            name="feed_sequence",
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name="pra",
+            name="feed_sequence",
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(populate_feed_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.16 on 2026-10-18 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0020_feed_sequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="booking",
+            name="activity_object_json",
+            field=models.TextField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="pra",
+            name="activity_object_json",
+            field=models.TextField(editable=False, null=True),
+        ),
+    ]
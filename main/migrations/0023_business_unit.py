@@ -0,0 +1,122 @@
+# Generated by Django 3.2.16 on 2026-10-18 07:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import main.models
+
+
+def copy_business_units(apps, schema_editor):
+    DitGroup = apps.get_model("main", "DitGroup")
+    BusinessUnit = apps.get_model("main", "BusinessUnit")
+    Booking = apps.get_model("main", "Booking")
+    PRA = apps.get_model("main", "PRA")
+
+    for dit_group in DitGroup.objects.all():
+        names = [x.strip() for x in (dit_group.business_units or "").split("\n") if x.strip()]
+
+        # the forms offered "Unknown" for groups without any
+        BusinessUnit.objects.bulk_create(
+            BusinessUnit(dit_group=dit_group, name=name)
+            for name in dict.fromkeys(names or ["Unknown"])
+        )
+
+    for business_unit in BusinessUnit.objects.select_related("dit_group"):
+        for model in (Booking, PRA):
+            model.objects.filter(
+                group=business_unit.dit_group.name, business_unit=business_unit.name
+            ).update(business_unit_ref=business_unit)
+
+
+def copy_business_units_back(apps, schema_editor):
+    DitGroup = apps.get_model("main", "DitGroup")
+    BusinessUnit = apps.get_model("main", "BusinessUnit")
+
+    for dit_group in DitGroup.objects.all():
+        dit_group.business_units = "\n".join(
+            BusinessUnit.objects.filter(dit_group=dit_group)
+            .order_by("pk")
+            .values_list("name", flat=True)
+        )
+        dit_group.save(update_fields=["business_units"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0022_reference_data_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BusinessUnit",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("name", models.CharField(max_length=80)),
+                (
+                    "dit_group",
+                    # DitGroup.business_units is still the text field until it's copied
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="main.ditgroup",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["pk"],
+                "unique_together": {("dit_group", "name")},
+            },
+        ),
+        migrations.AddField(
+            model_name="booking",
+            name="business_unit_ref",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="main.businessunit",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pra",
+            name="business_unit_ref",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="main.businessunit",
+            ),
+        ),
+        migrations.RunPython(copy_business_units, copy_business_units_back),
+        # only so that the column can be added back when this is reversed (before
+        # copy_business_units_back fills it in): it's NOT NULL
+        migrations.AlterField(
+            model_name="ditgroup",
+            name="business_units",
+            field=models.TextField(
+                default="",
+                help_text="One business unit per line",
+                validators=[main.models.validate_business_units],
+            ),
+        ),
+        migrations.RemoveField(
+            model_name="ditgroup",
+            name="business_units",
+        ),
+        migrations.AlterField(
+            model_name="businessunit",
+            name="dit_group",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="business_units",
+                to="main.ditgroup",
+            ),
+        ),
+    ]
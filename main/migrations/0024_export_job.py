@@ -0,0 +1,65 @@
+# Generated by Django 3.2.16 on 2026-10-18 07:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("main", "0023_business_unit"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportJob",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("bookings", "Bookings"), ("pras", "PRAs")], max_length=10
+                    ),
+                ),
+                ("gzipped", models.BooleanField(default=False)),
+                ("query", models.BinaryField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("nr_of_rows", models.PositiveIntegerField(default=0)),
+                ("nr_of_rows_done", models.PositiveIntegerField(default=0)),
+                ("file", models.FileField(blank=True, upload_to="exports/")),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("created_timestamp", models.DateTimeField(auto_now_add=True)),
+                ("updated_timestamp", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finished_timestamp", models.DateTimeField(null=True)),
+                (
+                    "requested_by",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
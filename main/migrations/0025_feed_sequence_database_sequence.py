@@ -0,0 +1,33 @@
+# Generated by Django 3.2.16 on 2026-10-18 08:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0024_export_job"),
+    ]
+
+    operations = [
+        # carry on from where the FeedSequence counter got to
+        migrations.RunSQL(
+            """
+            CREATE SEQUENCE main_feed_sequence;
+            SELECT setval(
+                'main_feed_sequence',
+                COALESCE((SELECT value FROM main_feedsequence WHERE id = 1), 0) + 1,
+                false
+            );
+            """,
+            """
+            INSERT INTO main_feedsequence (id, value)
+            SELECT 1, CASE WHEN is_called THEN last_value ELSE last_value - 1 END
+            FROM main_feed_sequence;
+            DROP SEQUENCE main_feed_sequence;
+            """,
+        ),
+        migrations.DeleteModel(
+            name="FeedSequence",
+        ),
+    ]
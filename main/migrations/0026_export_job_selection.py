@@ -0,0 +1,39 @@
+# Generated by Django 3.2.16 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def fail_unfinished_jobs(apps, schema_editor):
+    ExportJob = apps.get_model("main", "ExportJob")
+
+    # their pickled queries are gone
+    ExportJob.objects.filter(status__in=["pending", "running"]).update(
+        status="failed", last_error="Queued before an upgrade, please queue it again"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0025_feed_sequence_database_sequence"),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_unfinished_jobs, migrations.RunPython.noop),
+        # only so that the column can be added back when this is reversed
+        migrations.AlterField(
+            model_name="exportjob",
+            name="query",
+            field=models.BinaryField(default=b""),
+        ),
+        migrations.RemoveField(
+            model_name="exportjob",
+            name="query",
+        ),
+        migrations.AddField(
+            model_name="exportjob",
+            name="selection",
+            field=models.JSONField(default=dict),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.16 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0026_export_job_selection"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE SEQUENCE main_activity_object_version",
+            "DROP SEQUENCE main_activity_object_version",
+        ),
+        migrations.AddField(
+            model_name="booking",
+            name="activity_object_version",
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="pra",
+            name="activity_object_version",
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fail_finished_jobs(apps, schema_editor):
+    ExportJob = apps.get_model("main", "ExportJob")
+
+    # their files were on the disk of whichever instance wrote them
+    ExportJob.objects.filter(status="done").update(
+        status="failed", last_error="Written before an upgrade, please queue it again"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0027_activity_object_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_finished_jobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="exportjob",
+            name="file",
+        ),
+        migrations.CreateModel(
+            name="ExportFileChunk",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("index", models.PositiveIntegerField()),
+                ("data", models.BinaryField()),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="main.exportjob",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("job", "index")},
+            },
+        ),
+    ]
@@ -1,8 +1,11 @@
 import datetime
+import uuid
+from typing import Optional
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 
 def validate_business_units(value):
@@ -19,21 +22,13 @@ class DitGroup(models.Model):
 
     name = models.CharField(max_length=80, unique=True)
 
-    business_units = models.TextField(
-        help_text="One business unit per line", validators=[validate_business_units]
-    )
-
     def __str__(self):
         return self.name
 
     def get_business_units(self):
-        """Get a list of business units for this group."""
+        """Get a list of the names of the business units in this group."""
 
-        business_units = (
-            [x.strip() for x in self.business_units.strip().split("\n") if x.strip()]
-            if self.business_units
-            else []
-        )
+        business_units = [bu.name for bu in self.business_units.all()]
 
         if not business_units:
             # should not happen, but let's not fall over if it does
@@ -41,6 +36,28 @@ class DitGroup(models.Model):
 
         return business_units
 
+    def get_business_unit(self, name):
+        """Get the business unit in this group called name, or None."""
+
+        for business_unit in self.business_units.all():
+            if business_unit.name == name:
+                return business_unit
+
+        return None
+
+
+class BusinessUnit(models.Model):
+    class Meta:
+        unique_together = [["dit_group", "name"]]
+        # the order they were added in
+        ordering = ["pk"]
+
+    dit_group = models.ForeignKey(DitGroup, models.CASCADE, related_name="business_units")
+    name = models.CharField(max_length=80)
+
+    def __str__(self):
+        return self.name
+
 
 class Building(models.Model):
     name = models.CharField(max_length=80, unique=True)
@@ -61,7 +78,55 @@ class Floor(models.Model):
         return self.name
 
 
-class Booking(models.Model):
+class ReferenceDataVersion(models.Model):
+    """Single row that changes whenever a Building, Floor or DitGroup does, so that
+    every process can tell when its copy of them in main.reference_data is out of
+    date."""
+
+    version = models.UUIDField(default=uuid.uuid4)
+
+    @classmethod
+    def get(cls) -> Optional[uuid.UUID]:
+        return cls.objects.filter(pk=1).values_list("version", flat=True).first()
+
+    @classmethod
+    def bump(cls) -> None:
+        # a new random version rather than a counter, so that the version of a
+        # rolled back change is never reused
+        cls.objects.update_or_create(pk=1, defaults={"version": uuid.uuid4()})
+
+
+class FeedSequenceMixin(models.Model):
+    """Gives rows the feed_sequence number that the activity stream feeds page on.
+
+    Rows are written without one, so that writers don't have to wait for each
+    other, and numbered by the feeds once they are committed (see
+    activity_stream.assign_feed_sequences).
+    """
+
+    class Meta:
+        abstract = True
+
+    feed_sequence = models.BigIntegerField(unique=True, null=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        # only assign_feed_sequences writes feed_sequence, don't put back the value
+        # this instance was loaded with (which may be from before it was numbered)
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            kwargs["update_fields"] = [
+                f.name
+                for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != "feed_sequence"
+            ]
+
+        return super().save(*args, **kwargs)
+
+
+class Booking(FeedSequenceMixin, models.Model):
     # becomes False if booking is canceled
     is_active = models.BooleanField(default=True)
 
@@ -86,10 +151,22 @@ class Booking(models.Model):
     # new bookings
     group = models.CharField(max_length=80, blank=True, null=True)
     business_unit = models.CharField(max_length=80, blank=True, null=True)
+    # the BusinessUnit that business_unit was picked from, for reporting; the text
+    # is kept as it was when booked, even if the unit is renamed or removed later
+    business_unit_ref = models.ForeignKey(
+        BusinessUnit, models.SET_NULL, blank=True, null=True, related_name="+"
+    )
 
     booked_timestamp = models.DateTimeField(auto_now_add=True)
     canceled_timestamp = models.DateTimeField(null=True)
 
+    # the activity stream object, serialised whenever the booking changes, so that
+    # the feeds don't have to (see activity_stream.store_objects)
+    activity_object_json = models.TextField(null=True, editable=False)
+    # goes up every time activity_object_json is stored, so that cached feed pages
+    # can tell that it changed (see activity_stream.get_version)
+    activity_object_version = models.BigIntegerField(default=0, editable=False)
+
     def get_on_behalf_of(self):
         """Return a string describing who the booking is on behalf of. It will be one of:
 
@@ -111,7 +188,264 @@ class Booking(models.Model):
             return "Yourself"
 
 
-class PRA(models.Model):
+class FloorDayOccupancy(models.Model):
+    """Number of active bookings for a floor on a given day.
+
+    This is updated in the same transaction as the bookings themselves, so that
+    capacity checks and the floor choices don't have to count Booking rows. If
+    it ever drifts (e.g. bookings edited in the admin), it can be rebuilt with
+    the rebuild_floor_occupancy management command.
+    """
+
+    class Meta:
+        unique_together = [["floor", "booking_date"]]
+
+    floor = models.ForeignKey(Floor, on_delete=models.CASCADE, related_name="+")
+    booking_date = models.DateField()
+    nr_of_bookings = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def get_nr_of_bookings(cls, floor_id: int, booking_date: datetime.date) -> int:
+        """Get the number of active bookings for a floor on a given day."""
+
+        occupancy = cls.objects.filter(floor_id=floor_id, booking_date=booking_date).first()
+
+        return occupancy.nr_of_bookings if occupancy else 0
+
+    @classmethod
+    def get_for_building(cls, building: Building, booking_dates: list) -> dict:
+        """Get the number of active bookings for each floor of a building on the given days.
+
+        Returns a dict, key = (floor id, date), value = number of bookings. Floors
+        without any bookings on a day are not included.
+        """
+
+        return {
+            (floor_id, booking_date): nr_of_bookings
+            for floor_id, booking_date, nr_of_bookings in cls.objects.filter(
+                floor__building=building, booking_date__in=booking_dates
+            ).values_list("floor_id", "booking_date", "nr_of_bookings")
+        }
+
+    @classmethod
+    def lock(
+        cls, floor_id: int, booking_date: datetime.date, nowait: bool = False
+    ) -> "FloorDayOccupancy":
+        """Lock the counter row for a floor on a given day, creating it first if needed.
+
+        This is what serialises bookings: only bookings for the same floor on the
+        same day wait for each other. Must be called inside a transaction.
+        """
+
+        return cls.lock_many([(floor_id, booking_date)], nowait=nowait)[(floor_id, booking_date)]
+
+    @classmethod
+    def lock_many(cls, keys: list, nowait: bool = False) -> dict:
+        """Lock the counter rows for several (floor id, date) pairs at once, creating
+        them first if needed. Must be called inside a transaction.
+
+        Returns a dict, key = (floor id, date), value = FloorDayOccupancy.
+        """
+
+        keys = sorted(set(keys))
+
+        # create the rows that don't exist yet, without failing if a concurrent
+        # transaction beats us to it
+        cls.objects.bulk_create(
+            [cls(floor_id=floor_id, booking_date=booking_date) for floor_id, booking_date in keys],
+            ignore_conflicts=True,
+        )
+
+        query = models.Q()
+
+        for floor_id, booking_date in keys:
+            query |= models.Q(floor_id=floor_id, booking_date=booking_date)
+
+        # always lock in the same order, so that overlapping batches can't deadlock
+        return {
+            (o.floor_id, o.booking_date): o
+            for o in cls.objects.select_for_update(nowait=nowait)
+            .filter(query)
+            .order_by("floor_id", "booking_date")
+        }
+
+    def adjust(self, delta: int) -> None:
+        """Adjust the number of bookings by delta (which can be negative). The row
+        must have been locked with lock() in the current transaction."""
+
+        self.nr_of_bookings += delta
+        self.save(update_fields=["nr_of_bookings"])
+
+    @classmethod
+    def add_bookings(cls, floor_id: int, booking_date: datetime.date, delta: int) -> None:
+        """Lock the counter for a floor on a given day and adjust it by delta. Should
+        be called in the same transaction as the booking change itself."""
+
+        with transaction.atomic(savepoint=False):
+            cls.lock(floor_id, booking_date).adjust(delta)
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Recount every counter from Booking. Returns the number of rows corrected.
+
+        Each (floor, day) is locked and recounted in its own short transaction, so
+        this can run while people are making bookings.
+        """
+
+        keys = set(
+            Booking.objects.filter(is_active=True)
+            .values_list("floor_id", "booking_date")
+            .distinct()
+        )
+        keys.update(cls.objects.values_list("floor_id", "booking_date"))
+
+        corrected = 0
+
+        for floor_id, booking_date in sorted(keys):
+            with transaction.atomic():
+                occupancy = cls.lock(floor_id, booking_date)
+
+                nr_of_bookings = Booking.objects.filter(
+                    is_active=True, floor_id=floor_id, booking_date=booking_date
+                ).count()
+
+                if occupancy.nr_of_bookings != nr_of_bookings:
+                    occupancy.adjust(nr_of_bookings - occupancy.nr_of_bookings)
+                    corrected += 1
+
+        return corrected
+
+
+class NotificationOutbox(models.Model):
+    """GOV.UK Notify email waiting to be sent.
+
+    Rows are written in the same transaction as the change that causes the email,
+    and sent by the send_notifications management command. That way requests don't
+    wait for Notify, and no email is sent for a change that was rolled back.
+    """
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_attempt_timestamp"],
+                name="main_outbox_pending_idx",
+                condition=models.Q(status="pending"),
+            )
+        ]
+
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    email_address = models.CharField(max_length=254)
+    template_id = models.CharField(max_length=80)
+    personalisation = models.JSONField(default=dict)
+
+    nr_of_attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+
+    created_timestamp = models.DateTimeField(auto_now_add=True)
+    next_attempt_timestamp = models.DateTimeField(default=timezone.now)
+    sent_timestamp = models.DateTimeField(null=True)
+
+    @classmethod
+    def queue(
+        cls, email_address: str, template_id: str, personalisation: dict
+    ) -> "NotificationOutbox":
+        return cls.objects.create(
+            email_address=email_address,
+            template_id=template_id,
+            personalisation=personalisation,
+        )
+
+
+class ExportJob(models.Model):
+    """CSV export queued from the admin, for exports too big to download directly.
+
+    Written by the run_export_jobs management command to ExportFileChunk rows, so
+    that it can be downloaded from the ExportJob admin of any instance once it's
+    done. Deleted, file and all, EXPORT_JOB_KEEP_DAYS days after that.
+    """
+
+    KIND_BOOKINGS = "bookings"
+    KIND_PRAS = "pras"
+
+    KIND_CHOICES = [
+        (KIND_BOOKINGS, "Bookings"),
+        (KIND_PRAS, "PRAs"),
+    ]
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    gzipped = models.BooleanField(default=False)
+
+    # which rows to export: {"pks": [...]} for rows selected in the changelist, or
+    # {"changelist_params": {...}} for everything it showed with those filters and
+    # search (see exports.export_queryset)
+    selection = models.JSONField()
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    nr_of_rows = models.PositiveIntegerField(default=0)
+    nr_of_rows_done = models.PositiveIntegerField(default=0)
+
+    last_error = models.TextField(blank=True, default="")
+
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, models.SET_NULL, null=True, related_name="+"
+    )
+
+    created_timestamp = models.DateTimeField(auto_now_add=True)
+    # set whenever a worker makes progress, so that jobs of workers that died can
+    # be picked up again (see exports.run_pending_export_job)
+    updated_timestamp = models.DateTimeField(default=timezone.now)
+    finished_timestamp = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} export {self.pk}"
+
+    def progress(self) -> str:
+        if not self.nr_of_rows:
+            return "-"
+
+        return f"{100 * self.nr_of_rows_done // self.nr_of_rows}%"
+
+
+class ExportFileChunk(models.Model):
+    """EXPORT_FILE_CHUNK_SIZE bytes of the file of an ExportJob.
+
+    Files are kept in the database rather than on disk, because each Cloud Foundry
+    instance has a disk of its own, which is wiped when it's restaged.
+    """
+
+    class Meta:
+        unique_together = [["job", "index"]]
+
+    job = models.ForeignKey(ExportJob, on_delete=models.CASCADE, related_name="chunks")
+    index = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+
+class PRA(FeedSequenceMixin, models.Model):
     """Personal risk assessment form."""
 
     class Meta:
@@ -172,6 +506,9 @@ class PRA(models.Model):
     # these are identical to the ones in Booking and come from DitGroup
     group = models.CharField(max_length=80, blank=True, null=True)
     business_unit = models.CharField(max_length=80, blank=True, null=True)
+    business_unit_ref = models.ForeignKey(
+        BusinessUnit, models.SET_NULL, blank=True, null=True, related_name="+"
+    )
 
     risk_category = models.CharField(max_length=80)
 
@@ -189,6 +526,10 @@ class PRA(models.Model):
     # was this record migrated from the legacy system?
     migrated = models.BooleanField()
 
+    # see Booking.activity_object_json
+    activity_object_json = models.TextField(null=True, editable=False)
+    activity_object_version = models.BigIntegerField(default=0, editable=False)
+
     def risk_category_desc(self):
         return self.RC_MAPPING[self.risk_category]
 
@@ -248,3 +589,52 @@ class PRA(models.Model):
             return "Expired"
         else:
             return str(left)
+
+
+class ChangeLog(FeedSequenceMixin, models.Model):
+    """Append-only log of Booking and PRA state changes.
+
+    A row is written in the same transaction as each change, and the activity
+    stream change feeds page through them, so consumers see cancellations and
+    approvals without re-crawling whole tables.
+    """
+
+    ACTION_CREATED = "created"
+    ACTION_CANCELLED = "cancelled"
+    ACTION_STAFF_MEMBER_APPROVAL = "staff_member_approval"
+    ACTION_SCS_APPROVAL = "scs_approval"
+    ACTION_UPDATED = "updated"
+
+    ACTION_CHOICES = [
+        (ACTION_CREATED, "Created"),
+        (ACTION_CANCELLED, "Cancelled"),
+        (ACTION_STAFF_MEMBER_APPROVAL, "Staff member approval"),
+        (ACTION_SCS_APPROVAL, "SCS approval"),
+        (ACTION_UPDATED, "Updated"),
+    ]
+
+    # exactly one of these is set
+    booking = models.ForeignKey(Booking, models.CASCADE, null=True, related_name="+")
+    pra = models.ForeignKey(PRA, models.CASCADE, null=True, related_name="+")
+
+    action = models.CharField(max_length=30, choices=ACTION_CHOICES)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def record(cls, obj, action: str) -> "ChangeLog":
+        return cls.record_many([obj], action)[0]
+
+    @classmethod
+    def record_many(cls, objs: list, action: str) -> list:
+        """Record that action was done to objs (which must be saved already)."""
+
+        return cls.objects.bulk_create(
+            [
+                cls(
+                    booking=obj if isinstance(obj, Booking) else None,
+                    pra=obj if isinstance(obj, PRA) else None,
+                    action=action,
+                )
+                for obj in objs
+            ]
+        )
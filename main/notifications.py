@@ -0,0 +1,200 @@
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from notifications_python_client.errors import HTTPError
+from notifications_python_client.notifications import NotificationsAPIClient
+
+from .circuit_breaker import CircuitOpenError, get_breaker, get_timeout
+from .models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class PooledNotificationsAPIClient(NotificationsAPIClient):
+    """NotificationsAPIClient that sends requests over a shared requests.Session, so
+    that connections to Notify are kept alive and reused instead of doing a new TLS
+    handshake for every email."""
+
+    def __init__(self, api_key, session, **kwargs):
+        super().__init__(api_key, **kwargs)
+
+        self.session = session
+
+    def _perform_request(self, method, url, kwargs):
+        connect_timeout, read_timeout = kwargs["timeout"]
+        kwargs["timeout"] = (get_timeout(connect_timeout), get_timeout(read_timeout))
+
+        try:
+            response = self.session.request(method, url, **kwargs)
+            response.raise_for_status()
+
+            return response
+        except requests.RequestException as e:
+            raise HTTPError.create(e)
+
+
+def get_client() -> PooledNotificationsAPIClient:
+    """Get the process-wide Notify client. It is safe to share between threads."""
+
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.NOTIFY_POOL_SIZE)
+
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+
+                _client = PooledNotificationsAPIClient(
+                    settings.GOVUK_NOTIFY_API_KEY,
+                    session,
+                    timeout=(settings.NOTIFY_CONNECT_TIMEOUT, settings.NOTIFY_READ_TIMEOUT),
+                )
+
+    return _client
+
+
+def send(template_id: str, email_address: str, personalisation: dict) -> None:
+    """Send an email through GOV.UK Notify right away.
+
+    Views should use NotificationOutbox.queue() instead, so that the email is only
+    sent if their transaction commits and the request doesn't wait for Notify.
+    """
+
+    get_breaker("notify").call(
+        lambda: get_client().send_email_notification(
+            email_address=email_address,
+            template_id=template_id,
+            personalisation=personalisation,
+        ),
+        is_failure=lambda e: not is_permanent_error(e),
+    )
+
+
+def is_permanent_error(e: Exception) -> bool:
+    """Whether retrying a Notify call that failed with e is pointless. 4xx errors
+    (apart from rate limiting) are our fault, not Notify's."""
+
+    return isinstance(e, HTTPError) and 400 <= e.status_code < 500 and e.status_code != 429
+
+
+def fan_out(func: Callable, items: Iterable, concurrency: int) -> Iterator[tuple]:
+    """Call func(item) for each item, up to concurrency at a time.
+
+    This is meant for sending notifications in bulk: func must not use the
+    database, as the threads don't have connections of their own.
+
+    Yields a (result, exception) tuple per item, in the same order as items, as
+    soon as that item (and all the ones before it) are done. Exactly one of the
+    two is None, unless func itself returned None.
+    """
+
+    def call(item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        yield from executor.map(call, items)
+
+
+def send_pending_notifications(concurrency: int, batch_size: int) -> int:
+    """Send a batch of due emails from the outbox, up to concurrency at a time.
+
+    Safe to run in several processes at once: each batch is claimed with
+    SKIP LOCKED and leased for NOTIFY_OUTBOX_LEASE seconds, so workers don't
+    send the same email twice unless one of them dies mid-batch.
+
+    Returns the number of emails processed (sent or not).
+    """
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        batch = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=NotificationOutbox.STATUS_PENDING, next_attempt_timestamp__lte=now)
+            .order_by("next_attempt_timestamp")[:batch_size]
+        )
+
+        NotificationOutbox.objects.filter(pk__in=[n.pk for n in batch]).update(
+            next_attempt_timestamp=now + datetime.timedelta(seconds=settings.NOTIFY_OUTBOX_LEASE)
+        )
+
+    if not batch:
+        return 0
+
+    results = fan_out(
+        lambda n: send(n.template_id, n.email_address, n.personalisation), batch, concurrency
+    )
+
+    for notification, (_, error) in zip(batch, results):
+        _record_attempt(notification, error)
+
+    return len(batch)
+
+
+def _record_attempt(notification: NotificationOutbox, error) -> None:
+    if isinstance(error, CircuitOpenError):
+        # Notify is down and we didn't even try, so don't count it as an attempt
+        notification.next_attempt_timestamp = timezone.now() + datetime.timedelta(
+            seconds=get_breaker("notify").reset_timeout
+        )
+        notification.save(update_fields=["next_attempt_timestamp"])
+
+        return
+
+    notification.nr_of_attempts += 1
+
+    if error is None:
+        notification.status = NotificationOutbox.STATUS_SENT
+        notification.sent_timestamp = timezone.now()
+        notification.last_error = ""
+    else:
+        notification.last_error = repr(error)
+
+        if (
+            is_permanent_error(error)
+            or notification.nr_of_attempts >= settings.NOTIFY_OUTBOX_MAX_ATTEMPTS
+        ):
+            notification.status = NotificationOutbox.STATUS_FAILED
+
+            logger.error(
+                "Giving up on notification %s after %s attempts: %s",
+                notification.pk,
+                notification.nr_of_attempts,
+                notification.last_error,
+            )
+        else:
+            delay = min(
+                settings.NOTIFY_OUTBOX_RETRY_DELAY * 2 ** (notification.nr_of_attempts - 1),
+                settings.NOTIFY_OUTBOX_MAX_RETRY_DELAY,
+            )
+
+            notification.next_attempt_timestamp = timezone.now() + datetime.timedelta(seconds=delay)
+
+    notification.save(
+        update_fields=[
+            "status",
+            "nr_of_attempts",
+            "last_error",
+            "next_attempt_timestamp",
+            "sent_timestamp",
+        ]
+    )
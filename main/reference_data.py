@@ -0,0 +1,113 @@
+import time
+from typing import Callable
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404
+
+from .models import Building, DitGroup, Floor, ReferenceDataVersion
+
+_data = None
+
+
+class ReferenceData:
+    """The buildings, floors and DIT groups (with their business units), as of
+    ReferenceDataVersion version.
+
+    The model instances are shared by every request a process handles, so don't
+    change them.
+    """
+
+    def __init__(self, version, buildings: list, floors: list, dit_groups: list):
+        self.version = version
+        self.checked_at = time.monotonic()
+
+        # ordered by name
+        self.buildings = buildings
+        self.dit_groups = dit_groups
+
+        self._buildings = {b.pk: b for b in buildings}
+        self._floors = {f.pk: f for f in floors}
+        self._dit_groups = {dg.pk: dg for dg in dit_groups}
+
+        self._floors_by_building = {}
+
+        for f in floors:
+            self._floors_by_building.setdefault(f.building_id, []).append(f)
+
+    def get_building(self, pk) -> Building:
+        try:
+            return self._buildings[int(pk)]
+        except KeyError:
+            raise Building.DoesNotExist(f"Building {pk} does not exist")
+
+    def get_floor(self, pk) -> Floor:
+        try:
+            return self._floors[int(pk)]
+        except KeyError:
+            raise Floor.DoesNotExist(f"Floor {pk} does not exist")
+
+    def get_floors(self, building: Building) -> list:
+        """The floors of building, ordered by name."""
+
+        return self._floors_by_building.get(building.pk, [])
+
+    def get_dit_group(self, pk) -> DitGroup:
+        try:
+            return self._dit_groups[int(pk)]
+        except KeyError:
+            raise DitGroup.DoesNotExist(f"DitGroup {pk} does not exist")
+
+
+def get() -> ReferenceData:
+    """Get the buildings, floors and DIT groups.
+
+    They change a few times a year, so each process keeps a copy. The copy is
+    dropped when they are changed (see .signals), and every
+    REFERENCE_DATA_CHECK_INTERVAL seconds it is checked against
+    ReferenceDataVersion, so that other processes notice changes too.
+    """
+
+    global _data
+
+    data = _data
+
+    if (
+        data is not None
+        and time.monotonic() - data.checked_at < settings.REFERENCE_DATA_CHECK_INTERVAL
+    ):
+        return data
+
+    version = ReferenceDataVersion.get()
+
+    if data is not None and data.version == version:
+        data.checked_at = time.monotonic()
+
+        return data
+
+    _data = ReferenceData(
+        version,
+        list(Building.objects.order_by("name")),
+        list(Floor.objects.select_related("building").order_by("name")),
+        list(DitGroup.objects.prefetch_related("business_units").order_by("name")),
+    )
+
+    return _data
+
+
+def get_or_404(getter: Callable, pk):
+    """getter(pk), e.g. get().get_building(pk), or a 404 if there is no such thing
+    (like get_object_or_404)."""
+
+    try:
+        return getter(pk)
+    except ObjectDoesNotExist as e:
+        raise Http404(str(e))
+
+
+def invalidate() -> None:
+    """Drop this process's copy of the reference data."""
+
+    global _data
+
+    _data = None
@@ -0,0 +1,39 @@
+import datetime
+import json
+
+
+class _Encoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return {"__datetime__": o.isoformat()}
+
+        if isinstance(o, datetime.date):
+            return {"__date__": o.isoformat()}
+
+        return super().default(o)
+
+
+def _decode(obj: dict):
+    if len(obj) == 1:
+        if "__date__" in obj:
+            return datetime.date.fromisoformat(obj["__date__"])
+
+        if "__datetime__" in obj:
+            return datetime.datetime.fromisoformat(obj["__datetime__"])
+
+    return obj
+
+
+class JSONSerializer:
+    """Compact JSON that round-trips dates and datetimes.
+
+    For the session and the wizard state cookie (see .wizard), which need to
+    store booking dates. The interface is the one SESSION_SERIALIZER and
+    django.core.signing expect.
+    """
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, cls=_Encoder, separators=(",", ":")).encode("latin-1")
+
+    def loads(self, data: bytes):
+        return json.loads(data.decode("latin-1"), object_hook=_decode)
@@ -0,0 +1,60 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from . import activity_stream, reference_data
+from .models import (
+    PRA,
+    Booking,
+    Building,
+    BusinessUnit,
+    DitGroup,
+    Floor,
+    ReferenceDataVersion,
+)
+
+
+def reference_data_changed(sender, **kwargs):
+    ReferenceDataVersion.bump()
+    reference_data.invalidate()
+
+
+for model in (Building, Floor, DitGroup, BusinessUnit):
+    post_save.connect(reference_data_changed, sender=model)
+    post_delete.connect(reference_data_changed, sender=model)
+
+
+def store_activity_object(sender, instance, raw=False, **kwargs):
+    if not raw:
+        activity_stream.store_objects([instance])
+
+
+for model in (Booking, PRA):
+    post_save.connect(store_activity_object, sender=model)
+
+
+def check_activity_fields_changed(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._activity_fields_changed = False
+
+    fields, _ = activity_stream.RELATED_OBJECTS[sender]
+
+    if raw or instance._state.adding:
+        return
+
+    if update_fields is not None and not set(fields) & set(update_fields):
+        # e.g. last_login
+        return
+
+    old = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+
+    instance._activity_fields_changed = old is not None and old != tuple(
+        getattr(instance, field) for field in fields
+    )
+
+
+def store_related_activity_objects(sender, instance, **kwargs):
+    if getattr(instance, "_activity_fields_changed", False):
+        activity_stream.store_related_objects(instance)
+
+
+for model in activity_stream.RELATED_OBJECTS:
+    pre_save.connect(check_activity_fields_changed, sender=model)
+    post_save.connect(store_related_activity_objects, sender=model)
@@ -0,0 +1,93 @@
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from main.availability import get_availability
+from main.tests import factories
+from main.tests.utils import create_test_user
+
+
+class TestGetAvailability(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.building = factories.BuildingFactory()
+        self.floor1 = factories.FloorFactory(building=self.building, name="1", nr_of_desks=1)
+        self.floor2 = factories.FloorFactory(building=self.building, name="2", nr_of_desks=2)
+        self.today = date.today()
+
+    def test_free_desks(self):
+        tomorrow = self.today + timedelta(days=1)
+
+        factories.BookingFactory(building=self.building, floor=self.floor1, booking_date=tomorrow)
+        factories.BookingFactory(building=self.building, floor=self.floor2, booking_date=tomorrow)
+        factories.BookingFactory(
+            building=self.building, floor=self.floor2, booking_date=tomorrow, is_active=False
+        )
+
+        availability = get_availability(self.building, self.today, 3)
+
+        self.assertEqual(availability["end_date"], self.today + timedelta(days=2))
+        self.assertEqual(
+            [(d["date"], d["free_desks"]) for d in availability["days"]],
+            [(self.today, 3), (tomorrow, 1), (self.today + timedelta(days=2), 3)],
+        )
+        self.assertEqual(
+            [f["free_desks"] for f in availability["days"][1]["floors"]],
+            [0, 1],
+        )
+        self.assertEqual(availability["first_free_date"], self.today)
+
+    def test_first_free_date(self):
+        for floor in (self.floor1, self.floor2):
+            for _ in range(floor.nr_of_desks):
+                factories.BookingFactory(
+                    building=self.building, floor=floor, booking_date=self.today
+                )
+
+        availability = get_availability(self.building, self.today, 2)
+
+        self.assertEqual(availability["first_free_date"], self.today + timedelta(days=1))
+
+    def test_cached(self):
+        get_availability(self.building, self.today, 7)
+
+        with self.assertNumQueries(0):
+            get_availability(self.building, self.today, 7)
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class TestAvailabilityViews(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.client.force_login(create_test_user())
+        self.floor = factories.FloorFactory(nr_of_desks=4)
+
+    def test_api(self):
+        response = self.client.get(
+            reverse("main:availability-api", kwargs={"pk": self.floor.building.pk}),
+            {"days": 2},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["days"]), 2)
+        self.assertEqual(response.json()["first_free_date"], str(date.today()))
+
+    def test_api_invalid_days(self):
+        response = self.client.get(
+            reverse("main:availability-api", kwargs={"pk": self.floor.building.pk}),
+            {"days": 1000},
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_page(self):
+        response = self.client.get(
+            reverse("main:show-availability"), {"building": self.floor.building.pk}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["availability"]["building"]["id"], self.floor.building.pk)
@@ -0,0 +1,296 @@
+from datetime import date, timedelta
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from main.bookings import create_bookings, create_team_bookings, get_recurring_dates
+from main.forms import BookingFormInitial
+from main.models import Booking, DitGroup, FloorDayOccupancy, NotificationOutbox
+from main.tests import factories
+from main.tests.utils import create_test_user, set_wizard_state
+
+
+def test_get_recurring_dates():
+    # 2020-09-01 is a Tuesday
+    assert get_recurring_dates(date(2020, 9, 1), [1, 3], date(2020, 9, 10)) == [
+        date(2020, 9, 1),
+        date(2020, 9, 3),
+        date(2020, 9, 8),
+        date(2020, 9, 10),
+    ]
+
+
+def test_get_recurring_dates_no_repeat():
+    assert get_recurring_dates(date(2020, 9, 1), [], None) == [date(2020, 9, 1)]
+
+
+def test_booking_form_repeat_until_required(db):
+    building = factories.BuildingFactory()
+
+    form = BookingFormInitial(
+        True,
+        {
+            "confirm_presentation": "on",
+            "booking_date": str(date.today()),
+            "repeat_weekdays": ["0"],
+            "building": building.pk,
+            "dit_group": DitGroup.objects.first().pk,
+        },
+    )
+
+    assert not form.is_valid()
+    assert "repeat_until" in form.errors
+
+
+@override_settings(BOOKING_MAX_DATES=3)
+def test_booking_form_too_many_dates(db):
+    building = factories.BuildingFactory()
+
+    form = BookingFormInitial(
+        True,
+        {
+            "confirm_presentation": "on",
+            "booking_date": str(date.today()),
+            "repeat_weekdays": ["0", "1", "2", "3", "4"],
+            "repeat_until": str(date.today() + timedelta(days=14)),
+            "building": building.pk,
+            "dit_group": DitGroup.objects.first().pk,
+        },
+    )
+
+    assert not form.is_valid()
+    assert "repeat_until" in form.errors
+
+
+@override_settings(BOOKING_MAX_TEAM_SIZE=2)
+def test_booking_form_team(db):
+    building = factories.BuildingFactory()
+
+    data = {
+        "booking_date": str(date.today()),
+        "building": building.pk,
+        "dit_group": DitGroup.objects.first().pk,
+    }
+
+    form = BookingFormInitial(
+        False,
+        {**data, "team_dit_emails": "A@example.com\n\na@example.com\nb@example.com"},
+        for_team=True,
+    )
+
+    assert form.is_valid()
+    assert form.cleaned_data["team_dit_emails"] == ["a@example.com", "b@example.com"]
+
+    form = BookingFormInitial(
+        False,
+        {**data, "team_dit_emails": "a@example.com\nb@example.com\nc@example.com"},
+        for_team=True,
+    )
+
+    assert not form.is_valid()
+    assert "team_dit_emails" in form.errors
+
+    form = BookingFormInitial(False, {**data, "team_dit_emails": "not-an-email"}, for_team=True)
+
+    assert not form.is_valid()
+    assert "team_dit_emails" in form.errors
+
+
+class TestCreateBookings(TestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.floor = factories.FloorFactory(nr_of_desks=1)
+        self.dates = [date.today() + timedelta(days=i) for i in range(1, 4)]
+
+        # the middle day is already full
+        factories.BookingFactory(
+            building=self.floor.building, floor=self.floor, booking_date=self.dates[1]
+        )
+        FloorDayOccupancy.rebuild()
+
+    def _bookings(self):
+        return [
+            Booking(user=self.user, building=self.floor.building, floor=self.floor, booking_date=d)
+            for d in self.dates
+        ]
+
+    def test_partial_failure(self):
+        created, failed = create_bookings(self._bookings())
+
+        self.assertEqual([b.booking_date for b in created], [self.dates[0], self.dates[2]])
+        self.assertEqual(
+            [(b.booking_date, reason) for b, reason in failed],
+            [(self.dates[1], "Floor is completely booked")],
+        )
+        self.assertEqual(Booking.objects.filter(user=self.user).count(), 2)
+
+        for d in self.dates:
+            self.assertEqual(FloorDayOccupancy.get_nr_of_bookings(self.floor.pk, d), 1)
+
+    def test_all_or_nothing(self):
+        created, failed = create_bookings(self._bookings(), all_or_nothing=True)
+
+        self.assertEqual(created, [])
+        self.assertEqual(len(failed), 1)
+        self.assertFalse(Booking.objects.filter(user=self.user).exists())
+        self.assertEqual(FloorDayOccupancy.get_nr_of_bookings(self.floor.pk, self.dates[0]), 0)
+
+    def test_duplicate(self):
+        self.floor.nr_of_desks = 2
+        self.floor.save()
+
+        create_bookings(self._bookings()[:1])
+
+        created, failed = create_bookings(self._bookings()[:1])
+
+        self.assertEqual(created, [])
+        self.assertEqual(failed[0][1], "Cannot add duplicate booking")
+
+
+class TestCreateTeamBookings(TestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.building = factories.BuildingFactory()
+        self.floor1 = factories.FloorFactory(building=self.building, name="1", nr_of_desks=2)
+        self.floor2 = factories.FloorFactory(building=self.building, name="2", nr_of_desks=2)
+        self.booking_date = date.today() + timedelta(days=1)
+
+    def _bookings(self, nr_of_people):
+        return [
+            Booking(
+                user=self.user,
+                on_behalf_of_dit_email=f"person{i}@example.com",
+                building=self.building,
+                floor=self.floor1,
+                booking_date=self.booking_date,
+            )
+            for i in range(nr_of_people)
+        ]
+
+    def test_all_or_nothing(self):
+        created, failed = create_team_bookings(self._bookings(3))
+
+        self.assertEqual(created, [])
+        self.assertEqual(len(failed), 1)
+        self.assertFalse(Booking.objects.filter(user=self.user).exists())
+
+    def test_split_across_floors(self):
+        created, failed = create_team_bookings(self._bookings(3), split_across_floors=True)
+
+        self.assertEqual(failed, [])
+        self.assertEqual([b.floor for b in created], [self.floor1, self.floor1, self.floor2])
+        self.assertEqual(FloorDayOccupancy.get_nr_of_bookings(self.floor2.pk, self.booking_date), 1)
+
+    def test_split_across_floors_not_enough_desks(self):
+        created, failed = create_team_bookings(self._bookings(5), split_across_floors=True)
+
+        self.assertEqual(created, [])
+        self.assertEqual(len(failed), 1)
+        self.assertFalse(Booking.objects.filter(user=self.user).exists())
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class TestCreateMultiDateBookingView(TestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.client.force_login(self.user)
+
+        self.floor = factories.FloorFactory(nr_of_desks=1)
+        self.dates = [date.today() + timedelta(days=i) for i in range(1, 4)]
+
+        factories.BookingFactory(
+            building=self.floor.building, floor=self.floor, booking_date=self.dates[1]
+        )
+        FloorDayOccupancy.rebuild()
+
+        set_wizard_state(
+            self.client,
+            self.user,
+            {
+                "for_myself": True,
+                "booking_date": self.dates[0],
+                "booking_dates": self.dates,
+                "building": self.floor.building.pk,
+                "dit_group": DitGroup.objects.first().pk,
+                "business_unit": "Legal",
+                "on_behalf_of_name": "",
+                "on_behalf_of_dit_email": "",
+            },
+        )
+
+    def test_books_free_days_and_queues_one_email(self):
+        response = self.client.post(
+            reverse("main:booking-create-finalize"),
+            {"floor": self.floor.pk, "confirmation": "on"},
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(
+                Booking.objects.filter(floor=self.floor, user__username="test_user").values_list(
+                    "booking_date", flat=True
+                )
+            ),
+            [self.dates[0], self.dates[2]],
+        )
+        self.assertEqual(
+            set(
+                Booking.objects.filter(user__username="test_user").values_list(
+                    "business_unit_ref__dit_group", "business_unit_ref__name"
+                )
+            ),
+            {(DitGroup.objects.first().pk, "Legal")},
+        )
+
+        self.assertEqual(
+            NotificationOutbox.objects.get().personalisation["date"],
+            f"{self.dates[0]}, {self.dates[2]}",
+        )
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class TestCreateTeamBookingView(TestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.client.force_login(self.user)
+
+        self.floor = factories.FloorFactory(nr_of_desks=2)
+        self.booking_date = date.today() + timedelta(days=1)
+
+        set_wizard_state(
+            self.client,
+            self.user,
+            {
+                "for_myself": False,
+                "for_team": True,
+                "booking_date": self.booking_date,
+                "booking_dates": [self.booking_date],
+                "building": self.floor.building.pk,
+                "dit_group": DitGroup.objects.first().pk,
+                "business_unit": "Legal",
+                "on_behalf_of_name": "",
+                "on_behalf_of_dit_email": "",
+                "team_dit_emails": ["a@example.com", "b@example.com"],
+            },
+        )
+
+    def test_books_everyone_and_queues_one_email(self):
+        response = self.client.post(
+            reverse("main:booking-create-finalize"),
+            {"floor": self.floor.pk, "confirmation": "on"},
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(
+                Booking.objects.filter(floor=self.floor).values_list(
+                    "on_behalf_of_dit_email", flat=True
+                )
+            ),
+            ["a@example.com", "b@example.com"],
+        )
+
+        self.assertEqual(
+            NotificationOutbox.objects.get().personalisation["on_behalf_of"],
+            "a@example.com, b@example.com",
+        )
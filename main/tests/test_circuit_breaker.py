@@ -0,0 +1,118 @@
+import logging
+import time
+from unittest import mock
+
+import pytest
+
+from main.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    get_timeout,
+    set_deadline,
+)
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+    func = mock.Mock()
+
+    with pytest.raises(CircuitOpenError):
+        breaker.call(func)
+
+    func.assert_not_called()
+
+
+def test_logs_opening_and_closing(caplog):
+    caplog.set_level(logging.INFO, logger="main.circuit_breaker")
+
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+
+    breaker.call(lambda: 1)
+
+    assert [r.getMessage() for r in caplog.records] == [
+        "Circuit breaker 'test' opened after 1 failures",
+        "Circuit breaker 'test' closed",
+    ]
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+
+    assert breaker.call(lambda: 1) == 1
+
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_ignored_exceptions_dont_count():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+
+    with pytest.raises(ConnectionError):
+        breaker.call(fail, is_failure=lambda e: False)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # failed probe opens it again
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+
+    # only one probe at a time
+    def probe():
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: None)
+
+        return "ok"
+
+    assert breaker.call(probe) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_deadline():
+    assert get_timeout(5) == 5
+
+    set_deadline(1)
+
+    try:
+        assert get_timeout(5) <= 1
+        assert get_timeout(0.5) == 0.5
+
+        set_deadline(-1)
+
+        with pytest.raises(DeadlineExceeded):
+            get_timeout(5)
+    finally:
+        set_deadline(None)
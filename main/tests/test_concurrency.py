@@ -0,0 +1,196 @@
+import threading
+from datetime import date, timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.client import Client
+from django.urls import reverse
+
+from main.activity_stream import assign_feed_sequences
+from main.bookings import create_bookings
+from main.models import Booking, DitGroup, FloorDayOccupancy
+from main.tests import factories
+from main.tests.utils import set_wizard_state
+
+
+def run_in_thread(func):
+    """Run func in a new thread (and so a new DB connection), return whatever it
+    returned or raised."""
+
+    result = {}
+
+    def target():
+        try:
+            result["value"] = func()
+        except Exception as e:
+            result["error"] = e
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join(timeout=30)
+
+    return result
+
+
+class TestFloorDayLocking(TransactionTestCase):
+    def setUp(self):
+        self.floor = factories.FloorFactory(nr_of_desks=5)
+        self.day1 = date.today() + timedelta(days=1)
+        self.day2 = date.today() + timedelta(days=2)
+
+        for day in (self.day1, self.day2):
+            FloorDayOccupancy.objects.create(floor=self.floor, booking_date=day)
+
+    def _lock_nowait(self, booking_date):
+        def func():
+            with transaction.atomic():
+                return FloorDayOccupancy.lock(self.floor.pk, booking_date, nowait=True)
+
+        return func
+
+    def test_other_days_on_same_floor_are_not_blocked(self):
+        with transaction.atomic():
+            FloorDayOccupancy.lock(self.floor.pk, self.day1)
+
+            other_day = run_in_thread(self._lock_nowait(self.day2))
+            same_day = run_in_thread(self._lock_nowait(self.day1))
+
+        self.assertNotIn("error", other_day)
+        self.assertIsInstance(same_day.get("error"), DatabaseError)
+
+
+class TestFeedSequenceLocking(TransactionTestCase):
+    def setUp(self):
+        self.floor1 = factories.FloorFactory(nr_of_desks=5)
+        self.floor2 = factories.FloorFactory(nr_of_desks=5)
+        self.booking_date = date.today() + timedelta(days=1)
+
+    def _booking(self, floor):
+        return Booking(
+            user=factories.UserFactory(),
+            building=floor.building,
+            floor=floor,
+            booking_date=self.booking_date,
+        )
+
+    def _without_waiting(self, func):
+        def wrapper():
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = '1s'")
+
+                return func()
+
+        return wrapper
+
+    def test_bookings_on_other_floors_are_not_blocked(self):
+        other_floor_booking = self._booking(self.floor2)
+
+        with transaction.atomic():
+            create_bookings([self._booking(self.floor1)])
+
+            other_floor = run_in_thread(
+                self._without_waiting(lambda: create_bookings([other_floor_booking]))
+            )
+
+        self.assertNotIn("error", other_floor)
+        self.assertEqual(len(other_floor["value"][0]), 1)
+
+    def test_feeds_dont_wait_for_bookings_in_flight(self):
+        committed = factories.BookingFactory(
+            floor=self.floor1, building=self.floor1.building, booking_date=self.booking_date
+        )
+
+        with transaction.atomic():
+            (in_flight,), _ = create_bookings([self._booking(self.floor2)])
+
+            result = run_in_thread(self._without_waiting(assign_feed_sequences))
+
+        self.assertNotIn("error", result)
+
+        committed.refresh_from_db()
+        in_flight.refresh_from_db()
+
+        # the booking still in flight was left for later...
+        self.assertIsNotNone(committed.feed_sequence)
+        self.assertIsNone(in_flight.feed_sequence)
+
+        # ...and so comes after everything the feeds could already have served
+        assign_feed_sequences()
+
+        in_flight.refresh_from_db()
+        self.assertGreater(in_flight.feed_sequence, committed.feed_sequence)
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class TestNoOverbooking(TransactionTestCase):
+    NR_OF_DESKS = 3
+    NR_OF_USERS = 8
+
+    def setUp(self):
+        self.floor = factories.FloorFactory(nr_of_desks=self.NR_OF_DESKS)
+        self.dit_group = DitGroup.objects.create(name="Test group")
+        self.dit_group.business_units.create(name="Test unit")
+        self.booking_dates = [date.today() + timedelta(days=1), date.today() + timedelta(days=2)]
+
+    def _make_client(self, booking_date):
+        client = Client()
+        user = factories.UserFactory()
+        client.force_login(user)
+
+        set_wizard_state(
+            client,
+            user,
+            {
+                "for_myself": True,
+                "booking_date": booking_date,
+                "building": self.floor.building.pk,
+                "dit_group": self.dit_group.pk,
+                "business_unit": "Test unit",
+                "on_behalf_of_name": "",
+                "on_behalf_of_dit_email": "",
+            },
+        )
+
+        return client
+
+    def test_concurrent_bookings(self):
+        clients = [
+            self._make_client(booking_date)
+            for booking_date in self.booking_dates
+            for _ in range(self.NR_OF_USERS)
+        ]
+
+        barrier = threading.Barrier(len(clients))
+        threads = []
+
+        def book(client):
+            try:
+                barrier.wait()
+                client.post(
+                    reverse("main:booking-create-finalize"),
+                    {"floor": self.floor.pk, "confirmation": "on"},
+                )
+            finally:
+                connection.close()
+
+        for client in clients:
+            thread = threading.Thread(target=book, args=(client,))
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join(timeout=60)
+
+        for booking_date in self.booking_dates:
+            nr_of_bookings = Booking.objects.filter(
+                floor=self.floor, booking_date=booking_date, is_active=True
+            ).count()
+
+            self.assertEqual(nr_of_bookings, self.NR_OF_DESKS)
+            self.assertEqual(
+                FloorDayOccupancy.get_nr_of_bookings(self.floor.pk, booking_date),
+                self.NR_OF_DESKS,
+            )
@@ -0,0 +1,225 @@
+import csv
+import datetime
+import gzip
+import io
+from unittest import mock
+
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from freezegun import freeze_time
+
+from main.admin import (
+    ExportJobAdmin,
+    download_bookings_csv,
+    download_bookings_csv_gz,
+    download_pra_csv,
+    queue_bookings_export,
+)
+from main.exports import delete_expired_export_jobs, queue_export_job, run_pending_export_job
+from main.models import PRA, Booking, ExportFileChunk, ExportJob
+from main.tests import factories
+
+
+def read_csv(response) -> list:
+    return list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+
+
+class TestCsvExports(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get("/")
+
+        self.bookings = factories.BookingFactory.create_batch(
+            3, booking_date=datetime.date(2020, 9, 1)
+        )
+
+    def test_bookings(self):
+        response = download_bookings_csv(None, self.request, Booking.objects.order_by("pk"))
+
+        self.assertEqual(response["Content-Disposition"], "attachment;filename=bookings.csv")
+
+        with self.assertNumQueries(1):
+            rows = read_csv(response)
+
+        self.assertEqual(rows[0][:3], ["booking_date", "building", "floor"])
+        self.assertEqual(
+            [row[1:4] for row in rows[1:]],
+            [[b.building.name, b.floor.name, str(b.user)] for b in self.bookings],
+        )
+
+    def test_bookings_gzipped(self):
+        response = download_bookings_csv_gz(None, self.request, Booking.objects.order_by("pk"))
+
+        self.assertEqual(response["Content-Disposition"], "attachment;filename=bookings.csv.gz")
+
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+
+        self.assertEqual(len(list(csv.reader(io.StringIO(content)))), 4)
+
+    def test_pras(self):
+        pras = factories.PRAFactory.create_batch(3)
+
+        response = download_pra_csv(None, self.request, PRA.objects.order_by("pk"))
+
+        with self.assertNumQueries(1):
+            rows = read_csv(response)
+
+        self.assertEqual(
+            [row[:4] for row in rows[1:]],
+            [
+                [str(pra.pk), pra.staff_member.email, pra.line_manager.email, pra.scs.email]
+                for pra in pras
+            ],
+        )
+
+
+class TestExportJobs(TestCase):
+    def setUp(self):
+        self.user = factories.UserFactory(is_staff=True, is_superuser=True)
+
+        self.bookings = factories.BookingFactory.create_batch(
+            3, booking_date=datetime.date(2020, 9, 1)
+        )
+
+    def test_writes_file(self):
+        job = queue_export_job(
+            ExportJob.KIND_BOOKINGS,
+            Booking.objects.filter(pk__in=[b.pk for b in self.bookings[:2]]),
+            True,
+            self.user,
+        )
+
+        self.assertEqual(job.nr_of_rows, 2)
+        self.assertEqual(job.selection, {"pks": sorted(b.pk for b in self.bookings[:2])})
+        self.assertEqual(run_pending_export_job(), job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_DONE)
+        self.assertEqual(job.progress(), "100%")
+
+        request = RequestFactory().get("/")
+        request.user = self.user
+
+        response = ExportJobAdmin(ExportJob, admin.site).download(request, job.pk)
+
+        self.assertIn(f"{job.pk}-bookings.csv.gz", response["Content-Disposition"])
+
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+
+        self.assertEqual(len(list(csv.reader(io.StringIO(content)))), 3)
+
+        # nothing left to do
+        self.assertIsNone(run_pending_export_job())
+
+    def test_restarts_abandoned_job(self):
+        job = queue_export_job(ExportJob.KIND_BOOKINGS, Booking.objects.all(), False, self.user)
+
+        ExportJob.objects.update(
+            status=ExportJob.STATUS_RUNNING,
+            updated_timestamp=timezone.now() - datetime.timedelta(hours=1),
+        )
+        # the part it wrote before it died
+        ExportFileChunk.objects.create(job=job, index=0, data=b"booking_date,")
+
+        self.assertEqual(run_pending_export_job(), job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_DONE)
+        self.assertEqual(len(read_csv(self._download(job))), 4)
+
+    def test_download_needs_permission(self):
+        job = queue_export_job(ExportJob.KIND_PRAS, PRA.objects.all(), False, self.user)
+        run_pending_export_job()
+
+        request = RequestFactory().get("/")
+        request.user = factories.UserFactory(is_staff=True)
+
+        with self.assertRaises(PermissionDenied):
+            ExportJobAdmin(ExportJob, admin.site).download(request, job.pk)
+
+    def test_changelist_selection(self):
+        other_floor_booking = factories.BookingFactory(booking_date=datetime.date(2020, 9, 1))
+
+        # "select all" on the changelist filtered by floor
+        request = RequestFactory().post(
+            f"/?floor__id__exact={other_floor_booking.floor_id}",
+            {"select_across": "1"},
+        )
+        request.user = self.user
+        request._messages = mock.MagicMock()
+
+        booking_admin = admin.site._registry[Booking]
+        queue_bookings_export(
+            booking_admin, request, Booking.objects.filter(floor=other_floor_booking.floor)
+        )
+
+        job = ExportJob.objects.get()
+        self.assertEqual(
+            job.selection,
+            {"changelist_params": {"floor__id__exact": [str(other_floor_booking.floor_id)]}},
+        )
+        self.assertEqual(job.nr_of_rows, 1)
+
+        run_pending_export_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_DONE)
+
+        rows = read_csv(self._download(job))
+
+        self.assertEqual([row[2] for row in rows[1:]], [other_floor_booking.floor.name])
+
+    def test_expired_jobs_are_deleted(self):
+        job = queue_export_job(ExportJob.KIND_PRAS, PRA.objects.all(), False, self.user)
+        run_pending_export_job()
+        job.refresh_from_db()
+
+        self.assertEqual(delete_expired_export_jobs(), 0)
+
+        with freeze_time(timezone.now() + datetime.timedelta(days=8)):
+            self.assertEqual(delete_expired_export_jobs(), 1)
+
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertFalse(ExportFileChunk.objects.exists())
+
+    @override_settings(EXPORT_FILE_CHUNK_SIZE=100)
+    def test_writes_file_in_chunks(self):
+        job = queue_export_job(ExportJob.KIND_BOOKINGS, Booking.objects.all(), False, self.user)
+        run_pending_export_job()
+
+        self.assertGreater(job.chunks.count(), 1)
+
+        response = self._download(job)
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            response["Content-Disposition"], f"attachment;filename={job.pk}-bookings.csv"
+        )
+
+        # a query for the chunks, and one for each of them
+        with self.assertNumQueries(1 + job.chunks.count()):
+            rows = read_csv(response)
+
+        self.assertEqual([row[1] for row in rows[1:]], [b.building.name for b in self.bookings])
+
+    @override_settings(EXPORT_FILE_CHUNK_SIZE=100)
+    def test_failed_job_keeps_no_file(self):
+        job = queue_export_job(ExportJob.KIND_BOOKINGS, Booking.objects.all(), False, self.user)
+
+        def csv_chunks(rows):
+            yield b"x" * 100
+            raise RuntimeError("boom")
+
+        with mock.patch("main.exports.csv_chunks", csv_chunks):
+            run_pending_export_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_FAILED)
+        self.assertFalse(job.chunks.exists())
+
+    def _download(self, job):
+        request = RequestFactory().get("/")
+        request.user = self.user
+
+        return ExportJobAdmin(ExportJob, admin.site).download(request, job.pk)
@@ -1,3 +1,5 @@
+from unittest import mock
+
 import pytest
 from django.http import HttpResponse
 from django.urls import reverse
@@ -88,3 +90,45 @@ class TestIpRestrictionMiddleware:
         )
 
         assert IpRestrictionMiddleware(dummy_view)(request).status_code == expected_status
+
+    @pytest.mark.parametrize(
+        "client_ip,expected_status",
+        (
+            ["10.1.2.3", 200],
+            ["11.255.255.255", 200],
+            ["12.0.0.1", 401],
+            ["192.168.1.7", 200],
+            ["192.168.2.1", 401],
+            ["2001:db8::1", 200],
+            ["2001:db9::1", 401],
+        ),
+    )
+    def test_ip_ranges(self, rf, settings, client_ip, expected_status):
+        settings.IP_RESTRICT = True
+        settings.IP_RESTRICT_APPS = ["admin"]
+        settings.ALLOWED_IPS = []
+        settings.ALLOWED_IP_RANGES = [
+            "11.0.0.0/8",
+            "10.0.0.0/8",
+            "10.1.0.0/16",
+            "192.168.1.0/24",
+            "2001:db8::/32",
+        ]
+        settings.IP_SAFELIST_XFF_INDEX = -2
+
+        request = rf.get(reverse("admin:index"), HTTP_X_FORWARDED_FOR=f"{client_ip}, 3.3.3.3")
+
+        assert IpRestrictionMiddleware(dummy_view)(request).status_code == expected_status
+
+    def test_does_not_resolve_paths(self, rf, settings):
+        settings.IP_RESTRICT = True
+        settings.IP_RESTRICT_APPS = ["admin"]
+        settings.IP_SAFELIST_XFF_INDEX = -2
+
+        middleware = IpRestrictionMiddleware(dummy_view)
+
+        with mock.patch("main.middleware.resolve") as resolve:
+            assert middleware(rf.get(reverse("main:show-bookings"))).status_code == 200
+            assert middleware(rf.get(reverse("admin:index"))).status_code == 401
+
+        resolve.assert_not_called()
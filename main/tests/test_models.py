@@ -1,4 +1,11 @@
-from main.models import Booking, DitGroup
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+
+from main.activity_stream import assign_feed_sequences
+from main.models import Booking, DitGroup, FloorDayOccupancy
+from main.tests import factories
 
 
 def test_booking_on_behalf_of_yourself():
@@ -21,25 +28,108 @@ def test_booking_on_behalf_of_name_and_dit_email():
     assert b.get_on_behalf_of() == "Jane Doe (jane@example.com)"
 
 
-def test_dit_group_business_units_empty():
-    dg = DitGroup(business_units="")
+def test_dit_group_business_units_empty(db):
+    dg = DitGroup.objects.create(name="Group")
 
     assert dg.get_business_units() == ["Unknown"]
 
 
-def test_dit_group_business_units_empty_lines():
-    dg = DitGroup(business_units="   \n   ")
+def test_dit_group_business_units_not_empty(db):
+    dg = DitGroup.objects.create(name="Group")
 
-    assert dg.get_business_units() == ["Unknown"]
+    for name in ["one", "two", "three"]:
+        dg.business_units.create(name=name)
 
+    assert dg.get_business_units() == ["one", "two", "three"]
+    assert dg.get_business_unit("two").name == "two"
+    assert dg.get_business_unit("four") is None
 
-def test_dit_group_business_units_none():
-    dg = DitGroup(business_units=None)
 
-    assert dg.get_business_units() == ["Unknown"]
+def test_floor_day_occupancy_add_bookings(db):
+    floor = factories.FloorFactory(nr_of_desks=10)
+    booking_date = datetime.date(2020, 9, 1)
+
+    assert FloorDayOccupancy.get_nr_of_bookings(floor.pk, booking_date) == 0
+
+    FloorDayOccupancy.add_bookings(floor.pk, booking_date, 1)
+    FloorDayOccupancy.add_bookings(floor.pk, booking_date, 1)
+    FloorDayOccupancy.add_bookings(floor.pk, booking_date, -1)
+
+    assert FloorDayOccupancy.get_nr_of_bookings(floor.pk, booking_date) == 1
+    assert FloorDayOccupancy.get_for_building(floor.building, [booking_date]) == {
+        (floor.pk, booking_date): 1
+    }
+
+
+def test_floor_day_occupancy_rebuild(db):
+    floor = factories.FloorFactory(nr_of_desks=10)
+    booking_date = datetime.date(2020, 9, 1)
+
+    for _ in range(3):
+        factories.BookingFactory(building=floor.building, floor=floor, booking_date=booking_date)
+
+    factories.BookingFactory(
+        building=floor.building, floor=floor, booking_date=booking_date, is_active=False
+    )
+
+    # simulate drift
+    FloorDayOccupancy.add_bookings(floor.pk, booking_date, 7)
+
+    assert FloorDayOccupancy.rebuild() == 1
+    assert FloorDayOccupancy.get_nr_of_bookings(floor.pk, booking_date) == 3
+
+
+def test_rebuild_floor_occupancy_command_reports_rows_corrected(db):
+    floor = factories.FloorFactory(nr_of_desks=10)
+
+    for day in (1, 2):
+        factories.BookingFactory(
+            building=floor.building, floor=floor, booking_date=datetime.date(2020, 9, day)
+        )
+
+    # the factory doesn't count bookings, so count one day right and the other wrong
+    FloorDayOccupancy.add_bookings(floor.pk, datetime.date(2020, 9, 1), 7)
+    FloorDayOccupancy.add_bookings(floor.pk, datetime.date(2020, 9, 2), 1)
+
+    out = StringIO()
+    call_command("rebuild_floor_occupancy", stdout=out)
+
+    assert out.getvalue() == "Corrected 1 floor occupancy rows\n"
+
+
+def test_feed_sequences_are_assigned_in_order(db):
+    bookings = [factories.BookingFactory(booking_date=datetime.date(2020, 9, 1)) for _ in range(3)]
+
+    assert all(b.feed_sequence is None for b in bookings)
+
+    assign_feed_sequences()
+
+    for b in bookings:
+        b.refresh_from_db()
+
+    sequences = [b.feed_sequence for b in bookings]
+
+    assert None not in sequences
+    assert sequences == sorted(sequences)
+    assert len(set(sequences)) == 3
+
+    booking = factories.BookingFactory(booking_date=datetime.date(2020, 9, 1))
+
+    assign_feed_sequences()
+
+    booking.refresh_from_db()
+    assert booking.feed_sequence > sequences[-1]
+
+
+def test_save_keeps_feed_sequence(db):
+    booking = factories.BookingFactory(booking_date=datetime.date(2020, 9, 1))
 
+    assign_feed_sequences()
 
-def test_dit_group_business_units_not_empty():
-    dg = DitGroup(business_units="  one  \n\n two\nthree  \nfour  ")
+    # loaded before it was numbered
+    booking.is_active = False
+    booking.save()
 
-    assert dg.get_business_units() == ["one", "two", "three", "four"]
+    booking.refresh_from_db()
+    assert booking.feed_sequence is not None
+    assert not booking.is_active
@@ -0,0 +1,208 @@
+import csv
+import io
+import time
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from notifications_python_client.errors import HTTPError
+
+from main import circuit_breaker
+from main.models import PRA, NotificationOutbox
+from main.notifications import (
+    PooledNotificationsAPIClient,
+    fan_out,
+    get_client,
+    send_pending_notifications,
+)
+from main.tests.utils import create_test_user
+
+
+# dummy key in the "name-service id-secret" format
+API_KEY = "test-11111111-1111-1111-1111-111111111111-22222222-2222-2222-2222-222222222222"
+
+
+@override_settings(GOVUK_NOTIFY_API_KEY=API_KEY)
+@mock.patch("main.notifications._client", None)
+def test_get_client_is_shared():
+    assert get_client() is get_client()
+
+
+def test_pooled_client_uses_session():
+    session = mock.Mock()
+    session.request.return_value.status_code = 201
+    session.request.return_value.json.return_value = {"id": "1"}
+
+    client = PooledNotificationsAPIClient(API_KEY, session, timeout=(1, 2))
+
+    client.send_email_notification(email_address="a@example.com", template_id="template")
+
+    session.request.assert_called_once()
+    assert session.request.call_args[1]["timeout"] == (1, 2)
+
+
+@mock.patch("main.notifications.get_client")
+class TestSendPendingNotifications(TestCase):
+    def setUp(self):
+        circuit_breaker._breakers.clear()
+
+        self.notification = NotificationOutbox.queue(
+            email_address="a@example.com", template_id="template", personalisation={"x": "1"}
+        )
+
+    def test_sends(self, nc):
+        self.assertEqual(send_pending_notifications(2, 10), 1)
+
+        nc.return_value.send_email_notification.assert_called_once_with(
+            email_address="a@example.com", template_id="template", personalisation={"x": "1"}
+        )
+
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, NotificationOutbox.STATUS_SENT)
+        self.assertIsNotNone(self.notification.sent_timestamp)
+
+        # nothing left to do
+        self.assertEqual(send_pending_notifications(2, 10), 0)
+
+    def test_retries_with_backoff(self, nc):
+        nc.return_value.send_email_notification.side_effect = ConnectionError("down")
+
+        send_pending_notifications(2, 10)
+
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(self.notification.nr_of_attempts, 1)
+        self.assertIn("down", self.notification.last_error)
+        self.assertGreater(self.notification.next_attempt_timestamp, timezone.now())
+
+        # not due yet
+        self.assertEqual(send_pending_notifications(2, 10), 0)
+
+    @override_settings(NOTIFY_OUTBOX_MAX_ATTEMPTS=2)
+    def test_gives_up(self, nc):
+        nc.return_value.send_email_notification.side_effect = ConnectionError("down")
+
+        for _ in range(2):
+            NotificationOutbox.objects.update(next_attempt_timestamp=timezone.now())
+            send_pending_notifications(2, 10)
+
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, NotificationOutbox.STATUS_FAILED)
+        self.assertEqual(self.notification.nr_of_attempts, 2)
+
+    def test_does_not_retry_client_errors(self, nc):
+        nc.return_value.send_email_notification.side_effect = HTTPError(
+            mock.Mock(status_code=400, json=lambda: {"errors": []})
+        )
+
+        send_pending_notifications(2, 10)
+
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, NotificationOutbox.STATUS_FAILED)
+
+    def test_circuit_open_is_not_an_attempt(self, nc):
+        breaker = circuit_breaker.get_breaker("notify")
+
+        for _ in range(breaker.failure_threshold):
+            with self.assertRaises(ConnectionError):
+                breaker.call(mock.Mock(side_effect=ConnectionError))
+
+        send_pending_notifications(2, 10)
+
+        nc.return_value.send_email_notification.assert_not_called()
+
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(self.notification.nr_of_attempts, 0)
+        self.assertGreater(self.notification.next_attempt_timestamp, timezone.now())
+
+
+def test_fan_out_keeps_order_and_errors():
+    def func(i):
+        # finish in reverse order
+        time.sleep(0.01 * (5 - i))
+
+        if i == 2:
+            raise ValueError("two")
+
+        return i * 10
+
+    results = list(fan_out(func, range(5), 5))
+
+    assert [r for r, _ in results] == [0, 10, None, 30, 40]
+    assert [str(e) if e else None for _, e in results] == [None, None, "two", None, None]
+
+
+class TestPRAMigrate(TestCase):
+    def setUp(self):
+        user = create_test_user()
+        user.is_staff = True
+        user.save()
+
+        self.client.force_login(user)
+
+    def make_csv(self, rows: list) -> SimpleUploadedFile:
+        f = io.StringIO()
+
+        writer = csv.DictWriter(
+            f,
+            [
+                "Staff Member Email Address",
+                "Staff Member Name",
+                "Line Manager Email Address",
+                "SCS Email Address",
+                "Status",
+                "Risk Catagory",
+                "Authorised Reason",
+                "Created",
+                "Mitigation Measures Recommended/Considered",
+                "Manager's Recommendation",
+            ],
+        )
+        writer.writeheader()
+
+        for name, status in rows:
+            writer.writerow(
+                {
+                    "Staff Member Email Address": f"{name}@example.com",
+                    "Staff Member Name": name,
+                    "Line Manager Email Address": "line.manager@example.com",
+                    "SCS Email Address": "scs@example.com",
+                    "Status": status,
+                    "Risk Catagory": "Moderate risk (clinically vulnerable)",
+                    "Authorised Reason": "",
+                    "Created": "01/09/2020 12:00",
+                    "Mitigation Measures Recommended/Considered": "",
+                    "Manager's Recommendation": "N/A - No Risk Identified",
+                }
+            )
+
+        return SimpleUploadedFile("pras.csv", f.getvalue().encode())
+
+    @mock.patch("main.notifications.send", side_effect=ConnectionError)
+    def test_import_queues_emails(self, send):
+        response = self.client.post(
+            reverse("main:pra-migrate"),
+            {
+                "action": "import",
+                "csv_data": self.make_csv(
+                    [("jane", "Pending Staff Member"), ("john", "Pending SCS")]
+                ),
+            },
+        )
+
+        output = b"".join(response.streaming_content).decode()
+
+        self.assertIn("Queued email to staff member for approval", output)
+        self.assertIn("Queued email to SCS for approval", output)
+        self.assertEqual(PRA.objects.count(), 2)
+
+        # Notify wasn't called, the outbox worker sends (and retries) them
+        send.assert_not_called()
+        self.assertEqual(
+            sorted(NotificationOutbox.objects.values_list("email_address", flat=True)),
+            ["jane@example.com", "scs@example.com"],
+        )
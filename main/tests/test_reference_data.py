@@ -0,0 +1,49 @@
+import uuid
+
+from django.test import TestCase, override_settings
+
+from main import reference_data
+from main.forms import AvailabilityForm
+from main.models import Building, ReferenceDataVersion
+from main.tests import factories
+
+
+@override_settings(REFERENCE_DATA_CHECK_INTERVAL=60)
+class TestReferenceData(TestCase):
+    def setUp(self):
+        self.building = factories.BuildingFactory(name="B")
+        self.floor2 = factories.FloorFactory(building=self.building, name="2", nr_of_desks=1)
+        self.floor1 = factories.FloorFactory(building=self.building, name="1", nr_of_desks=1)
+
+    def test_cached(self):
+        data = reference_data.get()
+
+        self.assertEqual(data.get_building(self.building.pk), self.building)
+        self.assertEqual(data.get_floors(self.building), [self.floor1, self.floor2])
+
+        with self.assertNumQueries(0):
+            self.assertIs(reference_data.get(), data)
+
+            AvailabilityForm()
+
+    def test_does_not_exist(self):
+        with self.assertRaises(Building.DoesNotExist):
+            reference_data.get().get_building(self.building.pk + 1)
+
+    def test_invalidated_on_save(self):
+        reference_data.get()
+
+        building = factories.BuildingFactory(name="A")
+
+        self.assertIn(building, reference_data.get().buildings)
+
+    @override_settings(REFERENCE_DATA_CHECK_INTERVAL=0)
+    def test_invalidated_by_other_process(self):
+        data = reference_data.get()
+
+        # another process changed it
+        Building.objects.filter(pk=self.building.pk).update(name="C")
+        ReferenceDataVersion.objects.update(version=uuid.uuid4())
+
+        self.assertIsNot(reference_data.get(), data)
+        self.assertEqual(reference_data.get().get_building(self.building.pk).name, "C")
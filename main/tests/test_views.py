@@ -1,13 +1,28 @@
+import gzip
+import json
 import os
-from datetime import datetime
+from io import StringIO
+from datetime import date, datetime, timedelta, timezone
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from freezegun import freeze_time
 from mohawk import Sender
 
+from custom_usermodel.models import User
+from main.activity_stream import assign_feed_sequences
+from main.models import PRA, Booking, ChangeLog, DitGroup, FloorDayOccupancy, NotificationOutbox
 from main.tests import factories
+from main.tests.utils import create_test_user, set_wizard_state
+
+
+def feed_sequence(obj) -> int:
+    return type(obj).objects.values_list("feed_sequence", flat=True).get(pk=obj.pk)
 
 
 def expected_booking_data(booking):
@@ -70,6 +85,8 @@ def expected_pra_data(pra):
 
 class TestActivityStreamBookingsView(TestCase):
     def setUp(self):
+        cache.clear()
+
         self.url = f"http://testserver{reverse('main:activity-stream-bookings')}"
 
     def test_no_header_provided(self):
@@ -132,7 +149,7 @@ class TestActivityStreamBookingsView(TestCase):
                 ],
                 "type": "Collection",
                 "orderedItems": [expected_booking_data(booking1)],
-                "next": f"{self.url}?cursor={booking1.booked_timestamp.timestamp()}_{booking1.id}",
+                "next": f"{self.url}?cursor={feed_sequence(booking1)}",
             },
         )
 
@@ -161,7 +178,7 @@ class TestActivityStreamBookingsView(TestCase):
                 ],
                 "type": "Collection",
                 "orderedItems": [expected_booking_data(booking2)],
-                "next": f"{self.url}?cursor={booking2.booked_timestamp.timestamp()}_{booking2.id}",
+                "next": f"{self.url}?cursor={feed_sequence(booking2)}",
             },
         )
 
@@ -192,9 +209,259 @@ class TestActivityStreamBookingsView(TestCase):
             },
         )
 
+    @freeze_time("2020-09-01 02:00:00")
+    @override_settings(ACTIVITY_STREAM_ITEMS_PER_PAGE=2)
+    def test_same_timestamp_across_pages(self):
+        bookings = [factories.BookingFactory(booking_date=date(2020, 9, 1)) for _ in range(3)]
+        Booking.objects.update(booked_timestamp=datetime(2020, 8, 30, tzinfo=timezone.utc))
+        assign_feed_sequences()
+
+        url = self.url
+        seen = []
+
+        while url:
+            sender = Sender(
+                settings.ACTIVITY_STREAM_HAWK_CREDENTIALS, url, "GET", content="", content_type=""
+            )
+
+            # one query per page, however many items, after checking that there are no
+            # new rows to number
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    url, HTTP_AUTHORIZATION=sender.request_header, HTTP_CONTENT_TYPE=""
+                )
+
+            json_response = response.json()
+            seen += [
+                item["object"]["dit:ReturnToOffice:Booking:bookingId"]
+                for item in json_response["orderedItems"]
+            ]
+            url = json_response.get("next")
+
+        self.assertEqual(seen, [b.id for b in bookings])
+
+    def _get(self, url):
+        sender = Sender(
+            settings.ACTIVITY_STREAM_HAWK_CREDENTIALS, url, "GET", content="", content_type=""
+        )
+        response = self.client.get(
+            url, HTTP_AUTHORIZATION=sender.request_header, HTTP_CONTENT_TYPE=""
+        )
+        self.assertEqual(response.status_code, 200)
+
+        return response.json()
+
+    def test_legacy_cursor(self):
+        booking1 = factories.BookingFactory(booking_date=date(2020, 9, 1))
+        booking2 = factories.BookingFactory(booking_date=date(2020, 9, 2))
+        Booking.objects.update(booked_timestamp=datetime(2020, 8, 30, tzinfo=timezone.utc))
+        booking1.refresh_from_db()
+        booking2.refresh_from_db()
+
+        json_response = self._get(
+            f"{self.url}?cursor={booking1.booked_timestamp.timestamp()}_{booking1.id}"
+        )
+
+        self.assertEqual(
+            [
+                item["object"]["dit:ReturnToOffice:Booking:bookingId"]
+                for item in json_response["orderedItems"]
+            ],
+            [booking2.id],
+        )
+        self.assertEqual(json_response["next"], f"{self.url}?cursor={feed_sequence(booking2)}")
+
+    @override_settings(ACTIVITY_STREAM_ITEMS_PER_PAGE=1)
+    def test_caches_complete_pages(self):
+        booking = factories.BookingFactory(booking_date=date(2020, 9, 1))
+        ChangeLog.record(booking, ChangeLog.ACTION_CREATED)
+        factories.BookingFactory(booking_date=date(2020, 9, 2))
+
+        json_response = self._get(self.url)
+
+        # only the version check, and the check for new rows to number
+        with self.assertNumQueries(2):
+            self.assertEqual(self._get(self.url), json_response)
+
+        # but it notices changes to the bookings on the page
+        booking.is_active = False
+        booking.canceled_timestamp = datetime(2020, 8, 31, tzinfo=timezone.utc)
+        booking.save()
+        ChangeLog.record(booking, ChangeLog.ACTION_CANCELLED)
+
+        self.assertEqual(
+            self._get(self.url)["orderedItems"][0]["object"][
+                "dit:ReturnToOffice:Booking:cancelled"
+            ],
+            "2020-08-31T00:00:00Z",
+        )
+
+    @override_settings(ACTIVITY_STREAM_ITEMS_PER_PAGE=1)
+    def test_cached_page_notices_changes_without_changelog(self):
+        booking = factories.BookingFactory(booking_date=date(2020, 9, 1))
+        factories.BookingFactory(booking_date=date(2020, 9, 2))
+
+        self._get(self.url)
+
+        # e.g. in the admin, which doesn't record a ChangeLog entry
+        booking.on_behalf_of_name = "Someone else"
+        booking.save()
+
+        self.assertEqual(
+            self._get(self.url)["orderedItems"][0]["object"][
+                "dit:ReturnToOffice:Booking:onBehalfOfName"
+            ],
+            "Someone else",
+        )
+
+        building = booking.building
+        building.name = "Renamed building"
+        building.save()
+
+        self.assertEqual(
+            self._get(self.url)["orderedItems"][0]["object"]["dit:ReturnToOffice:Booking:building"],
+            "Renamed building",
+        )
+
+    def test_not_modified(self):
+        factories.BookingFactory(booking_date=date(2020, 9, 1))
+
+        sender = Sender(
+            settings.ACTIVITY_STREAM_HAWK_CREDENTIALS, self.url, "GET", content="", content_type=""
+        )
+        response = self.client.get(
+            self.url, HTTP_AUTHORIZATION=sender.request_header, HTTP_CONTENT_TYPE=""
+        )
+        etag = response["ETag"]
+
+        sender = Sender(
+            settings.ACTIVITY_STREAM_HAWK_CREDENTIALS, self.url, "GET", content="", content_type=""
+        )
+        response = self.client.get(
+            self.url,
+            HTTP_AUTHORIZATION=sender.request_header,
+            HTTP_CONTENT_TYPE="",
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    @freeze_time("2020-09-01 02:00:00")
+    def test_uses_stored_objects(self):
+        booking = factories.BookingFactory(booking_date=datetime(2020, 9, 1))
+        ChangeLog.record(booking, ChangeLog.ACTION_CREATED)
+
+        self.assertEqual(self._get(self.url)["orderedItems"], [expected_booking_data(booking)])
+
+        Booking.objects.update(activity_object_json='{"stored": true}')
+        cache.clear()
+
+        self.assertEqual(self._get(self.url)["orderedItems"][0]["object"], {"stored": True})
+
+    @freeze_time("2020-09-01 02:00:00")
+    def test_loads_related_rows_only_for_objects_not_stored(self):
+        stored, not_stored = factories.BookingFactory.create_batch(
+            2, booking_date=datetime(2020, 9, 1)
+        )
+        Booking.objects.filter(pk=not_stored.pk).update(activity_object_json=None)
+        assign_feed_sequences()
+
+        with CaptureQueriesContext(connection) as queries:
+            items = self._get(self.url)["orderedItems"]
+
+        self.assertEqual(
+            [item["object"] for item in items],
+            [expected_booking_data(b)["object"] for b in (stored, not_stored)],
+        )
+
+        # the page itself doesn't join the users, buildings and floors, only the
+        # query for the booking that wasn't stored does
+        user_table = User._meta.db_table
+        self.assertEqual(
+            [q["sql"] for q in queries if user_table in q["sql"]],
+            [queries[-1]["sql"]],
+        )
+        self.assertIn(str(not_stored.pk), queries[-1]["sql"])
+
+    @freeze_time("2020-09-01 02:00:00")
+    def test_store_activity_objects_command(self):
+        booking = factories.BookingFactory(booking_date=datetime(2020, 9, 1))
+        Booking.objects.update(activity_object_json=None)
+
+        call_command("store_activity_objects", stdout=StringIO())
+
+        self.assertEqual(
+            json.loads(Booking.objects.get(pk=booking.pk).activity_object_json),
+            expected_booking_data(booking)["object"],
+        )
+
+    @freeze_time("2020-09-01 02:00:00")
+    def test_saving_booking_stores_object(self):
+        booking = factories.BookingFactory(booking_date=datetime(2020, 9, 1))
+
+        booking.is_active = False
+        booking.save()
+
+        self.assertEqual(
+            json.loads(Booking.objects.get(pk=booking.pk).activity_object_json),
+            expected_booking_data(booking)["object"],
+        )
+
+    @freeze_time("2020-09-01 02:00:00")
+    def test_renamed_building_is_in_feed(self):
+        booking = factories.BookingFactory(booking_date=datetime(2020, 9, 1))
+        other_booking = factories.BookingFactory(booking_date=datetime(2020, 9, 1))
+
+        building = booking.building
+        building.name = "Renamed building"
+        building.save()
+
+        objects = [item["object"] for item in self._get(self.url)["orderedItems"]]
+
+        self.assertEqual(
+            [obj["dit:ReturnToOffice:Booking:building"] for obj in objects],
+            ["Renamed building", other_booking.building.name],
+        )
+
+    def test_renamed_user_is_in_feed(self):
+        booking = factories.BookingFactory(booking_date=datetime(2020, 9, 1))
+
+        user = booking.user
+        user.first_name, user.last_name = "Renamed", "User"
+        user.save()
+
+        self.assertEqual(
+            self._get(self.url)["orderedItems"][0]["object"][
+                "dit:ReturnToOffice:Booking:userFullName"
+            ],
+            "Renamed User",
+        )
+
+    def test_saving_unchanged_user_stores_nothing(self):
+        booking = factories.BookingFactory(booking_date=datetime(2020, 9, 1))
+
+        # the old values and the update, and nothing else
+        with self.assertNumQueries(2):
+            booking.user.save()
+
+    def test_serves_new_bookings_straight_away(self):
+        booking = factories.BookingFactory(booking_date=date(2020, 9, 1))
+
+        json_response = self._get(self.url)
+
+        self.assertEqual(
+            [
+                item["object"]["dit:ReturnToOffice:Booking:bookingId"]
+                for item in json_response["orderedItems"]
+            ],
+            [booking.id],
+        )
+
 
 class TestActivityStreamPRAView(TestCase):
     def setUp(self):
+        cache.clear()
+
         self.url = f"http://testserver{reverse('main:activity-stream-pras')}"
 
     def test_no_header_provided(self):
@@ -253,7 +520,7 @@ class TestActivityStreamPRAView(TestCase):
                 ],
                 "type": "Collection",
                 "orderedItems": [expected_pra_data(pra1)],
-                "next": f"{self.url}?cursor={pra1.created_timestamp.timestamp()}_{pra1.id}",
+                "next": f"{self.url}?cursor={feed_sequence(pra1)}",
             },
         )
 
@@ -282,7 +549,7 @@ class TestActivityStreamPRAView(TestCase):
                 ],
                 "type": "Collection",
                 "orderedItems": [expected_pra_data(pra2)],
-                "next": f"{self.url}?cursor={pra2.created_timestamp.timestamp()}_{pra2.id}",
+                "next": f"{self.url}?cursor={feed_sequence(pra2)}",
             },
         )
 
@@ -312,3 +579,213 @@ class TestActivityStreamPRAView(TestCase):
                 "orderedItems": [],
             },
         )
+
+    @freeze_time("2020-09-01 02:00:00")
+    @override_settings(ACTIVITY_STREAM_ITEMS_PER_PAGE=2)
+    def test_same_timestamp_across_pages(self):
+        pras = [factories.PRAFactory() for _ in range(3)]
+        PRA.objects.update(created_timestamp=datetime(2020, 8, 30, tzinfo=timezone.utc))
+        assign_feed_sequences()
+
+        url = self.url
+        seen = []
+
+        while url:
+            sender = Sender(
+                settings.ACTIVITY_STREAM_HAWK_CREDENTIALS, url, "GET", content="", content_type=""
+            )
+
+            # one query per page, however many items, after checking that there are no
+            # new rows to number
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    url, HTTP_AUTHORIZATION=sender.request_header, HTTP_CONTENT_TYPE=""
+                )
+
+            json_response = response.json()
+            seen += [
+                item["object"]["dit:ReturnToOffice:PRA:praId"]
+                for item in json_response["orderedItems"]
+            ]
+            url = json_response.get("next")
+
+        self.assertEqual(seen, [p.id for p in pras])
+
+
+class TestActivityStreamExportView(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.url = f"http://testserver{reverse('main:activity-stream-bookings-export')}"
+
+    def _get(self, url, **extra):
+        sender = Sender(
+            settings.ACTIVITY_STREAM_HAWK_CREDENTIALS, url, "GET", content="", content_type=""
+        )
+
+        return self.client.get(
+            url, HTTP_AUTHORIZATION=sender.request_header, HTTP_CONTENT_TYPE="", **extra
+        )
+
+    def test_no_header_provided(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    @freeze_time("2020-09-01 02:00:00")
+    def test_export(self):
+        bookings = [factories.BookingFactory(booking_date=datetime(2020, 9, d)) for d in (1, 2)]
+        ChangeLog.record(bookings[0], ChangeLog.ACTION_CREATED)
+
+        response = self._get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+        self.assertEqual(lines[:-1], [expected_booking_data(b) for b in bookings])
+
+        # carry on with the feed from where the export ended
+        feed_url = f"http://testserver{reverse('main:activity-stream-bookings')}"
+        self.assertEqual(lines[-1], {"next": f"{feed_url}?cursor={feed_sequence(bookings[-1])}"})
+
+        new_booking = factories.BookingFactory(booking_date=datetime(2020, 9, 3))
+
+        response = self._get(lines[-1]["next"])
+        self.assertEqual(response.json()["orderedItems"], [expected_booking_data(new_booking)])
+
+    def test_gzip(self):
+        factories.PRAFactory()
+        url = f"http://testserver{reverse('main:activity-stream-pras-export')}"
+
+        response = self._get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+        lines = gzip.decompress(b"".join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 2)
+
+
+class TestActivityStreamChangesView(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _get_all(self, url_name):
+        url = f"http://testserver{reverse(url_name)}"
+        items = []
+
+        while url:
+            sender = Sender(
+                settings.ACTIVITY_STREAM_HAWK_CREDENTIALS, url, "GET", content="", content_type=""
+            )
+            response = self.client.get(
+                url, HTTP_AUTHORIZATION=sender.request_header, HTTP_CONTENT_TYPE=""
+            )
+            self.assertEqual(response.status_code, 200)
+
+            items += response.json()["orderedItems"]
+            url = response.json().get("next")
+
+        return items
+
+    def test_no_header_provided(self):
+        response = self.client.get(reverse("main:activity-stream-booking-changes"))
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(ACTIVITY_STREAM_ITEMS_PER_PAGE=1)
+    def test_booking_changes(self):
+        booking = factories.BookingFactory(booking_date=date(2020, 9, 1))
+        ChangeLog.record(booking, ChangeLog.ACTION_CREATED)
+
+        booking.is_active = False
+        booking.save()
+        ChangeLog.record(booking, ChangeLog.ACTION_CANCELLED)
+
+        ChangeLog.record(factories.PRAFactory(), ChangeLog.ACTION_CREATED)
+
+        ChangeLog.objects.update(timestamp=datetime(2020, 8, 30, tzinfo=timezone.utc))
+
+        items = self._get_all("main:activity-stream-booking-changes")
+
+        self.assertEqual(
+            [item["dit:ReturnToOffice:Change:action"] for item in items], ["created", "cancelled"]
+        )
+        self.assertEqual(
+            [item["object"]["dit:ReturnToOffice:Booking:bookingId"] for item in items],
+            [booking.id, booking.id],
+        )
+        self.assertNotEqual(items[0]["id"], items[1]["id"])
+
+    def test_pra_changes(self):
+        pra = factories.PRAFactory()
+        ChangeLog.record(pra, ChangeLog.ACTION_CREATED)
+        ChangeLog.record(pra, ChangeLog.ACTION_STAFF_MEMBER_APPROVAL)
+
+        ChangeLog.objects.update(timestamp=datetime(2020, 8, 30, tzinfo=timezone.utc))
+
+        items = self._get_all("main:activity-stream-pra-changes")
+
+        self.assertEqual(
+            [item["dit:ReturnToOffice:Change:action"] for item in items],
+            ["created", "staff_member_approval"],
+        )
+        self.assertEqual(items[0]["object"]["dit:ReturnToOffice:PRA:praId"], pra.id)
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class TestCreateBookingFinalizeView(TestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.client.force_login(self.user)
+
+        self.floor = factories.FloorFactory(nr_of_desks=1)
+        self.booking_date = date.today() + timedelta(days=1)
+        self.url = reverse("main:booking-create-finalize")
+
+        set_wizard_state(
+            self.client,
+            self.user,
+            {
+                "for_myself": True,
+                "booking_date": self.booking_date,
+                "building": self.floor.building.pk,
+                "dit_group": DitGroup.objects.first().pk,
+                "business_unit": "Legal",
+                "on_behalf_of_name": "",
+                "on_behalf_of_dit_email": "",
+            },
+        )
+
+    def test_booking_updates_occupancy(self):
+        response = self.client.post(self.url, {"floor": self.floor.pk, "confirmation": "on"})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.filter(floor=self.floor).count(), 1)
+        self.assertEqual(FloorDayOccupancy.get_nr_of_bookings(self.floor.pk, self.booking_date), 1)
+
+    def test_floor_completely_booked(self):
+        FloorDayOccupancy.add_bookings(self.floor.pk, self.booking_date, 1)
+
+        response = self.client.post(self.url, {"floor": self.floor.pk, "confirmation": "on"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Floor is completely booked", response.context["form"].errors["floor"])
+        self.assertFalse(Booking.objects.filter(floor=self.floor).exists())
+
+    def test_cancel_updates_occupancy(self):
+        self.client.post(self.url, {"floor": self.floor.pk, "confirmation": "on"})
+        booking = Booking.objects.get(floor=self.floor)
+
+        response = self.client.post(reverse("main:booking-cancel", kwargs={"pk": booking.pk}))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(FloorDayOccupancy.get_nr_of_bookings(self.floor.pk, self.booking_date), 0)
+        self.assertEqual(
+            list(ChangeLog.objects.order_by("pk").values_list("booking_id", "action")),
+            [(booking.pk, ChangeLog.ACTION_CREATED), (booking.pk, ChangeLog.ACTION_CANCELLED)],
+        )
+        self.assertEqual(
+            list(NotificationOutbox.objects.order_by("pk").values_list("template_id", flat=True)),
+            [
+                settings.GOVUK_NOTIFY_TEMPLATE_BOOKING_CONFIRMATION_V2,
+                settings.GOVUK_NOTIFY_TEMPLATE_CANCELLATION_CONFIRMATION_V2,
+            ],
+        )
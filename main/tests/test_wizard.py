@@ -0,0 +1,75 @@
+import datetime
+
+from django.contrib.sessions.models import Session
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from main import wizard
+from main.models import DitGroup
+from main.serializers import JSONSerializer
+from main.tests import factories
+from main.tests.utils import create_test_user, set_wizard_state
+
+
+def test_serializer_round_trips_dates():
+    value = {
+        "booking_date": datetime.date(2020, 9, 1),
+        "booking_dates": [datetime.date(2020, 9, 1), datetime.date(2020, 9, 2)],
+        "created": datetime.datetime(2020, 9, 1, 12, 30),
+        "building": 1,
+    }
+
+    assert JSONSerializer().loads(JSONSerializer().dumps(value)) == value
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class TestWizardState(TestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.client.force_login(self.user)
+
+        self.dit_group = DitGroup.objects.first()
+        self.booking_date = datetime.date.today() + datetime.timedelta(days=1)
+        self.url = reverse("main:booking-create-business-unit")
+
+        set_wizard_state(
+            self.client,
+            self.user,
+            {"booking_date": self.booking_date, "dit_group": self.dit_group.pk},
+        )
+
+    def get_state(self):
+        return self.client.get(self.url).wsgi_request.wizard.state
+
+    def test_step_keeps_state_in_cookie(self):
+        session_data = Session.objects.get().session_data
+
+        response = self.client.post(self.url, {"business_unit": "Legal"})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(wizard.COOKIE_NAME, response.cookies)
+        self.assertEqual(
+            self.get_state(),
+            {
+                "booking_date": self.booking_date,
+                "dit_group": self.dit_group.pk,
+                "business_unit": "Legal",
+            },
+        )
+
+        # the session wasn't written
+        self.assertEqual(Session.objects.get().session_data, session_data)
+
+    def test_other_users_state_is_ignored(self):
+        set_wizard_state(self.client, factories.UserFactory(), {"dit_group": self.dit_group.pk})
+
+        with self.assertRaises(KeyError):
+            self.client.get(self.url)
+
+    @override_settings(WIZARD_STATE_MAX_COOKIE_SIZE=10)
+    def test_too_big_for_cookie_goes_in_session(self):
+        self.client.post(self.url, {"business_unit": "Legal"})
+
+        self.assertEqual(self.client.cookies[wizard.COOKIE_NAME].value, "")
+        self.assertEqual(self.client.session[wizard.SESSION_KEY]["business_unit"], "Legal")
+        self.assertEqual(self.get_state()["booking_date"], self.booking_date)
@@ -1,5 +1,7 @@
 from django.contrib.auth import get_user_model
 
+from main import wizard
+
 
 def create_test_user():
     test_user_email = "test@example.com"
@@ -18,3 +20,9 @@ def create_test_user():
     test_user.save()
 
     return test_user
+
+
+def set_wizard_state(client, user, state):
+    """Start client (logged in as user) off with state in the booking or PRA flow."""
+
+    client.cookies[wizard.COOKIE_NAME] = wizard.sign(state, user)
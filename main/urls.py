@@ -17,6 +17,8 @@ urlpatterns = [
     ),
     path("booking/create-finalize", views.create_booking_finalize, name="booking-create-finalize"),
     path("booking/<int:pk>/cancel", views.cancel_booking, name="booking-cancel"),
+    path("availability", views.show_availability, name="show-availability"),
+    path("api/buildings/<int:pk>/availability", views.availability_api, name="availability-api"),
     path(
         "activity-stream/bookings", views.activity_stream_bookings, name="activity-stream-bookings"
     ),
@@ -74,4 +76,24 @@ urlpatterns = [
     path("pra/migrate", views_pra.pra_migrate, name="pra-migrate"),
     path("pra/fix", views_pra.pra_fix, name="pra-fix"),
     path("activity-stream/pras", views.activity_stream_pras, name="activity-stream-pras"),
+    path(
+        "activity-stream/bookings-export",
+        views.activity_stream_bookings_export,
+        name="activity-stream-bookings-export",
+    ),
+    path(
+        "activity-stream/pras-export",
+        views.activity_stream_pras_export,
+        name="activity-stream-pras-export",
+    ),
+    path(
+        "activity-stream/booking-changes",
+        views.activity_stream_booking_changes,
+        name="activity-stream-booking-changes",
+    ),
+    path(
+        "activity-stream/pra-changes",
+        views.activity_stream_pra_changes,
+        name="activity-stream-pra-changes",
+    ),
 ]
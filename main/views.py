@@ -1,19 +1,33 @@
 import datetime
-import hmac
+from itertools import islice
 
 from django.conf import settings
 from django.contrib import messages
 from django.db import transaction
-from django.http import JsonResponse
+from django.db.models import Max
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from mohawk import Receiver
-from mohawk.exc import CredentialsLookupError, MacMismatch, MissingAuthorization
-
-from notifications_python_client.notifications import NotificationsAPIClient
-
-from .forms import BookingFormWhoFor, BookingFormInitial, BookingFormFinal, BookingFormBusinessUnit
-from .models import Booking, Floor, Building, DitGroup, PRA
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET
+
+from . import activity_stream, reference_data
+from .availability import get_availability
+from .bookings import create_bookings, create_team_bookings
+from .forms import (
+    AvailabilityForm,
+    BookingFormWhoFor,
+    BookingFormInitial,
+    BookingFormFinal,
+    BookingFormBusinessUnit,
+)
+from .models import (
+    Booking,
+    ChangeLog,
+    FloorDayOccupancy,
+    NotificationOutbox,
+    PRA,
+)
 
 
 def index(req):
@@ -51,6 +65,46 @@ def show_bookings(req):
     return render(req, "main/show_bookings.html", ctx)
 
 
+def show_availability(req):
+    ctx = {}
+
+    form = AvailabilityForm(req.GET or None)
+
+    if form.is_valid():
+        building = reference_data.get_or_404(
+            reference_data.get().get_building, form.cleaned_data["building"]
+        )
+
+        ctx["availability"] = get_availability(
+            building, datetime.date.today(), settings.AVAILABILITY_DEFAULT_DAYS
+        )
+
+    ctx["form"] = form
+
+    return render(req, "main/show_availability.html", ctx)
+
+
+@require_GET
+def availability_api(req, pk):
+    building = reference_data.get_or_404(reference_data.get().get_building, pk)
+
+    try:
+        nr_of_days = int(req.GET.get("days", settings.AVAILABILITY_DEFAULT_DAYS))
+    except ValueError:
+        nr_of_days = 0
+
+    if not (1 <= nr_of_days <= settings.AVAILABILITY_MAX_DAYS):
+        return JsonResponse(
+            data={"error": f"days must be between 1 and {settings.AVAILABILITY_MAX_DAYS}"},
+            status=400,
+        )
+
+    return JsonResponse(
+        data=get_availability(building, datetime.date.today(), nr_of_days),
+        status=200,
+    )
+
+
 def cancel_booking(req, pk):
     with transaction.atomic():
         b = get_object_or_404(Booking.objects.select_for_update(), pk=pk)
@@ -73,9 +127,10 @@ def cancel_booking(req, pk):
         b.canceled_timestamp = datetime.datetime.now()
         b.save()
 
-        nc = NotificationsAPIClient(settings.GOVUK_NOTIFY_API_KEY)
+        FloorDayOccupancy.add_bookings(b.floor_id, b.booking_date, -1)
+        ChangeLog.record(b, ChangeLog.ACTION_CANCELLED)
 
-        nc.send_email_notification(
+        NotificationOutbox.queue(
             email_address=req.user.get_contact_email(),
             template_id=settings.GOVUK_NOTIFY_TEMPLATE_CANCELLATION_CONFIRMATION_V2,
             personalisation={
@@ -98,15 +153,19 @@ def create_booking_who_for(req):
         form = BookingFormWhoFor(req, req.POST)
 
         if form.is_valid():
-            req.session["for_myself"] = bool(int(form.cleaned_data["for_myself"]))
+            req.wizard["for_myself"] = form.cleaned_data["for_myself"] == "1"
+            req.wizard["for_team"] = form.cleaned_data["for_myself"] == "2"
 
             return redirect(reverse("main:booking-create-initial"))
     else:
         if not req.GET.get("back", False):
-            clear_booking_session_variables(req)
+            clear_booking_wizard_state(req)
             initial = None
         else:
-            initial = {"for_myself": str(int(req.session["for_myself"]))}
+            if req.wizard.get("for_team", False):
+                initial = {"for_myself": "2"}
+            else:
+                initial = {"for_myself": str(int(req.wizard["for_myself"]))}
 
         form = BookingFormWhoFor(req, initial=initial)
 
@@ -118,17 +177,22 @@ def create_booking_who_for(req):
 def create_booking_initial(req):
     ctx = {}
 
-    for_myself = req.session["for_myself"]
+    for_myself = req.wizard["for_myself"]
+    for_team = req.wizard.get("for_team", False)
 
     if req.method == "POST":
-        form = BookingFormInitial(for_myself, req.POST)
+        form = BookingFormInitial(for_myself, req.POST, for_team=for_team)
 
         if form.is_valid():
-            req.session["booking_date"] = form.cleaned_data["booking_date"]
-            req.session["building"] = int(form.cleaned_data["building"])
-            req.session["dit_group"] = int(form.cleaned_data["dit_group"])
-            req.session["on_behalf_of_name"] = form.cleaned_data["on_behalf_of_name"]
-            req.session["on_behalf_of_dit_email"] = form.cleaned_data["on_behalf_of_dit_email"]
+            req.wizard["booking_date"] = form.cleaned_data["booking_date"]
+            req.wizard["booking_dates"] = form.get_booking_dates()
+            req.wizard["repeat_weekdays"] = form.cleaned_data["repeat_weekdays"]
+            req.wizard["repeat_until"] = form.cleaned_data["repeat_until"]
+            req.wizard["building"] = int(form.cleaned_data["building"])
+            req.wizard["dit_group"] = int(form.cleaned_data["dit_group"])
+            req.wizard["on_behalf_of_name"] = form.cleaned_data["on_behalf_of_name"]
+            req.wizard["on_behalf_of_dit_email"] = form.cleaned_data["on_behalf_of_dit_email"]
+            req.wizard["team_dit_emails"] = form.cleaned_data["team_dit_emails"]
 
             return redirect(reverse("main:booking-create-business-unit"))
     else:
@@ -136,19 +200,27 @@ def create_booking_initial(req):
             initial = None
         else:
             initial = {
-                "booking_date": req.session["booking_date"].isoformat(),
-                "building": req.session["building"],
-                "dit_group": req.session["dit_group"],
-                "on_behalf_of_name": req.session["on_behalf_of_name"],
-                "on_behalf_of_dit_email": req.session["on_behalf_of_dit_email"],
-                # no need to store this in the session, it will always be True if coming back
+                "booking_date": req.wizard["booking_date"].isoformat(),
+                "repeat_weekdays": req.wizard.get("repeat_weekdays", []),
+                "repeat_until": (
+                    req.wizard["repeat_until"].isoformat()
+                    if req.wizard.get("repeat_until")
+                    else None
+                ),
+                "building": req.wizard["building"],
+                "dit_group": req.wizard["dit_group"],
+                "on_behalf_of_name": req.wizard["on_behalf_of_name"],
+                "on_behalf_of_dit_email": req.wizard["on_behalf_of_dit_email"],
+                "team_dit_emails": "\n".join(req.wizard.get("team_dit_emails", [])),
+                # no need to store this in the wizard state, it will always be True if coming back
                 "confirm_presentation": True,
             }
 
-        form = BookingFormInitial(for_myself, initial=initial)
+        form = BookingFormInitial(for_myself, initial=initial, for_team=for_team)
 
     ctx["form"] = form
     ctx["for_myself"] = for_myself
+    ctx["for_team"] = for_team
 
     return render(req, "main/create_booking_initial.html", ctx)
 
@@ -156,20 +228,20 @@ def create_booking_initial(req):
 def create_booking_business_unit(req):
     ctx = {}
 
-    dit_group = req.session["dit_group"]
+    dit_group = req.wizard["dit_group"]
 
     if req.method == "POST":
         form = BookingFormBusinessUnit(dit_group, req.POST)
 
         if form.is_valid():
-            req.session["business_unit"] = form.cleaned_data["business_unit"]
+            req.wizard["business_unit"] = form.cleaned_data["business_unit"]
 
             return redirect(reverse("main:booking-create-finalize"))
     else:
         if not req.GET.get("back", False):
             initial = None
         else:
-            initial = {"business_unit": req.session["business_unit"]}
+            initial = {"business_unit": req.wizard["business_unit"]}
 
         form = BookingFormBusinessUnit(dit_group, initial=initial)
 
@@ -181,292 +253,411 @@ def create_booking_business_unit(req):
 def create_booking_finalize(req):
     ctx = {}
 
-    building = get_object_or_404(Building, pk=req.session["building"])
-    booking_date = req.session["booking_date"]
-    dit_group = get_object_or_404(DitGroup, pk=req.session["dit_group"]).name
-    business_unit = req.session["business_unit"]
-    on_behalf_of_name = req.session["on_behalf_of_name"]
-    on_behalf_of_dit_email = req.session["on_behalf_of_dit_email"]
+    building = reference_data.get_or_404(reference_data.get().get_building, req.wizard["building"])
+    booking_date = req.wizard["booking_date"]
+    booking_dates = req.wizard.get("booking_dates", [booking_date])
+    dit_group_obj = reference_data.get_or_404(
+        reference_data.get().get_dit_group, req.wizard["dit_group"]
+    )
+    dit_group = dit_group_obj.name
+    business_unit = req.wizard["business_unit"]
+    business_unit_ref = dit_group_obj.get_business_unit(business_unit)
+    on_behalf_of_name = req.wizard["on_behalf_of_name"]
+    on_behalf_of_dit_email = req.wizard["on_behalf_of_dit_email"]
+    team_dit_emails = req.wizard.get("team_dit_emails", [])
 
     if req.method == "POST":
         form = BookingFormFinal(req.POST)
-        form.populate_floors(booking_date, building)
+        form.populate_floors(booking_dates, building)
 
         if form.is_valid():
-            booking = Booking(
-                user=req.user,
-                on_behalf_of_name=on_behalf_of_name or None,
-                on_behalf_of_dit_email=on_behalf_of_dit_email or None,
-                building=building,
-                booking_date=booking_date,
-                floor=get_object_or_404(Floor, pk=int(form.cleaned_data["floor"])),
-                group=dit_group,
-                business_unit=business_unit,
+            floor = reference_data.get_or_404(
+                reference_data.get().get_floor, form.cleaned_data["floor"]
             )
 
-            if booking.booking_date < datetime.date.today():
+            if team_dit_emails:
+                bookings = [
+                    Booking(
+                        user=req.user,
+                        on_behalf_of_name=None,
+                        on_behalf_of_dit_email=email,
+                        building=building,
+                        booking_date=booking_date,
+                        floor=floor,
+                        group=dit_group,
+                        business_unit=business_unit,
+                        business_unit_ref=business_unit_ref,
+                    )
+                    for email in team_dit_emails
+                ]
+            else:
+                bookings = [
+                    Booking(
+                        user=req.user,
+                        on_behalf_of_name=on_behalf_of_name or None,
+                        on_behalf_of_dit_email=on_behalf_of_dit_email or None,
+                        building=building,
+                        booking_date=d,
+                        floor=floor,
+                        group=dit_group,
+                        business_unit=business_unit,
+                        business_unit_ref=business_unit_ref,
+                    )
+                    for d in booking_dates
+                ]
+
+            if min(booking_dates) < datetime.date.today():
                 form.add_error(None, "Bookings cannot be in the past.")
 
-            if booking.floor not in booking.building.floors.all():
+            if floor.building_id != building.pk:
                 # this should not be possible, but guard against it anyway
                 form.add_error(None, "Selected floor does not belong to the selected building.")
 
-            if not form.errors:
-                with transaction.atomic():
-                    # lock the floor we're trying to book
-                    locked_floor = Floor.objects.select_for_update().get(  # noqa
-                        pk=booking.floor_id
+            # the bookings and their confirmation email are committed together
+            with transaction.atomic():
+                if not form.errors and team_dit_emails:
+                    created, failed = create_team_bookings(
+                        bookings, split_across_floors=form.cleaned_data["split_across_floors"]
                     )
 
-                    bookings_cnt = Booking.objects.filter(
-                        is_active=True,
-                        booking_date=booking.booking_date,
-                        building=booking.building,
-                        floor=booking.floor,
-                    ).count()
-
-                    success = False
-
-                    if bookings_cnt < booking.floor.nr_of_desks:
-                        duplicate_bookings_cnt = Booking.objects.filter(
-                            is_active=True,
-                            booking_date=booking.booking_date,
-                            building=booking.building,
-                            floor=booking.floor,
-                            user=booking.user,
-                            on_behalf_of_name=booking.on_behalf_of_name,
-                            on_behalf_of_dit_email=booking.on_behalf_of_dit_email,
-                        ).count()
-
-                        if duplicate_bookings_cnt == 0:
-                            booking.save()
-
-                            success = True
-                        else:
-                            form.add_error("floor", "Cannot add duplicate booking")
-
+                    for booking, reason in failed:
+                        form.add_error("floor", f"{booking.on_behalf_of_dit_email}: {reason}")
+                elif not form.errors:
+                    created, failed = create_bookings(bookings)
+
+                    if not created:
+                        for booking, reason in failed:
+                            form.add_error(
+                                "floor",
+                                reason
+                                if len(bookings) == 1
+                                else f"{booking.booking_date}: {reason}",
+                            )
                     else:
-                        form.add_error("floor", "Floor is completely booked")
+                        for booking, reason in failed:
+                            messages.error(req, f"{booking.booking_date} was not booked: {reason}")
 
-                if success:
-                    nc = NotificationsAPIClient(settings.GOVUK_NOTIFY_API_KEY)
+                if not form.errors:
+                    # one summary email for all the days / people booked
+                    booking = created[0]
 
-                    nc.send_email_notification(
+                    NotificationOutbox.queue(
                         email_address=req.user.get_contact_email(),
                         template_id=settings.GOVUK_NOTIFY_TEMPLATE_BOOKING_CONFIRMATION_V2,
                         personalisation={
-                            "on_behalf_of": booking.get_on_behalf_of(),
-                            "date": str(booking.booking_date),
+                            "on_behalf_of": ", ".join(
+                                dict.fromkeys(b.get_on_behalf_of() for b in created)
+                            ),
+                            "date": ", ".join(dict.fromkeys(str(b.booking_date) for b in created)),
                             "building": str(booking.building),
-                            "floor": str(booking.floor),
+                            "floor": ", ".join(dict.fromkeys(str(b.floor) for b in created)),
                             "dit_group": booking.group,
                             "business_unit": booking.business_unit,
                         },
                     )
 
-                    clear_booking_session_variables(req)
+                    clear_booking_wizard_state(req)
 
                     return redirect(reverse("main:show-bookings") + "?show_confirmation=1")
     else:
         form = BookingFormFinal()
-        form.populate_floors(booking_date, building)
+        form.populate_floors(booking_dates, building)
 
     ctx["form"] = form
     ctx["booking_date"] = booking_date
+    ctx["booking_dates"] = booking_dates
     ctx["building"] = building
     ctx["dit_group"] = dit_group
     ctx["business_unit"] = business_unit
     ctx["on_behalf_of_name"] = on_behalf_of_name
     ctx["on_behalf_of_dit_email"] = on_behalf_of_dit_email
+    ctx["team_dit_emails"] = team_dit_emails
 
     return render(req, "main/create_booking_finalize.html", ctx)
 
 
-def clear_booking_session_variables(req):
-    """Clear booking flow related session variables."""
+def clear_booking_wizard_state(req):
+    """Clear the state of the booking flow."""
 
     for key in [
         "for_myself",
+        "for_team",
         "booking_date",
+        "booking_dates",
+        "repeat_weekdays",
+        "repeat_until",
         "building",
         "dit_group",
         "business_unit",
         "on_behalf_of_name",
         "on_behalf_of_dit_email",
+        "team_dit_emails",
     ]:
-        if key in req.session:
-            del req.session[key]
+        if key in req.wizard:
+            del req.wizard[key]
 
 
 def activity_stream_bookings(request):
-    def lookup_credentials(passed_id):
-        return (
-            settings.ACTIVITY_STREAM_HAWK_CREDENTIALS
-            if hmac.compare_digest(passed_id, settings.ACTIVITY_STREAM_HAWK_CREDENTIALS["id"])
-            else None
+    if not activity_stream.is_authenticated(request):
+        return JsonResponse(
+            data={},
+            status=403,
         )
 
-    try:
-        Receiver(
-            lookup_credentials,
-            request.headers.get("Authorization"),
-            request.build_absolute_uri(),
-            request.method,
-            content=request.body,
-            content_type=request.headers.get("Content-Type"),
+    activity_stream.assign_feed_sequences()
+
+    after = activity_stream.get_cursor(request, Booking.objects.all(), "booked_timestamp")
+
+    def build_page():
+        # feed_sequence is handed out in commit order (see
+        # activity_stream.assign_feed_sequences), so it's safe to serve right up to
+        # the newest booking
+        bookings = list(
+            Booking.objects.filter(feed_sequence__gt=after).order_by("feed_sequence")[
+                : settings.ACTIVITY_STREAM_ITEMS_PER_PAGE
+            ]
         )
-    except (MissingAuthorization, CredentialsLookupError, MacMismatch):
+
+        activity_stream.fill_missing_objects(bookings)
+
+        abs_url = request.build_absolute_uri(reverse("main:activity-stream-bookings"))
+
+        body = activity_stream.make_page_json(
+            [_booking_item(booking) for booking in bookings],
+            (f"{abs_url}?cursor={bookings[-1].feed_sequence}" if bookings else None),
+        )
+
+        return (
+            body,
+            (
+                bookings[-1].feed_sequence
+                if len(bookings) == settings.ACTIVITY_STREAM_ITEMS_PER_PAGE
+                else None
+            ),
+            activity_stream.page_version(bookings),
+        )
+
+    return activity_stream.page_response(
+        request,
+        after,
+        build_page,
+        lambda last: activity_stream.get_version(
+            Booking.objects.filter(feed_sequence__gt=after, feed_sequence__lte=last)
+        ),
+    )
+
+
+def activity_stream_pras(request):
+    if not activity_stream.is_authenticated(request):
         return JsonResponse(
             data={},
             status=403,
         )
 
-    # Get cursor
-    after_ts_str, after_booking_id_str = request.GET.get("cursor", "0.0_0").split("_")
-    after_ts = datetime.datetime.fromtimestamp(float(after_ts_str))
+    activity_stream.assign_feed_sequences()
 
-    bookings = list(
-        Booking.objects.extra(
-            where=[
-                "booked_timestamp > %s",
-                "booked_timestamp < STATEMENT_TIMESTAMP() - INTERVAL '1 second'",
-            ],
-            params=(after_ts,),
-        ).order_by("booked_timestamp")[: settings.ACTIVITY_STREAM_ITEMS_PER_PAGE]
-    )
+    after = activity_stream.get_cursor(request, PRA.objects.all(), "created_timestamp")
 
-    abs_url = request.build_absolute_uri(reverse("main:activity-stream-bookings"))
-
-    page = {
-        "@context": [
-            "https://www.w3.org/ns/activitystreams",
-            {"dit": "https://www.trade.gov.uk/ns/activitystreams/v1"},
-        ],
-        "type": "Collection",
-        "orderedItems": [
-            {
-                "id": f"dit:ReturnToOffice:Booking:{booking.id}:Update",
-                "published": booking.booked_timestamp,
-                "object": {
-                    "id": f"dit:ReturnToOffice:Booking:{booking.id}",
-                    "type": "dit:ReturnToOffice:Booking",
-                    "dit:ReturnToOffice:Booking:bookingId": booking.id,
-                    "dit:ReturnToOffice:Booking:userId": booking.user_id,
-                    "dit:ReturnToOffice:Booking:userEmail": booking.user.email,
-                    "dit:ReturnToOffice:Booking:userFullName": booking.user.get_short_name(),
-                    "dit:ReturnToOffice:Booking:onBehalfOfName": booking.on_behalf_of_name,
-                    "dit:ReturnToOffice:Booking:onBehalfOfEmail": booking.on_behalf_of_dit_email,
-                    "dit:ReturnToOffice:Booking:bookingDate": booking.booking_date,
-                    "dit:ReturnToOffice:Booking:building": booking.building.name,
-                    "dit:ReturnToOffice:Booking:floor": booking.floor.name,
-                    "dit:ReturnToOffice:Booking:directorate": booking.directorate,
-                    "dit:ReturnToOffice:Booking:group": booking.group,
-                    "dit:ReturnToOffice:Booking:businessUnit": booking.business_unit,
-                    "dit:ReturnToOffice:Booking:created": booking.booked_timestamp,
-                    "dit:ReturnToOffice:Booking:cancelled": booking.canceled_timestamp,
-                },
-            }
-            for booking in bookings
-        ],
-        **(
-            {
-                "next": f"{abs_url}?cursor={bookings[-1].booked_timestamp.timestamp()}_{bookings[-1].id}"
-            }
-            if bookings
-            else {}
+    def build_page():
+        pras = list(
+            PRA.objects.filter(feed_sequence__gt=after).order_by("feed_sequence")[
+                : settings.ACTIVITY_STREAM_ITEMS_PER_PAGE
+            ]
+        )
+
+        activity_stream.fill_missing_objects(pras)
+
+        abs_url = request.build_absolute_uri(reverse("main:activity-stream-pras"))
+
+        body = activity_stream.make_page_json(
+            [_pra_item(pra) for pra in pras],
+            (f"{abs_url}?cursor={pras[-1].feed_sequence}" if pras else None),
+        )
+
+        return (
+            body,
+            pras[-1].feed_sequence
+            if len(pras) == settings.ACTIVITY_STREAM_ITEMS_PER_PAGE
+            else None,
+            activity_stream.page_version(pras),
+        )
+
+    return activity_stream.page_response(
+        request,
+        after,
+        build_page,
+        lambda last: activity_stream.get_version(
+            PRA.objects.filter(feed_sequence__gt=after, feed_sequence__lte=last)
         ),
-    }
+    )
 
-    return JsonResponse(
-        data=page,
-        status=200,
+
+def _booking_item(booking: Booking) -> str:
+    return activity_stream.make_item(
+        {
+            "id": f"dit:ReturnToOffice:Booking:{booking.id}:Update",
+            "published": booking.booked_timestamp,
+        },
+        booking,
     )
 
 
-def activity_stream_pras(request):
-    def lookup_credentials(passed_id):
-        return (
-            settings.ACTIVITY_STREAM_HAWK_CREDENTIALS
-            if hmac.compare_digest(passed_id, settings.ACTIVITY_STREAM_HAWK_CREDENTIALS["id"])
-            else None
+def _pra_item(pra: PRA) -> str:
+    return activity_stream.make_item(
+        {
+            "id": f"dit:ReturnToOffice:PRA:{pra.id}:Update",
+            "published": pra.created_timestamp,
+        },
+        pra,
+    )
+
+
+@gzip_page
+def activity_stream_bookings_export(request):
+    """Every booking, one item per line, for consumers loading the whole feed."""
+
+    return _activity_stream_export(
+        request,
+        Booking.objects.all(),
+        _booking_item,
+        "main:activity-stream-bookings",
+    )
+
+
+@gzip_page
+def activity_stream_pras_export(request):
+    """Every PRA, one item per line, for consumers loading the whole feed."""
+
+    return _activity_stream_export(
+        request,
+        PRA.objects.all(),
+        _pra_item,
+        "main:activity-stream-pras",
+    )
+
+
+def _activity_stream_export(request, queryset, make_item, url_name):
+    """Stream the items of a feed as newline-delimited JSON.
+
+    The last line is {"next": url}: the page of the feed at url_name that carries
+    on from the export. A response without it was cut short.
+    """
+
+    if not activity_stream.is_authenticated(request):
+        return JsonResponse(
+            data={},
+            status=403,
         )
 
-    try:
-        Receiver(
-            lookup_credentials,
-            request.headers.get("Authorization"),
-            request.build_absolute_uri(),
-            request.method,
-            content=request.body,
-            content_type=request.headers.get("Content-Type"),
+    activity_stream.assign_feed_sequences()
+
+    # nothing can be numbered up to here any more (see assign_feed_sequences)
+    head = queryset.aggregate(head=Max("feed_sequence"))["head"] or 0
+
+    next_url = f"{request.build_absolute_uri(reverse(url_name))}?cursor={head}"
+
+    def lines():
+        chunk_size = settings.ACTIVITY_STREAM_EXPORT_CHUNK_SIZE
+
+        objs = (
+            queryset.filter(feed_sequence__lte=head)
+            .order_by("feed_sequence")
+            .iterator(chunk_size=chunk_size)
         )
-    except (MissingAuthorization, CredentialsLookupError, MacMismatch):
+
+        for chunk in iter(lambda: list(islice(objs, chunk_size)), []):
+            activity_stream.fill_missing_objects(chunk)
+
+            for obj in chunk:
+                yield f"{make_item(obj)}\n"
+
+        yield f"{activity_stream.to_json({'next': next_url})}\n"
+
+    return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+
+def activity_stream_booking_changes(request):
+    """Every change to every booking (created, cancelled), oldest first."""
+
+    return _activity_stream_changes(
+        request,
+        "booking",
+        "Booking",
+        "main:activity-stream-booking-changes",
+    )
+
+
+def activity_stream_pra_changes(request):
+    """Every change to every PRA (created, approved or not, updated), oldest first."""
+
+    return _activity_stream_changes(
+        request,
+        "pra",
+        "PRA",
+        "main:activity-stream-pra-changes",
+    )
+
+
+def _activity_stream_changes(request, field, type_name, url_name):
+    if not activity_stream.is_authenticated(request):
         return JsonResponse(
             data={},
             status=403,
         )
 
-    # Get cursor
-    after_ts_str, after_pra_id_str = request.GET.get("cursor", "0.0_0").split("_")
-    after_ts = datetime.datetime.fromtimestamp(float(after_ts_str))
+    activity_stream.assign_feed_sequences()
 
-    pras = list(
-        PRA.objects.extra(
-            where=[
-                "created_timestamp > %s",
-                "created_timestamp < STATEMENT_TIMESTAMP() - INTERVAL '1 second'",
+    changes_qs = ChangeLog.objects.filter(**{f"{field}__isnull": False})
+
+    after = activity_stream.get_cursor(request, changes_qs, "timestamp")
+
+    def build_page():
+        changes = list(
+            changes_qs.select_related(field)
+            .filter(feed_sequence__gt=after)
+            .order_by("feed_sequence")[: settings.ACTIVITY_STREAM_ITEMS_PER_PAGE]
+        )
+
+        activity_stream.fill_missing_objects([getattr(change, field) for change in changes])
+
+        abs_url = request.build_absolute_uri(reverse(url_name))
+
+        body = activity_stream.make_page_json(
+            [
+                activity_stream.make_item(
+                    {
+                        "id": f"dit:ReturnToOffice:{type_name}:{getattr(change, f'{field}_id')}:Change:{change.id}",
+                        "type": "Update",
+                        "published": change.timestamp,
+                        "dit:ReturnToOffice:Change:action": change.action,
+                    },
+                    getattr(change, field),
+                )
+                for change in changes
             ],
-            params=(after_ts,),
-        ).order_by("created_timestamp")[: settings.ACTIVITY_STREAM_ITEMS_PER_PAGE]
-    )
+            (f"{abs_url}?cursor={changes[-1].feed_sequence}" if changes else None),
+        )
 
-    abs_url = request.build_absolute_uri(reverse("main:activity-stream-pras"))
-
-    page = {
-        "@context": [
-            "https://www.w3.org/ns/activitystreams",
-            {"dit": "https://www.trade.gov.uk/ns/activitystreams/v1"},
-        ],
-        "type": "Collection",
-        "orderedItems": [
-            {
-                "id": f"dit:ReturnToOffice:PRA:{pra.id}:Update",
-                "published": pra.created_timestamp,
-                "object": {
-                    "id": f"dit:ReturnToOffice:PRA:{pra.id}",
-                    "type": "dit:ReturnToOffice:PRA",
-                    "dit:ReturnToOffice:PRA:praId": pra.id,
-                    "dit:ReturnToOffice:PRA:staffMemberId": pra.staff_member_id,
-                    "dit:ReturnToOffice:PRA:staffMemberEmail": pra.staff_member.email,
-                    "dit:ReturnToOffice:PRA:staffMemberFullName": pra.staff_member.get_short_name(),
-                    "dit:ReturnToOffice:PRA:lineManagerId": pra.line_manager_id,
-                    "dit:ReturnToOffice:PRA:lineManagerEmail": pra.line_manager.email,
-                    "dit:ReturnToOffice:PRA:lineManagerFullName": pra.line_manager.get_short_name(),
-                    "dit:ReturnToOffice:PRA:scsId": pra.scs_id,
-                    "dit:ReturnToOffice:PRA:scsEmail": pra.scs.email,
-                    "dit:ReturnToOffice:PRA:scsFullName": pra.scs.get_short_name(),
-                    "dit:ReturnToOffice:PRA:authorizedReason": pra.authorized_reason,
-                    "dit:ReturnToOffice:PRA:group": pra.group,
-                    "dit:ReturnToOffice:PRA:businessUnit": pra.business_unit,
-                    "dit:ReturnToOffice:PRA:riskCategory": pra.risk_category_desc(),
-                    "dit:ReturnToOffice:PRA:mitigationOutcome": pra.mitigation_outcome_desc(),
-                    "dit:ReturnToOffice:PRA:mitigationMeasures": pra.mitigation_measures,
-                    "dit:ReturnToOffice:PRA:created": pra.created_timestamp,
-                    "dit:ReturnToOffice:PRA:approvedStaffMember": pra.approved_staff_member,
-                    "dit:ReturnToOffice:PRA:approvedSCS": pra.approved_scs,
-                    "dit:ReturnToOffice:PRA:migrated": pra.migrated,
-                },
-            }
-            for pra in pras
-        ],
-        **(
-            {"next": f"{abs_url}?cursor={pras[-1].created_timestamp.timestamp()}_{pras[-1].id}"}
-            if pras
-            else {}
-        ),
-    }
+        return (
+            body,
+            (
+                changes[-1].feed_sequence
+                if len(changes) == settings.ACTIVITY_STREAM_ITEMS_PER_PAGE
+                else None
+            ),
+            activity_stream.page_version([getattr(change, field) for change in changes]),
+        )
 
-    return JsonResponse(
-        data=page,
-        status=200,
+    return activity_stream.page_response(
+        request,
+        after,
+        build_page,
+        # the objects are included as they are now, so they can change too
+        lambda last: activity_stream.get_version(
+            ChangeLog._meta.get_field(field).related_model.objects.filter(
+                pk__in=changes_qs.filter(feed_sequence__gt=after, feed_sequence__lte=last).values(
+                    field
+                )
+            )
+        ),
     )
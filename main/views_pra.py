@@ -8,13 +8,12 @@ from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
 from django.conf import settings
 from django.core.validators import validate_email
 from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.views.decorators.http import require_POST
 from django import forms
 
-from notifications_python_client.notifications import NotificationsAPIClient
-
 from custom_usermodel.models import User
 
 from .forms_pra import (
@@ -28,7 +27,8 @@ from .forms_pra import (
     PRAFormFix,
 )
 
-from .models import PRA, DitGroup
+from . import reference_data
+from .models import PRA, ChangeLog, NotificationOutbox
 
 
 # TODO: this can be deleted after migration of data from legacy form has been done
@@ -200,36 +200,41 @@ class LegacyPRA:
         )
 
     def execute_migrate(self, req):
-        assert self.do_migrate
+        """Save the new PRA, and queue the email asking for approval (if any) in the
+        same transaction. Return str describing the actions taken."""
 
-        self.new_pra.save()
-        nc = NotificationsAPIClient(settings.GOVUK_NOTIFY_API_KEY)
-        link = req.build_absolute_uri(reverse("main:pra-view", kwargs={"pk": self.new_pra.pk}))
-
-        if self.new_pra.approved_staff_member is None:
-            nc.send_email_notification(
-                email_address=self.new_pra.staff_member.get_contact_email(),
-                template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_ASK_STAFF_FOR_APPROVAL,
-                personalisation={
-                    "link": link,
-                    "line_manager": self.new_pra.line_manager.full_name(),
-                },
-            )
-
-            return "Emailed staff member for approval"
-
-        elif self.new_pra.approved_scs is None:
-            nc.send_email_notification(
-                email_address=self.new_pra.scs.get_contact_email(),
-                template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_ASK_SCS_FOR_APPROVAL,
-                personalisation={
-                    "link": link,
-                    "staff_member": self.new_pra.staff_member.full_name(),
-                    "line_manager": self.new_pra.line_manager.full_name(),
-                },
-            )
+        assert self.do_migrate
 
-            return "Emailed SCS for approval"
+        with transaction.atomic():
+            self.new_pra.save()
+            ChangeLog.record(self.new_pra, ChangeLog.ACTION_CREATED)
+
+            link = req.build_absolute_uri(reverse("main:pra-view", kwargs={"pk": self.new_pra.pk}))
+
+            if self.new_pra.approved_staff_member is None:
+                NotificationOutbox.queue(
+                    self.new_pra.staff_member.get_contact_email(),
+                    settings.GOVUK_NOTIFY_TEMPLATE_PRA_ASK_STAFF_FOR_APPROVAL,
+                    {
+                        "link": link,
+                        "line_manager": self.new_pra.line_manager.full_name(),
+                    },
+                )
+
+                return "Queued email to staff member for approval"
+
+            elif self.new_pra.approved_scs is None:
+                NotificationOutbox.queue(
+                    self.new_pra.scs.get_contact_email(),
+                    settings.GOVUK_NOTIFY_TEMPLATE_PRA_ASK_SCS_FOR_APPROVAL,
+                    {
+                        "link": link,
+                        "staff_member": self.new_pra.staff_member.full_name(),
+                        "line_manager": self.new_pra.line_manager.full_name(),
+                    },
+                )
+
+                return "Queued email to SCS for approval"
 
         return "Approved PRA saved"
 
@@ -241,20 +246,20 @@ def create_pra_initial(req):
         form = PRAFormInitial(req.POST)
 
         if form.is_valid():
-            req.session["pra_staff_member_email"] = form.cleaned_data["staff_member_email"]
-            req.session["pra_scs_email"] = form.cleaned_data["scs_email"]
-            req.session["pra_dit_group"] = int(form.cleaned_data["dit_group"])
+            req.wizard["pra_staff_member_email"] = form.cleaned_data["staff_member_email"]
+            req.wizard["pra_scs_email"] = form.cleaned_data["scs_email"]
+            req.wizard["pra_dit_group"] = int(form.cleaned_data["dit_group"])
 
             return redirect(reverse("main:pra-create-business-unit"))
     else:
         if not req.GET.get("back", False):
-            clear_pra_session_variables(req)
+            clear_pra_wizard_state(req)
             initial = None
         else:
             initial = {
-                "staff_member_email": req.session["pra_staff_member_email"],
-                "scs_email": req.session["pra_scs_email"],
-                "dit_group": req.session["pra_dit_group"],
+                "staff_member_email": req.wizard["pra_staff_member_email"],
+                "scs_email": req.wizard["pra_scs_email"],
+                "dit_group": req.wizard["pra_dit_group"],
             }
 
         form = PRAFormInitial(initial=initial)
@@ -267,20 +272,20 @@ def create_pra_initial(req):
 def create_pra_business_unit(req):
     ctx = {}
 
-    dit_group = req.session["pra_dit_group"]
+    dit_group = req.wizard["pra_dit_group"]
 
     if req.method == "POST":
         form = PRAFormBusinessUnit(dit_group, req.POST)
 
         if form.is_valid():
-            req.session["pra_business_unit"] = form.cleaned_data["business_unit"]
+            req.wizard["pra_business_unit"] = form.cleaned_data["business_unit"]
 
             return redirect(reverse("main:pra-create-risk-category"))
     else:
         if not req.GET.get("back", False):
             initial = None
         else:
-            initial = {"business_unit": req.session["pra_business_unit"]}
+            initial = {"business_unit": req.wizard["pra_business_unit"]}
 
         form = PRAFormBusinessUnit(dit_group, initial=initial)
 
@@ -297,7 +302,7 @@ def create_pra_risk_category(req):
 
         if form.is_valid():
             rc = form.cleaned_data["risk_category"]
-            req.session["pra_risk_category"] = rc
+            req.wizard["pra_risk_category"] = rc
 
             if rc == PRA.RC_PREFER_NOT_TO_SAY:
                 return redirect(reverse("main:pra-create-prefer-not-to-say"))
@@ -321,7 +326,7 @@ def create_pra_risk_category(req):
         if not req.GET.get("back", False):
             initial = None
         else:
-            initial = {"risk_category": req.session["pra_risk_category"]}
+            initial = {"risk_category": req.wizard["pra_risk_category"]}
 
         form = PRAFormRiskCategory(initial=initial)
 
@@ -360,7 +365,7 @@ def create_pra_mitigation(req):
 
         if form.is_valid():
             mo = form.cleaned_data["mitigation_outcome"]
-            req.session["pra_mitigation_outcome"] = mo
+            req.wizard["pra_mitigation_outcome"] = mo
 
             if mo == PRA.MO_APPROVE_NO_MITIGATION:
                 errors_or_redirect = create_pra_submit(req)
@@ -380,7 +385,7 @@ def create_pra_mitigation(req):
         if not req.GET.get("back", False):
             initial = None
         else:
-            initial = {"mitigation_outcome": req.session["pra_mitigation_outcome"]}
+            initial = {"mitigation_outcome": req.wizard["pra_mitigation_outcome"]}
 
         form = PRAFormMitigation(initial=initial)
 
@@ -396,7 +401,7 @@ def create_pra_mitigation_approve(req):
         form = PRAFormMitigationApprove(req.POST)
 
         if form.is_valid():
-            req.session["pra_mitigation_measures"] = form.cleaned_data["mitigation_measures"]
+            req.wizard["pra_mitigation_measures"] = form.cleaned_data["mitigation_measures"]
 
             errors_or_redirect = create_pra_submit(req)
 
@@ -420,7 +425,7 @@ def create_pra_mitigation_do_not_approve(req):
         form = PRAFormMitigationDoNotApprove(req.POST)
 
         if form.is_valid():
-            req.session["pra_mitigation_measures"] = form.cleaned_data["mitigation_measures"]
+            req.wizard["pra_mitigation_measures"] = form.cleaned_data["mitigation_measures"]
 
             errors_or_redirect = create_pra_submit(req)
 
@@ -440,14 +445,18 @@ def create_pra_mitigation_do_not_approve(req):
 def create_pra_submit(req: HttpRequest):
     """ Returns either a list[str] of errors, or a str which is a redirect URL."""
 
-    staff_member_email = req.session["pra_staff_member_email"]
-    scs_email = req.session["pra_scs_email"]
-    dit_group = get_object_or_404(DitGroup, pk=req.session["pra_dit_group"]).name
-    business_unit = req.session["pra_business_unit"]
+    staff_member_email = req.wizard["pra_staff_member_email"]
+    scs_email = req.wizard["pra_scs_email"]
+    dit_group_obj = reference_data.get_or_404(
+        reference_data.get().get_dit_group, req.wizard["pra_dit_group"]
+    )
+    dit_group = dit_group_obj.name
+    business_unit = req.wizard["pra_business_unit"]
+    business_unit_ref = dit_group_obj.get_business_unit(business_unit)
     authorized_reason = "N/A"
-    risk_category = req.session["pra_risk_category"]
-    mitigation_outcome = req.session.get("pra_mitigation_outcome", "")
-    mitigation_measures = req.session.get("pra_mitigation_measures", "")
+    risk_category = req.wizard["pra_risk_category"]
+    mitigation_outcome = req.wizard.get("pra_mitigation_outcome", "")
+    mitigation_measures = req.wizard.get("pra_mitigation_measures", "")
 
     errors = []
 
@@ -473,6 +482,7 @@ def create_pra_submit(req: HttpRequest):
         line_manager=req.user,
         group=dit_group,
         business_unit=business_unit,
+        business_unit_ref=business_unit_ref,
         authorized_reason=authorized_reason,
         risk_category=risk_category,
         mitigation_outcome=mitigation_outcome,
@@ -480,31 +490,32 @@ def create_pra_submit(req: HttpRequest):
         migrated=False,
     )
 
-    pra.save()
-    clear_pra_session_variables(req)
+    with transaction.atomic():
+        pra.save()
+        ChangeLog.record(pra, ChangeLog.ACTION_CREATED)
 
-    nc = NotificationsAPIClient(settings.GOVUK_NOTIFY_API_KEY)
+        if pra.needs_staff_member_approval():
+            link = req.build_absolute_uri(reverse("main:pra-view", kwargs={"pk": pra.pk}))
 
-    if pra.needs_staff_member_approval():
-        link = req.build_absolute_uri(reverse("main:pra-view", kwargs={"pk": pra.pk}))
+            NotificationOutbox.queue(
+                email_address=staff_member.get_contact_email(),
+                template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_ASK_STAFF_FOR_APPROVAL,
+                personalisation={
+                    "link": link,
+                    "line_manager": pra.line_manager.full_name(),
+                },
+            )
+        else:
+            # PRA rejected immediately, do not even ask staff_member for approval, just notify them
+            NotificationOutbox.queue(
+                email_address=staff_member.get_contact_email(),
+                template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_REJECTED_BY_LINE_MANAGER,
+                personalisation={
+                    "line_manager": pra.line_manager.full_name(),
+                },
+            )
 
-        nc.send_email_notification(
-            email_address=staff_member.get_contact_email(),
-            template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_ASK_STAFF_FOR_APPROVAL,
-            personalisation={
-                "link": link,
-                "line_manager": pra.line_manager.full_name(),
-            },
-        )
-    else:
-        # PRA rejected immediately, do not even ask staff_member for approval, just notify them
-        nc.send_email_notification(
-            email_address=staff_member.get_contact_email(),
-            template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_REJECTED_BY_LINE_MANAGER,
-            personalisation={
-                "line_manager": pra.line_manager.full_name(),
-            },
-        )
+    clear_pra_wizard_state(req)
 
     return reverse("main:pra-show-thanks")
 
@@ -547,35 +558,35 @@ def _mark_pra_staff_member_approval(req: HttpRequest, pk: int, approval: bool) -
     if not pra.needs_staff_member_approval():
         raise Exception("PRA does not need staff member approval")
 
-    pra.approved_staff_member = approval
-    pra.save()
-
     link = req.build_absolute_uri(reverse("main:pra-view", kwargs={"pk": pra.pk}))
 
-    nc = NotificationsAPIClient(settings.GOVUK_NOTIFY_API_KEY)
-
-    nc.send_email_notification(
-        email_address=pra.line_manager.get_contact_email(),
-        template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_INFORM_LINE_MANAGER,
-        personalisation={
-            "link": link,
-            "role": "A staff member",
-            "who": pra.staff_member.full_name(),
-            "action": "approved" if approval else "rejected",
-        },
-    )
+    with transaction.atomic():
+        pra.approved_staff_member = approval
+        pra.save()
+        ChangeLog.record(pra, ChangeLog.ACTION_STAFF_MEMBER_APPROVAL)
 
-    if approval:
-        nc.send_email_notification(
-            email_address=pra.scs.get_contact_email(),
-            template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_ASK_SCS_FOR_APPROVAL,
+        NotificationOutbox.queue(
+            email_address=pra.line_manager.get_contact_email(),
+            template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_INFORM_LINE_MANAGER,
             personalisation={
                 "link": link,
-                "staff_member": pra.staff_member.full_name(),
-                "line_manager": pra.line_manager.full_name(),
+                "role": "A staff member",
+                "who": pra.staff_member.full_name(),
+                "action": "approved" if approval else "rejected",
             },
         )
 
+        if approval:
+            NotificationOutbox.queue(
+                email_address=pra.scs.get_contact_email(),
+                template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_ASK_SCS_FOR_APPROVAL,
+                personalisation={
+                    "link": link,
+                    "staff_member": pra.staff_member.full_name(),
+                    "line_manager": pra.line_manager.full_name(),
+                },
+            )
+
     return redirect(reverse("main:pra-view", kwargs={"pk": pra.pk}))
 
 
@@ -598,23 +609,23 @@ def _mark_pra_scs_approval(req: HttpRequest, pk: int, approval: bool) -> HttpRes
     if not pra.needs_scs_approval():
         raise Exception("PRA does not need SCS approval")
 
-    pra.approved_scs = approval
-    pra.save()
-
     link = req.build_absolute_uri(reverse("main:pra-view", kwargs={"pk": pra.pk}))
 
-    nc = NotificationsAPIClient(settings.GOVUK_NOTIFY_API_KEY)
-
-    nc.send_email_notification(
-        email_address=pra.line_manager.get_contact_email(),
-        template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_INFORM_LINE_MANAGER,
-        personalisation={
-            "link": link,
-            "role": "SCS",
-            "who": pra.scs.full_name(),
-            "action": "approved" if approval else "rejected",
-        },
-    )
+    with transaction.atomic():
+        pra.approved_scs = approval
+        pra.save()
+        ChangeLog.record(pra, ChangeLog.ACTION_SCS_APPROVAL)
+
+        NotificationOutbox.queue(
+            email_address=pra.line_manager.get_contact_email(),
+            template_id=settings.GOVUK_NOTIFY_TEMPLATE_PRA_INFORM_LINE_MANAGER,
+            personalisation={
+                "link": link,
+                "role": "SCS",
+                "who": pra.scs.full_name(),
+                "action": "approved" if approval else "rejected",
+            },
+        )
 
     return redirect(reverse("main:pra-view", kwargs={"pk": pra.pk}))
 
@@ -667,11 +678,14 @@ def pra_migrate(req):
                     yield f"Pre-populating {len(LegacyPRA.user_cache)} users...\n"
                     LegacyPRA.save_cached_users()
 
+                    yield f"Saving {len(old_pras)} PRAs...\n"
+
+                    # the emails are sent by the send_notifications worker, so this
+                    # doesn't wait for Notify (or lose them if it's down)
                     for i, old_pra in enumerate(old_pras):
                         yield f"Processing {i+1}/{len(old_pras)}: {old_pra.staff_member_name} ({old_pra.staff_member_email})..."
 
-                        actions = old_pra.execute_migrate(req) + "\n"
-                        yield actions
+                        yield old_pra.execute_migrate(req) + "\n"
 
                     yield "All done!"
 
@@ -727,6 +741,7 @@ def pra_fix(req):
         def execute(self):
             self.pra.staff_member = self.right_user
             self.pra.save()
+            ChangeLog.record(self.pra, ChangeLog.ACTION_UPDATED)
 
     class FixLineManagerItem(Item):
         def __init__(self, pra, wrong_user, right_user):
@@ -743,6 +758,7 @@ def pra_fix(req):
         def execute(self):
             self.pra.line_manager = self.right_user
             self.pra.save()
+            ChangeLog.record(self.pra, ChangeLog.ACTION_UPDATED)
 
     class FixSCSItem(Item):
         def __init__(self, pra, wrong_user, right_user):
@@ -759,6 +775,7 @@ def pra_fix(req):
         def execute(self):
             self.pra.scs = self.right_user
             self.pra.save()
+            ChangeLog.record(self.pra, ChangeLog.ACTION_UPDATED)
 
     ctx = {}
 
@@ -864,8 +881,8 @@ def pra_fix(req):
     return render(req, "main/pra_fix.html", ctx)
 
 
-def clear_pra_session_variables(req):
-    """Clear PRA flow related session variables."""
+def clear_pra_wizard_state(req):
+    """Clear the state of the PRA flow."""
 
     for key in [
         "pra_staff_member_email",
@@ -877,5 +894,5 @@ def clear_pra_session_variables(req):
         "pra_mitigation_outcome",
         "pra_mitigation_measures",
     ]:
-        if key in req.session:
-            del req.session[key]
+        if key in req.wizard:
+            del req.wizard[key]
@@ -43,3 +43,14 @@ class GovUKTextArea(forms.Textarea):
         ctx.update({"form_instance": self.form_instance})
 
         return ctx
+
+
+class GovUKCheckboxSelectMultiple(forms.CheckboxSelectMultiple):
+    template_name = "govuk/forms/widgets/checkbox_select_multiple.html"
+
+    def get_context(self, name, value, attrs):
+        ctx = super().get_context(name, value, attrs)
+
+        ctx.update({"form_instance": self.form_instance})
+
+        return ctx
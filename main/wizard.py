@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.core import signing
+
+from .serializers import JSONSerializer
+
+COOKIE_NAME = "wizard"
+
+# where the state goes if it's too big for the cookie
+SESSION_KEY = "wizard"
+
+
+def _salt(user) -> str:
+    # so that one user's state can't be used by another
+    return f"main.wizard:{user.pk}"
+
+
+def sign(state: dict, user) -> str:
+    """state as a signed cookie value for user."""
+
+    return signing.dumps(state, salt=_salt(user), serializer=JSONSerializer, compress=True)
+
+
+class WizardState:
+    """The answers given so far in the booking and PRA flows.
+
+    They change on every step, so rather than in the session (a database write
+    per step) they are kept in a signed cookie. Only if that would be larger than
+    WIZARD_STATE_MAX_COOKIE_SIZE (e.g. a team booking for a lot of people) are
+    they kept in the session instead.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.modified = False
+        self._state = None
+
+    def _load(self) -> dict:
+        request = self.request
+        value = request.COOKIES.get(COOKIE_NAME)
+
+        if value:
+            try:
+                return signing.loads(
+                    value,
+                    salt=_salt(request.user),
+                    serializer=JSONSerializer,
+                    max_age=settings.SESSION_COOKIE_AGE,
+                )
+            except signing.BadSignature:
+                pass
+
+        return dict(request.session.get(SESSION_KEY, {}))
+
+    @property
+    def state(self) -> dict:
+        if self._state is None:
+            self._state = self._load()
+
+        return self._state
+
+    def __getitem__(self, key):
+        return self.state[key]
+
+    def __setitem__(self, key, value):
+        self.state[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.state[key]
+        self.modified = True
+
+    def __contains__(self, key) -> bool:
+        return key in self.state
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def update(self, values: dict) -> None:
+        self.state.update(values)
+        self.modified = True
+
+    def save(self, response) -> None:
+        request = self.request
+        state = self.state
+
+        value = sign(state, request.user) if state else ""
+
+        if value and len(value) <= settings.WIZARD_STATE_MAX_COOKIE_SIZE:
+            response.set_cookie(
+                COOKIE_NAME,
+                value,
+                max_age=(
+                    None
+                    if settings.SESSION_EXPIRE_AT_BROWSER_CLOSE
+                    else settings.SESSION_COOKIE_AGE
+                ),
+                path=settings.SESSION_COOKIE_PATH,
+                domain=settings.SESSION_COOKIE_DOMAIN,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+
+            if SESSION_KEY in request.session:
+                del request.session[SESSION_KEY]
+        else:
+            if COOKIE_NAME in request.COOKIES:
+                response.delete_cookie(
+                    COOKIE_NAME,
+                    path=settings.SESSION_COOKIE_PATH,
+                    domain=settings.SESSION_COOKIE_DOMAIN,
+                    samesite=settings.SESSION_COOKIE_SAMESITE,
+                )
+
+            if state:
+                request.session[SESSION_KEY] = state
+            elif SESSION_KEY in request.session:
+                del request.session[SESSION_KEY]
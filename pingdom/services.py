@@ -1,5 +1,6 @@
 from django.db import DatabaseError
 
+from main.circuit_breaker import get_all_breakers
 from main.models import Building
 
 
@@ -14,4 +15,16 @@ class CheckDatabase:
             return False, e
 
 
-services_to_check = (CheckDatabase,)
+class CheckCircuitBreakers:
+    """Reports the state of each circuit breaker (in the process that served the
+    request), without failing the check: an open breaker means a dependency is
+    down, not this app."""
+
+    name = "circuit breakers"
+    affects_status = False
+
+    def check(self):
+        return True, ", ".join(f"{b.name}: {b.state}" for b in get_all_breakers())
+
+
+services_to_check = (CheckDatabase, CheckCircuitBreakers)
@@ -1,6 +1,10 @@
+from unittest import mock
+
 from django.shortcuts import reverse
 from django.test import TestCase
 
+from main.circuit_breaker import CircuitBreaker
+
 
 class PingdomTest(TestCase):
     def test_ping_response(self):
@@ -10,3 +14,18 @@ class PingdomTest(TestCase):
         self.assertEqual(response.status_code, 200)
         assert "<status>OK</status>" in str(response.content)
         assert response.headers["content-type"] == "text/xml"
+
+    def test_reports_circuit_breakers(self):
+        notify = CircuitBreaker("notify", failure_threshold=1, reset_timeout=60)
+        staff_sso = CircuitBreaker("staff_sso", failure_threshold=1, reset_timeout=60)
+
+        with self.assertRaises(ConnectionError):
+            notify.call(mock.Mock(side_effect=ConnectionError))
+
+        with mock.patch("pingdom.services.get_all_breakers", return_value=[notify, staff_sso]):
+            response = self.client.get(reverse("pingdom"))
+
+        # an open breaker means a dependency is down, not this app
+        self.assertEqual(response.status_code, 200)
+        assert "<status>OK</status>" in str(response.content)
+        assert "<!--circuit breakers: notify: open, staff_sso: closed-->" in str(response.content)
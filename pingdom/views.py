@@ -16,19 +16,29 @@ COMMENT_TEMPLATE = "<!--{comment}-->\n"
 def pingdom(request):
     t = time.time()
     checked = {}
+    reported = {}
 
     for service in services_to_check:
-        checked[service.name] = service().check()
+        if getattr(service, "affects_status", True):
+            checked[service.name] = service().check()
+        else:
+            # only reported in a comment
+            reported[service.name] = service().check()[1]
 
     # pingdom can only accept 3 fractional digits
     t = "%.3f" % (time.time() - t,)
 
+    comments = "".join(
+        COMMENT_TEMPLATE.format(comment=f"{name}: {comment}") for name, comment in reported.items()
+    )
+
     if all(item[0] for item in checked.values()):
         return HttpResponse(
-            PINGDOM_TEMPLATE.format(status="OK", response_time=t), content_type="text/xml"
+            PINGDOM_TEMPLATE.format(status="OK", response_time=t) + comments,
+            content_type="text/xml",
         )
     else:
         body = PINGDOM_TEMPLATE.format(status="FALSE", response_time=t)
         for service_result in filter(lambda x: x[0] is False, checked.values()):
             body += COMMENT_TEMPLATE.format(comment=service_result[1])
-        return HttpResponse(body, status=500, content_type="text/xml")
+        return HttpResponse(body + comments, status=500, content_type="text/xml")